@@ -0,0 +1,152 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict
+
+# Questions processed at once; further requests wait in a bounded queue and
+# are turned away with 503 when it is full or they waited too long
+MAX_INFLIGHT = int(os.getenv("RAG_MAX_INFLIGHT", "16"))
+MAX_QUEUE = int(os.getenv("RAG_MAX_QUEUE", "64"))
+QUEUE_TIMEOUT = float(os.getenv("RAG_QUEUE_TIMEOUT", "30"))
+
+# Per-client token bucket: sustained requests per minute (0 disables it)
+# and how many may arrive back to back
+RATE_LIMIT = float(os.getenv("RAG_RATE_LIMIT", "0"))
+RATE_LIMIT_BURST = int(os.getenv("RAG_RATE_LIMIT_BURST", "10"))
+RATE_LIMIT_MAX_CLIENTS = 10000
+
+
+class Overloaded(Exception):
+    """The server is at capacity and the request was not admitted."""
+
+
+class Slot:
+    """
+    A processing slot taken by `AdmissionController.acquire`. `release()`
+    gives it back; calling it again is a no-op, so every exit path of a
+    request may release it.
+    """
+
+    def __init__(self, controller):
+        self._controller = controller
+
+    @property
+    def released(self):
+        return self._controller is None
+
+    def release(self):
+        controller, self._controller = self._controller, None
+        if controller is not None:
+            controller._release()
+
+
+class AdmissionController:
+    """
+    Bounds the number of questions processed concurrently.
+
+    Up to `max_inflight` requests run at once; up to `max_queue` more wait
+    for a slot, in arrival order, for at most `queue_timeout` seconds.
+    Anything beyond that raises `Overloaded` immediately, so load spikes are
+    shed quickly instead of piling up into timeouts for everyone.
+    """
+
+    def __init__(self, max_inflight=MAX_INFLIGHT, max_queue=MAX_QUEUE, queue_timeout=QUEUE_TIMEOUT):
+        self.max_inflight = max_inflight
+        self.max_queue = max_queue
+        self.queue_timeout = queue_timeout
+        self.inflight = 0
+        self.queued = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._semaphore = asyncio.Semaphore(max_inflight)
+
+    async def acquire(self):
+        """
+        Wait for a processing slot and return it as a `Slot`; raises
+        `Overloaded` if none can be had.
+        """
+        # Checked and counted before the first await, so requests arriving
+        # in the same event loop tick see each other
+        if self.inflight + self.queued >= self.max_inflight + self.max_queue:
+            self.rejected += 1
+            raise Overloaded("Server is at capacity, try again shortly")
+
+        self.queued += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.queue_timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise Overloaded("Timed out waiting for a free slot, try again shortly")
+        finally:
+            self.queued -= 1
+
+        self.inflight += 1
+        return Slot(self)
+
+    def _release(self):
+        self.inflight -= 1
+        self._semaphore.release()
+
+    def info(self):
+        """Current load, limits and rejection counters."""
+        return {
+            "inflight": self.inflight,
+            "queued": self.queued,
+            "max_inflight": self.max_inflight,
+            "max_queue": self.max_queue,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+    def render(self):
+        """Current load as Prometheus gauges."""
+        return (
+            "# TYPE rag_inflight_requests gauge\n"
+            f"rag_inflight_requests {self.inflight}\n"
+            "# TYPE rag_queued_requests gauge\n"
+            f"rag_queued_requests {self.queued}\n"
+        )
+
+
+class RateLimiter:
+    """
+    Token bucket per client: `rate` requests per minute on average, with
+    bursts of up to `burst`. Only the most recently seen `max_clients`
+    clients are tracked. Not thread-safe; use it from the event loop.
+    """
+
+    def __init__(self, rate=RATE_LIMIT, burst=RATE_LIMIT_BURST, max_clients=RATE_LIMIT_MAX_CLIENTS):
+        self.rate = rate / 60.0
+        self.burst = max(1, burst)
+        self.max_clients = max_clients
+        self.limited = 0
+        self._buckets = OrderedDict()
+
+    @property
+    def enabled(self):
+        return self.rate > 0
+
+    def check(self, client):
+        """
+        Take one request from `client`'s bucket. Returns 0 if it is allowed,
+        otherwise the seconds until the client may retry.
+        """
+        if not self.enabled:
+            return 0.0
+
+        now = time.monotonic()
+        tokens, updated = self._buckets.pop(client, (self.burst, now))
+        tokens = min(self.burst, tokens + (now - updated) * self.rate)
+
+        if tokens >= 1:
+            tokens -= 1
+            wait = 0.0
+        else:
+            wait = (1 - tokens) / self.rate
+            self.limited += 1
+
+        self._buckets[client] = (tokens, now)
+        while len(self._buckets) > self.max_clients:
+            self._buckets.popitem(last=False)
+
+        return wait
@@ -0,0 +1,331 @@
+#!/usr/bin/env python3
+"""
+Load test of `/api/chat`: throughput and tail latency at increasing concurrency.
+
+By default the API runs in-process on a local port with the real pipeline
+over a temporary copy of the corpus, where only the embedding and LLM calls
+are simulated (awaited sleeps, no OpenAI access needed): retrieval, BM25,
+reranking, context assembly, the caches and admission control all do their
+real work, so the numbers show what the server adds on top of the model
+latency. Repeated questions hit the answer cache as they would in
+production; `--answer-cache-size 0` disables it. With `--url` it drives an
+already running server instead, e.g. one whose OPENAI_BASE_URL points at a
+stub.
+
+Each concurrency level sends `--requests` questions from
+rag/data/retrieval_benchmark.jsonl with that many clients in parallel and
+reports successful requests per second, latency percentiles and how many
+requests were turned away (429 rate limited, 503 over capacity).
+"""
+
+import argparse
+import asyncio
+import json
+import math
+import os
+import random
+import socket
+import sys
+import tempfile
+import threading
+import time
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+QUESTIONS_PATH = os.path.join(BASE_DIR, "rag", "data", "retrieval_benchmark.jsonl")
+
+sys.path.append(BASE_DIR)
+
+
+class SimulatedEmbeddings:
+    """
+    Embedding model with simulated API latency: deterministic hashing
+    embeddings (see rag/benchmark_retrieval.py) returned after an awaited
+    sleep of `embedding_ms` (network I/O; a blocking one for sync calls).
+    """
+
+    backend = "load-test"
+    model = "hashing"
+
+    def __init__(self, embedding_ms=40, jitter=0.3, seed=0):
+        from benchmark_retrieval import HashingEmbeddings
+
+        self.hashing = HashingEmbeddings()
+        self.embedding_ms = embedding_ms
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        return self.embedding_ms / 1000 * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    def embed_documents(self, texts):
+        time.sleep(self._delay())
+        return self.hashing.embed_documents(texts)
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        await asyncio.sleep(self._delay())
+        return self.hashing.embed_documents(texts)
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+class SimulatedChatModel:
+    """
+    Chat model with simulated LLM latency: a short fixed answer after an
+    awaited sleep of `llm_ms`, streamed as ten tokens spread over that time.
+    """
+
+    def __init__(self, llm_ms=800, jitter=0.3, seed=0):
+        self.llm_ms = llm_ms
+        self.jitter = jitter
+        self._random = random.Random(seed)
+
+    def _delay(self):
+        return self.llm_ms / 1000 * self._random.uniform(1 - self.jitter, 1 + self.jitter)
+
+    @staticmethod
+    def _answer(messages):
+        return f"Simulated answer from a {sum(len(m.content) for m in messages)}-character prompt"
+
+    def invoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        time.sleep(self._delay())
+        return AIMessage(content=self._answer(messages))
+
+    async def ainvoke(self, messages):
+        from langchain_core.messages import AIMessage
+
+        await asyncio.sleep(self._delay())
+        return AIMessage(content=self._answer(messages))
+
+    async def astream(self, messages):
+        from langchain_core.messages import AIMessageChunk
+
+        words = self._answer(messages).split()
+        delay = self._delay() / len(words)
+        for word in words:
+            await asyncio.sleep(delay)
+            yield AIMessageChunk(content=word + " ")
+
+
+def build_corpus(workdir, embeddings):
+    """
+    Index the chunks of the ingested database (or of the PDF, when nothing
+    is ingested) under `workdir` with the hashing embeddings: a persistent
+    Chroma collection, the article index, the BM25 index and the chunk
+    embedding matrix, as the ingestion pipeline writes them. Returns a
+    one-corpus registry for `CorpusPool`.
+    """
+    from langchain_chroma import Chroma
+
+    from article_index import ArticleIndex, article_index_path
+    from benchmark_retrieval import load_chunks
+    from bm25_index import BM25Index, bm25_index_path
+    from corpora import Corpus
+    from embedding_backends import EMBEDDING_MODEL_KEY, embedding_model_tag
+    from embedding_matrix import EmbeddingMatrix, embedding_matrix_path
+    from rag.retrieval_pipeline import DEFAULT_TITLE, persistent_directory
+
+    chunks = load_chunks(persistent_directory)
+    persist_directory = os.path.join(workdir, "chroma_db")
+
+    # Tagged with the configured model, which the pipeline checks the collection against
+    vectorstore = Chroma(
+        persist_directory=persist_directory,
+        embedding_function=embeddings.hashing,
+        collection_metadata={"hnsw:space": "cosine", EMBEDDING_MODEL_KEY: embedding_model_tag()},
+    )
+
+    ids = [chunk["metadata"]["chunk_id"] for chunk in chunks]
+    vectors = embeddings.hashing.embed_documents([chunk["content"] for chunk in chunks])
+    for start in range(0, len(chunks), 1000):
+        batch = chunks[start : start + 1000]
+        vectorstore._collection.upsert(
+            ids=ids[start : start + 1000],
+            embeddings=vectors[start : start + 1000],
+            documents=[chunk["content"] for chunk in batch],
+            metadatas=[chunk["metadata"] for chunk in batch],
+        )
+
+    ArticleIndex(chunks).save(article_index_path(persist_directory))
+    BM25Index(chunks).save(bm25_index_path(persist_directory))
+    EmbeddingMatrix.from_vectors(ids, vectors).save(embedding_matrix_path(persist_directory))
+
+    corpus = Corpus("load-test", DEFAULT_TITLE, "Constitution_English.pdf", persist_directory=persist_directory)
+    return {corpus.name: corpus}
+
+
+def create_corpus_pool(workdir, embedding_ms=40, llm_ms=800):
+    """
+    The server's real `CorpusPool` over a corpus built by `build_corpus`,
+    with only the embedding and LLM calls simulated: they are injected
+    through `SharedClients`, so retrieval, BM25, reranking, context assembly
+    and the embedding and answer caches all run as in production.
+    """
+    from embedding_cache import CachedEmbeddings, embedding_cache_path
+    from rag.retrieval_pipeline import CorpusPool, SharedClients
+
+    embeddings = SimulatedEmbeddings(embedding_ms)
+    corpora = build_corpus(workdir, embeddings)
+    persist_directory = corpora["load-test"].persist_directory
+
+    shared = SharedClients(
+        persist_directory,
+        chat_model=SimulatedChatModel(llm_ms),
+        embeddings=CachedEmbeddings(embeddings, embedding_cache_path(persist_directory)),
+    )
+    return CorpusPool(corpora, default="load-test", shared=shared)
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def start_stub_server(workdir, stub_options):
+    """
+    Serve the API with the pipeline of `create_corpus_pool` on a free local
+    port; returns `(base_url, server)`.
+    """
+    import uvicorn
+
+    from api import main
+
+    main.CorpusPool = lambda: create_corpus_pool(workdir, **stub_options)
+
+    port = free_port()
+    server = uvicorn.Server(
+        uvicorn.Config(main.app, host="127.0.0.1", port=port, log_level="warning", backlog=4096)
+    )
+    threading.Thread(target=server.run, daemon=True).start()
+
+    while not server.started:
+        time.sleep(0.05)
+
+    return f"http://127.0.0.1:{port}", server
+
+
+def load_questions(path=QUESTIONS_PATH):
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line)["question"] for line in f if line.strip()]
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+async def run_level(base_url, questions, concurrency, requests, timeout):
+    """Send `requests` questions from `concurrency` parallel clients and summarize the results."""
+    import httpx
+
+    results = []
+    next_request = iter(range(requests))
+
+    async def worker(client):
+        for i in next_request:
+            payload = {"question": questions[i % len(questions)]}
+            started = time.perf_counter()
+            try:
+                response = await client.post("/api/chat", json=payload)
+                status = response.status_code
+            except httpx.HTTPError:
+                status = "error"
+            results.append((status, time.perf_counter() - started))
+
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=timeout, limits=limits) as client:
+        started = time.perf_counter()
+        await asyncio.gather(*(worker(client) for _ in range(concurrency)))
+        elapsed = time.perf_counter() - started
+
+    latencies = [seconds for status, seconds in results if status == 200]
+    return {
+        "concurrency": concurrency,
+        "requests": len(results),
+        "ok": len(latencies),
+        "rate_limited": sum(status == 429 for status, _ in results),
+        "overloaded": sum(status == 503 for status, _ in results),
+        "errors": sum(status not in (200, 429, 503) for status, _ in results),
+        "throughput": len(latencies) / elapsed if elapsed else 0.0,
+        "latency_ms": {q: percentile(latencies, q) * 1000 for q in (50, 95, 99)} if latencies else None,
+    }
+
+
+def print_report(levels):
+    print(f"{'clients':>8}{'ok':>7}{'429':>6}{'503':>6}{'err':>6}{'ok/s':>9}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for level in levels:
+        latency = level["latency_ms"] or {50: float("nan"), 95: float("nan"), 99: float("nan")}
+        print(
+            f"{level['concurrency']:>8}{level['ok']:>7}{level['rate_limited']:>6}{level['overloaded']:>6}"
+            f"{level['errors']:>6}{level['throughput']:>9.1f}"
+            f"{latency[50]:>10.0f}{latency[95]:>10.0f}{latency[99]:>10.0f}"
+        )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Load test /api/chat at increasing concurrency")
+    parser.add_argument("--url", help="Drive a running server instead of the in-process stubbed one")
+    parser.add_argument("--concurrency", default="1,4,16,64,256", help="Comma-separated client counts")
+    parser.add_argument("--requests", type=int, default=200, help="Requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=120, help="Client timeout per request in seconds")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="Questions to send (JSONL with a `question` field)")
+    parser.add_argument("--json", dest="json_path", help="Also write the results as JSON to this path")
+
+    stub = parser.add_argument_group("stubbed server")
+    stub.add_argument("--embedding-ms", type=float, default=40, help="Simulated embedding latency")
+    stub.add_argument("--llm-ms", type=float, default=800, help="Simulated LLM latency")
+    stub.add_argument("--max-inflight", type=int, help="RAG_MAX_INFLIGHT for the stubbed server")
+    stub.add_argument("--max-queue", type=int, help="RAG_MAX_QUEUE for the stubbed server")
+    stub.add_argument("--queue-timeout", type=float, help="RAG_QUEUE_TIMEOUT for the stubbed server")
+    stub.add_argument("--rate-limit", type=float, help="RAG_RATE_LIMIT for the stubbed server")
+    stub.add_argument("--answer-cache-size", type=int, help="RAG_ANSWER_CACHE_SIZE for the stubbed server (0 disables it)")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+    concurrency_levels = [int(value) for value in args.concurrency.split(",")]
+
+    server = None
+    base_url = args.url
+    if base_url is None:
+        # Read by api.admission when the server is imported and by the pipeline
+        for name, value in (
+            ("RAG_MAX_INFLIGHT", args.max_inflight),
+            ("RAG_MAX_QUEUE", args.max_queue),
+            ("RAG_QUEUE_TIMEOUT", args.queue_timeout),
+            ("RAG_RATE_LIMIT", args.rate_limit),
+            ("RAG_ANSWER_CACHE_SIZE", args.answer_cache_size),
+        ):
+            if value is not None:
+                os.environ[name] = str(value)
+
+        workdir = tempfile.TemporaryDirectory()
+        base_url, server = start_stub_server(
+            workdir.name, {"embedding_ms": args.embedding_ms, "llm_ms": args.llm_ms}
+        )
+        print(f"Stubbed server at {base_url}")
+
+    try:
+        levels = []
+        for concurrency in concurrency_levels:
+            levels.append(asyncio.run(run_level(base_url, questions, concurrency, args.requests, args.timeout)))
+    finally:
+        if server is not None:
+            server.should_exit = True
+            workdir.cleanup()
+
+    print_report(levels)
+
+    if args.json_path:
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(levels, f, indent=2)
+
+
+if __name__ == "__main__":
+    main()
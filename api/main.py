@@ -1,6 +1,12 @@
-from fastapi import FastAPI, HTTPException
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import PlainTextResponse, StreamingResponse
 from pydantic import BaseModel
+from typing import Any, Dict, List, Optional
+import asyncio
+import json
+import math
 import sys
 import os
 from dotenv import load_dotenv
@@ -11,12 +17,45 @@ load_dotenv()
 # Add parent directory to path to import rag module
 sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from rag.retrieval_pipeline import retrieve_and_answer
+# Trace comes from the pipeline's own `timings` module, so its spans are
+# picked up by the pipeline; likewise UnknownCorpus from its `corpora`
+# module (importable once the pipeline has put rag/ on the path)
+from rag.retrieval_pipeline import CorpusPool, Trace
+from corpora import UnknownCorpus
+from api.admission import AdmissionController, Overloaded, RateLimiter
+
+# Most questions accepted by one /api/chat/batch request
+MAX_BATCH_SIZE = int(os.getenv("RAG_MAX_BATCH_SIZE", "500"))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Create the corpus pool once, so its pooled keep-alive clients are reused
+    by every request and every corpus, and warm up the default corpus
+    (clients, vector store, indexes and embeddings for the fixed query
+    expansions) before serving. Other corpora are loaded on first use.
+    
+    Questions go through admission control (a bounded number in flight,
+    a bounded wait queue) and an optional per-client rate limit.
+    """
+    corpora = CorpusPool()
+    app.state.corpora = corpora
+    app.state.admission = AdmissionController()
+    app.state.rate_limiter = RateLimiter()
+    try:
+        await asyncio.to_thread(corpora.warm_up)
+    except Exception as e:
+        print(f"Warning: could not warm up the RAG pipeline: {e}")
+    yield
+    await corpora.aclose()
+
 
 app = FastAPI(
     title="Constitution GPT API",
     description="AI-Powered Constitutional Intelligence API for Nepal's Constitution",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan,
 )
 
 # Configure CORS to allow requests from Next.js frontend
@@ -34,6 +73,9 @@ app.add_middleware(
 
 class QueryRequest(BaseModel):
     question: str
+    corpus: Optional[str] = None
+    raw: bool = False
+    timings: bool = False
     
     class Config:
         json_schema_extra = {
@@ -43,9 +85,27 @@ class QueryRequest(BaseModel):
         }
 
 
+class BatchQueryRequest(BaseModel):
+    questions: List[str]
+    corpus: Optional[str] = None
+    raw: bool = False
+    timings: bool = False
+    
+    class Config:
+        json_schema_extra = {
+            "example": {
+                "questions": [
+                    "How is the Prime Minister elected in Nepal?",
+                    "What are the duties of citizens?",
+                ]
+            }
+        }
+
+
 class QueryResponse(BaseModel):
     question: str
     answer: str
+    timings: Optional[Dict[str, Any]] = None
     
     class Config:
         json_schema_extra = {
@@ -66,6 +126,11 @@ async def root():
             "/": "API information",
             "/health": "Health check",
             "/api/chat": "Query the Constitution (POST)",
+            "/api/chat/stream": "Query the Constitution with a streamed answer (POST, Server-Sent Events)",
+            "/api/chat/batch": "Answer many questions, streamed back as JSON lines (POST)",
+            "/api/corpora": "Documents that can be queried, and which are loaded",
+            "/api/cache/stats": "Answer cache size and hit/miss counters",
+            "/metrics": "Per-stage latency histograms and counters (Prometheus format)",
             "/docs": "Interactive API documentation",
         }
     }
@@ -80,32 +145,222 @@ async def health_check():
     }
 
 
+@app.get("/api/corpora")
+async def list_corpora(http_request: Request):
+    """The corpora that can be queried, the default one, and which are loaded in memory."""
+    return http_request.app.state.corpora.info()
+
+
+def get_pipeline(http_request, corpus):
+    """The pipeline of `corpus` (the default one if None); 404 if there is no such corpus."""
+    try:
+        return http_request.app.state.corpora.get(corpus)
+    except UnknownCorpus as e:
+        raise HTTPException(status_code=404, detail=str(e))
+
+
+@app.get("/api/cache/stats")
+async def cache_stats(http_request: Request, corpus: Optional[str] = None):
+    """Answer cache size and hit/miss counters of a corpus (default: the default corpus)."""
+    return get_pipeline(http_request, corpus).answer_cache.info()
+
+
+@app.get("/metrics", response_class=PlainTextResponse)
+async def metrics(http_request: Request):
+    """Per-stage latency histograms, token counts and retrieval calls in the Prometheus text format."""
+    state = http_request.app.state
+    return PlainTextResponse(
+        state.corpora.metrics.render() + state.admission.render(),
+        media_type="text/plain; version=0.0.4",
+    )
+
+
+def client_id(http_request):
+    """The key a client is rate limited by: its address."""
+    return http_request.client.host if http_request.client else "unknown"
+
+
+async def admit(http_request, endpoint):
+    """
+    Apply the client's rate limit (429) and wait for a processing slot
+    (503 when the server is at capacity). Returns the `Slot`, which the
+    caller must release.
+    """
+    state = http_request.app.state
+
+    retry_after = state.rate_limiter.check(client_id(http_request))
+    if retry_after:
+        state.corpora.metrics.observe(Trace(), endpoint, "rate_limited")
+        raise HTTPException(
+            status_code=429,
+            detail="Rate limit exceeded",
+            headers={"Retry-After": str(math.ceil(retry_after))},
+        )
+
+    try:
+        return await state.admission.acquire()
+    except Overloaded as e:
+        state.corpora.metrics.observe(Trace(), endpoint, "overloaded")
+        raise HTTPException(status_code=503, detail=str(e), headers={"Retry-After": "1"})
+
+
 @app.post("/api/chat", response_model=QueryResponse)
-async def chat(request: QueryRequest):
+async def chat(request: QueryRequest, http_request: Request):
     """
     Query the Constitution of Nepal using RAG.
     
     - **question**: Your question about the Constitution of Nepal
+    - **corpus**: Document to answer from (see `/api/corpora`; default: the default corpus)
+    - **raw**: Return the retrieved constitutional text without generating an answer
+    - **timings**: Include per-stage timings, token counts and retrieval calls
     
     Returns a structured answer with proper citations and hierarchical structure.
+    Explicit references like "Article 48" or "Part 3" are looked up directly.
+    Responds 404 for an unknown corpus, 429 when the client's rate limit is exceeded and 503 when the
+    server is at capacity.
     """
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    rag = get_pipeline(http_request, request.corpus)
+    slot = await admit(http_request, "chat")
+    trace = Trace()
+
     try:
-        if not request.question or not request.question.strip():
-            raise HTTPException(status_code=400, detail="Question cannot be empty")
-        
-        # Call the RAG pipeline (verbose=False to avoid console output)
-        answer = retrieve_and_answer(request.question, verbose=False)
+        # Await the async RAG pipeline so the event loop stays free for other requests
+        answer = await rag.aretrieve_and_answer(
+            request.question, verbose=False, raw=request.raw, trace=trace
+        )
+        rag.metrics.observe(trace, "chat")
         
         return QueryResponse(
             question=request.question,
-            answer=answer
+            answer=answer,
+            timings=trace.as_dict() if request.timings else None,
         )
     
     except Exception as e:
+        rag.metrics.observe(trace, "chat", "error")
         raise HTTPException(
             status_code=500,
             detail=f"Error processing query: {str(e)}"
         )
+    
+    finally:
+        slot.release()
+
+
+class SlotStreamingResponse(StreamingResponse):
+    """
+    A `StreamingResponse` that releases an admission slot once the response
+    is over, however it ends: completed, failed, or the client disconnected
+    before or during the stream (when the body generator may never run).
+    """
+
+    def __init__(self, content, slot, **kwargs):
+        super().__init__(content, **kwargs)
+        self.slot = slot
+
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            self.slot.release()
+
+
+def format_sse(event, data):
+    """Format a single Server-Sent Events message with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+@app.post("/api/chat/stream")
+async def chat_stream(request: QueryRequest, http_request: Request):
+    """
+    Query the Constitution of Nepal and stream the answer as Server-Sent Events.
+    
+    - **question**: Your question about the Constitution of Nepal
+    - **corpus**: Document to answer from (default: the default corpus)
+    - **timings**: Include per-stage timings in the `done` event
+    
+    Events, in order:
+    - `context`: the retrieved Part/Article/Sub-article hierarchy
+    - `token`: a piece of the answer, sent as it is generated
+    - `done`: the answer is complete
+    - `error`: processing failed (replaces `done`)
+    
+    Responds 404/429/503 like `/api/chat` before the stream starts; the
+    processing slot is held until the answer is complete.
+    """
+    if not request.question or not request.question.strip():
+        raise HTTPException(status_code=400, detail="Question cannot be empty")
+
+    rag = get_pipeline(http_request, request.corpus)
+    slot = await admit(http_request, "chat_stream")
+    trace = Trace()
+
+    async def event_stream():
+        try:
+            async for event, data in rag.astream_answer(request.question, trace=trace):
+                if event == "context":
+                    yield format_sse("context", {"hierarchy": data})
+                else:
+                    yield format_sse(event, {"content": data})
+            rag.metrics.observe(trace, "chat_stream")
+            yield format_sse("done", {"timings": trace.as_dict()} if request.timings else {})
+        except Exception as e:
+            rag.metrics.observe(trace, "chat_stream", "error")
+            yield format_sse("error", {"detail": f"Error processing query: {str(e)}"})
+        finally:
+            slot.release()
+
+    return SlotStreamingResponse(
+        event_stream(),
+        slot,
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.post("/api/chat/batch")
+async def chat_batch(request: BatchQueryRequest, http_request: Request):
+    """
+    Answer many questions, streaming one JSON line per question as it completes.
+    
+    - **questions**: Up to RAG_MAX_BATCH_SIZE questions about the Constitution of Nepal
+    - **corpus**: Document to answer every question from (default: the default corpus)
+    - **raw**: Return the retrieved constitutional text without generating answers
+    - **timings**: End with a line of timings for the whole batch
+    
+    Each line is `{"index", "question", "answer"}`, or `{"index", "question",
+    "error"}` if that question failed; `index` is the question's position in
+    the request. Retrieval is shared across the batch and LLM generations run
+    with bounded concurrency. The batch holds one processing slot.
+    """
+    if not request.questions:
+        raise HTTPException(status_code=400, detail="Questions cannot be empty")
+    if len(request.questions) > MAX_BATCH_SIZE:
+        raise HTTPException(status_code=400, detail=f"At most {MAX_BATCH_SIZE} questions per batch")
+    for index, question in enumerate(request.questions):
+        if not question or not question.strip():
+            raise HTTPException(status_code=400, detail=f"Question {index} cannot be empty")
+
+    rag = get_pipeline(http_request, request.corpus)
+    slot = await admit(http_request, "chat_batch")
+    trace = Trace()
+
+    async def lines():
+        errors = 0
+        try:
+            async for result in rag.abatch_answer(request.questions, raw=request.raw, trace=trace):
+                errors += "error" in result
+                yield json.dumps(result, ensure_ascii=False) + "\n"
+            rag.metrics.observe(trace, "chat_batch", "error" if errors else "ok")
+            if request.timings:
+                yield json.dumps({"timings": trace.as_dict()}, ensure_ascii=False) + "\n"
+        finally:
+            slot.release()
+
+    return SlotStreamingResponse(lines(), slot, media_type="application/x-ndjson")
 
 
 if __name__ == "__main__":
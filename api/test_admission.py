@@ -0,0 +1,54 @@
+import asyncio
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from api.admission import AdmissionController, Overloaded  # noqa: E402
+
+
+async def _burst(controller, requests):
+    async def request():
+        try:
+            slot = await controller.acquire()
+        except Overloaded:
+            return False
+        await asyncio.sleep(0.01)
+        slot.release()
+        return True
+
+    return await asyncio.gather(*(request() for _ in range(requests)))
+
+
+def test_burst_beyond_capacity_is_shed():
+    controller = AdmissionController(max_inflight=2, max_queue=1, queue_timeout=5)
+
+    admitted = asyncio.run(_burst(controller, 10))
+
+    assert sum(admitted) == 3
+    assert controller.rejected == 7
+    assert controller.inflight == 0 and controller.queued == 0
+
+
+def test_queued_requests_run_once_a_slot_is_free():
+    controller = AdmissionController(max_inflight=1, max_queue=4, queue_timeout=5)
+
+    admitted = asyncio.run(_burst(controller, 5))
+
+    assert all(admitted)
+    assert controller.rejected == 0
+
+
+def test_release_is_idempotent():
+    async def run():
+        controller = AdmissionController(max_inflight=1, max_queue=0, queue_timeout=0.05)
+        slot = await controller.acquire()
+        slot.release()
+        slot.release()
+        second = await controller.acquire()
+        return controller, second
+
+    controller, slot = asyncio.run(run())
+    assert controller.inflight == 1
+    slot.release()
+    assert controller.inflight == 0
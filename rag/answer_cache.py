@@ -0,0 +1,147 @@
+import re
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+from citations import format_citation, parse_citations
+
+
+def normalize_question(question):
+    """
+    Normalize a question for exact cache lookups (case, punctuation, spacing).
+
+    Punctuation is dropped, so the Part/Article citations parsed from the
+    original question are appended: "Articles 16-18" and "Articles 16, 18"
+    differ only in punctuation but cite different articles.
+    """
+    text = " ".join(re.sub(r"[^\w\s()]", " ", question.lower()).split())
+    citations = parse_citations(question)
+    if not citations:
+        return text
+
+    return f"{text} | " + "; ".join(format_citation(c) for c in citations)
+
+
+class AnswerCache:
+    """
+    Two-tier cache of generated answers:
+    - Exact: keyed on the normalized question
+    - Semantic: nearest cached question embedding above a cosine threshold
+
+    Entries expire after `ttl` seconds and the least recently used entry is
+    evicted once `max_entries` is reached. Every entry belongs to a corpus
+    fingerprint; when the fingerprint changes (re-ingestion) the whole cache
+    is dropped.
+    """
+
+    def __init__(self, max_entries=256, ttl=24 * 60 * 60, similarity_threshold=0.95):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+
+        self.fingerprint = None
+        self.stats = {"exact_hits": 0, "semantic_hits": 0, "misses": 0, "evictions": 0}
+
+        # normalized question -> (answer, embedding or None, expiry time)
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _check_fingerprint(self, fingerprint):
+        if fingerprint != self.fingerprint:
+            self._entries.clear()
+            self.fingerprint = fingerprint
+
+    def _purge_expired(self, now):
+        expired = [key for key, (_, _, expires) in self._entries.items() if expires <= now]
+        for key in expired:
+            del self._entries[key]
+
+    def get(self, question, fingerprint):
+        """
+        Exact tier: return the cached answer for the normalized question, or
+        None, which counts as a miss.
+        """
+        key = normalize_question(question)
+
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._purge_expired(time.monotonic())
+
+            if key not in self._entries:
+                self.stats["misses"] += 1
+                return None
+
+            self._entries.move_to_end(key)
+            self.stats["exact_hits"] += 1
+            return self._entries[key][0]
+
+    def get_similar(self, fingerprint, embedding):
+        """
+        Semantic tier: return the answer of the most similar cached question
+        above the similarity threshold, or None.
+
+        Meant to be called after `get` missed, which already counted the
+        miss; a hit here turns it into a semantic hit.
+        """
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+            self._purge_expired(time.monotonic())
+
+            match = self._nearest(embedding)
+            if match is None:
+                return None
+
+            self._entries.move_to_end(match)
+            self.stats["misses"] = max(0, self.stats["misses"] - 1)
+            self.stats["semantic_hits"] += 1
+            return self._entries[match][0]
+
+    def _nearest(self, embedding):
+        """Return the key of the most similar cached question above the threshold."""
+        keys = [key for key, (_, vector, _) in self._entries.items() if vector is not None]
+        if not keys:
+            return None
+
+        matrix = np.stack([self._entries[key][1] for key in keys])
+        query = _unit(embedding)
+        similarities = matrix @ query
+
+        best = int(np.argmax(similarities))
+        if similarities[best] >= self.similarity_threshold:
+            return keys[best]
+        return None
+
+    def put(self, question, answer, fingerprint, embedding=None):
+        """Store an answer, evicting the least recently used entry if full."""
+        key = normalize_question(question)
+        vector = _unit(embedding) if embedding is not None else None
+
+        with self._lock:
+            self._check_fingerprint(fingerprint)
+
+            self._entries[key] = (answer, vector, time.monotonic() + self.ttl)
+            self._entries.move_to_end(key)
+
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.stats["evictions"] += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def info(self):
+        """Return the cache size and hit/miss counters."""
+        with self._lock:
+            return {"entries": len(self._entries), **self.stats}
+
+
+def _unit(embedding):
+    vector = np.asarray(embedding, dtype=np.float32)
+    norm = np.linalg.norm(vector)
+    return vector / norm if norm else vector
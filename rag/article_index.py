@@ -0,0 +1,129 @@
+import hashlib
+import json
+import os
+from collections import defaultdict
+
+from prompts import chunk_block
+
+ARTICLE_INDEX_FILENAME = "article_index.json"
+
+
+def article_index_path(persist_directory):
+    """Return the path of the article index stored next to the Chroma directory."""
+    parent = os.path.dirname(os.path.normpath(persist_directory))
+    return os.path.join(parent, ARTICLE_INDEX_FILENAME)
+
+
+class ArticleIndex:
+    """
+    In-memory lookup of chunks by their constitutional hierarchy:
+    - Article → all chunks of that article, in document order
+    - Part → articles in that part, in document order
+    - Article → hierarchy references ("Part 7 → Article 76 → Sub-article (1)")
+    - Chunk ID → position in document order
+    - Chunk ID → formatted context block, rendered once at ingestion and
+      stored with the index, so prompts are built by concatenation
+    """
+
+    def __init__(self, chunks):
+        self.chunks = [
+            {
+                "content": chunk["content"],
+                "metadata": dict(chunk["metadata"] or {}),
+                "block": chunk.get("block") or chunk_block(chunk),
+            }
+            for chunk in chunks
+        ]
+
+        self._fingerprint = None
+        self._chunks_by_article = defaultdict(list)
+        self._articles_by_part = defaultdict(list)
+        self._positions = {}
+
+        for position, chunk in enumerate(self.chunks):
+            metadata = chunk["metadata"]
+            if "chunk_id" in metadata:
+                self._positions[metadata["chunk_id"]] = position
+
+            article = metadata.get("article")
+            if not article:
+                continue
+
+            self._chunks_by_article[article].append(chunk)
+
+            part = metadata.get("part")
+            if part and article not in self._articles_by_part[part]:
+                self._articles_by_part[part].append(article)
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def __contains__(self, article):
+        return article in self._chunks_by_article
+
+    @property
+    def fingerprint(self):
+        """Hash of every chunk's content and metadata, identifying this version of the corpus."""
+        if self._fingerprint is None:
+            digest = hashlib.sha256()
+            for chunk in self.chunks:
+                digest.update(chunk["content"].encode("utf-8"))
+                digest.update(json.dumps(chunk["metadata"], sort_keys=True).encode("utf-8"))
+            self._fingerprint = digest.hexdigest()
+        return self._fingerprint
+
+    @classmethod
+    def from_collection(cls, vectorstore):
+        """Build the index with a single full read of a Chroma vector store."""
+        data = vectorstore.get(include=["documents", "metadatas"])
+        chunks = [
+            {"content": content, "metadata": metadata or {}}
+            for content, metadata in zip(data["documents"], data["metadatas"])
+        ]
+        return cls(chunks)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index previously written with `save`."""
+        with open(path, encoding="utf-8") as f:
+            return cls(json.load(f))
+
+    def save(self, path):
+        """
+        Persist the index as JSON so it can be loaded without touching Chroma.
+        Written to a temporary file and moved into place, so a server
+        reloading the index never reads a partial file.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(self.chunks, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def position(self, chunk_id):
+        """Return the index of a chunk in document order, or None if unknown."""
+        return self._positions.get(chunk_id)
+
+    def block(self, chunk_id):
+        """Return the formatted context block of a chunk, or None if unknown."""
+        position = self._positions.get(chunk_id)
+        return None if position is None else self.chunks[position]["block"]
+
+    def chunks_for_article(self, article):
+        """Return every chunk of an article (e.g. "Article 76")."""
+        return self._chunks_by_article.get(article, [])
+
+    def articles_in_part(self, part):
+        """Return the articles of a part (e.g. "Part 7")."""
+        return self._articles_by_part.get(part, [])
+
+    def parts(self):
+        """Return all parts in document order."""
+        return list(self._articles_by_part)
+
+    def hierarchy(self, article):
+        """Return the hierarchy references of every chunk in an article."""
+        return [
+            chunk["metadata"]["hierarchy"]
+            for chunk in self.chunks_for_article(article)
+            if "hierarchy" in chunk["metadata"]
+        ]
@@ -0,0 +1,75 @@
+#!/usr/bin/env python3
+"""
+Benchmark the cold-start cost of importing the retrieval pipeline.
+
+Every measurement runs in a fresh interpreter, like a newly started API
+worker, and reports the median wall-clock time over several runs.
+"""
+
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+RAG_DIR = os.path.dirname(os.path.abspath(__file__))
+PERSIST_DIRECTORY = "./db/chroma_db"
+
+BENCHMARKS = [
+    ("python startup", "pass"),
+    ("import retrieval_pipeline", "import retrieval_pipeline"),
+    (
+        "import + LangChain/OpenAI/Chroma (eager import cost)",
+        "import retrieval_pipeline, langchain_openai, langchain_chroma, httpx, numpy",
+    ),
+    (
+        "import + warm_up (no embedding calls)",
+        "import retrieval_pipeline; retrieval_pipeline.ConstitutionRAG().warm_up(embeddings=False)",
+    ),
+]
+
+
+def time_snippet(code, runs):
+    """Return the median wall-clock seconds of running `code` in a fresh interpreter."""
+    script = f"import sys; sys.path.insert(0, {RAG_DIR!r}); {code}"
+    timings = []
+
+    for _ in range(runs):
+        started = time.perf_counter()
+        subprocess.run(
+            [sys.executable, "-W", "ignore", "-c", script],
+            check=True,
+            stdout=subprocess.DEVNULL,
+            stderr=subprocess.PIPE,
+        )
+        timings.append(time.perf_counter() - started)
+
+    return statistics.median(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark retrieval pipeline import time")
+    parser.add_argument("--runs", type=int, default=5, help="Runs per measurement (median is reported)")
+    args = parser.parse_args()
+
+    print(f"Cold start, median of {args.runs} runs:\n")
+
+    for name, code in BENCHMARKS:
+        # warm_up opens the vector store, which would create an empty one
+        if "warm_up" in code and not os.path.isdir(PERSIST_DIRECTORY):
+            print(f"{name:<55} skipped ({PERSIST_DIRECTORY} not found)")
+            continue
+
+        try:
+            seconds = time_snippet(code, args.runs)
+        except subprocess.CalledProcessError as e:
+            error = e.stderr.decode().strip().splitlines()[-1] if e.stderr else e
+            print(f"{name:<55} failed: {error}")
+            continue
+
+        print(f"{name:<55} {seconds * 1000:8.0f} ms")
+
+
+if __name__ == "__main__":
+    main()
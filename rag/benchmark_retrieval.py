@@ -0,0 +1,372 @@
+#!/usr/bin/env python3
+"""
+Offline benchmark of the retrieval stage: accuracy and speed.
+
+Runs the labelled questions in data/retrieval_benchmark.jsonl (question →
+expected Articles and Sub-articles) through `ConstitutionRAG.retrieve_documents`,
+without any LLM call, and reports:
+- recall@k and MRR of the expected Articles in the retrieved context
+- recall of the expected Sub-articles
+- per-stage latency percentiles (from the pipeline's timing spans) and QPS
+
+No network access is needed:
+- `--embeddings hashing` (default): a deterministic feature-hashing
+  embedding over an in-memory collection of the chunks
+- `--embeddings recorded`: the ingested database, with query vectors
+  replayed from the embedding cache (record them once with `--record`)
+
+`--vector-store both` runs the benchmark on Chroma and on the NumPy store,
+and reports how many of Chroma's approximate (HNSW) neighbours match the
+exact ones.
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from langchain_core.embeddings import Embeddings  # noqa: E402
+
+from article_index import ArticleIndex, article_index_path  # noqa: E402
+from bm25_index import BM25Index, bm25_index_path, tokenize  # noqa: E402
+from embedding_backends import EMBEDDING_MODEL, create_embeddings, embedding_model_tag  # noqa: E402
+from embedding_cache import CachedEmbeddings, embedding_cache_path  # noqa: E402
+from embedding_matrix import EmbeddingMatrix, embedding_matrix_path  # noqa: E402
+from retrieval_pipeline import ConstitutionRAG, expand_query, persistent_directory  # noqa: E402
+from timings import Trace  # noqa: E402
+
+BASE_DIR = os.path.dirname(os.path.abspath(__file__))
+QUESTIONS_PATH = os.path.join(BASE_DIR, "data", "retrieval_benchmark.jsonl")
+RECALL_AT = (1, 3, 5, 10)
+STAGES = (
+    "citation_lookup",
+    "expand_query",
+    "embedding",
+    "vector_search",
+    "bm25_search",
+    "article_completion",
+    "context_build",
+    "rerank",
+    "total",
+)
+
+
+class HashingEmbeddings(Embeddings):
+    """
+    Deterministic local embeddings: the BM25 terms of a text (stemmed,
+    citation-aware) hashed into a fixed-size, L2-normalized vector. Similar
+    texts share terms and so get similar vectors, without any model download.
+    """
+
+    def __init__(self, size=512):
+        self.size = size
+
+    def _embed(self, text):
+        vector = [0.0] * self.size
+        for term, frequency in Counter(tokenize(text)).items():
+            digest = hashlib.md5(term.encode("utf-8")).digest()
+            index = int.from_bytes(digest[:4], "little") % self.size
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[index] += sign * (1.0 + math.log(frequency))
+
+        norm = math.sqrt(sum(value * value for value in vector))
+        return [value / norm for value in vector] if norm else vector
+
+    def embed_documents(self, texts):
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text):
+        return self._embed(text)
+
+
+class RecordedEmbeddings(Embeddings):
+    """Stand-in for the configured embedding model that fails on any text missing from the cache."""
+
+    model = EMBEDDING_MODEL
+
+    def embed_documents(self, texts):
+        raise RuntimeError(
+            f"{len(texts)} text(s) have no recorded embedding, e.g. {texts[0]!r}; "
+            "run the benchmark once with --record"
+        )
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+def load_questions(path=QUESTIONS_PATH):
+    """Load the labelled questions: `question`, `articles` and optional `subarticles`."""
+    with open(path, encoding="utf-8") as f:
+        return [json.loads(line) for line in f if line.strip()]
+
+
+def load_chunks(persist_directory):
+    """Chunks from the ingested article index, or chunked from the PDF when there is none."""
+    index_path = article_index_path(persist_directory)
+    if os.path.exists(index_path):
+        return ArticleIndex.load(index_path).chunks
+
+    from ingestion_pipeline import assign_chunk_ids, iter_chunks, lazy_load_documents
+
+    return list(assign_chunk_ids(iter_chunks(lazy_load_documents())))
+
+
+def hashing_pipeline(chunks, workdir):
+    """A pipeline over an in-memory collection embedded with `HashingEmbeddings`."""
+    from langchain_chroma import Chroma
+
+    embeddings = HashingEmbeddings()
+    vectorstore = Chroma(
+        collection_name="retrieval_benchmark",
+        embedding_function=embeddings,
+        collection_metadata={"hnsw:space": "cosine"},
+    )
+    vectorstore.reset_collection()
+
+    ids = [chunk["metadata"]["chunk_id"] for chunk in chunks]
+    vectors = embeddings.embed_documents([chunk["content"] for chunk in chunks])
+    for start in range(0, len(chunks), 1000):
+        batch = chunks[start : start + 1000]
+        vectorstore._collection.upsert(
+            ids=ids[start : start + 1000],
+            embeddings=vectors[start : start + 1000],
+            documents=[chunk["content"] for chunk in batch],
+            metadatas=[chunk["metadata"] for chunk in batch],
+        )
+
+    # Indexes are loaded from disk, as they are after ingestion
+    persist_directory = os.path.join(workdir, "chroma_db")
+    ArticleIndex(chunks).save(article_index_path(persist_directory))
+    BM25Index(chunks).save(bm25_index_path(persist_directory))
+    EmbeddingMatrix.from_vectors(ids, vectors).save(embedding_matrix_path(persist_directory))
+
+    return ConstitutionRAG(
+        persist_directory=persist_directory,
+        embeddings=embeddings,
+        vectorstore=vectorstore,
+    )
+
+
+def recorded_pipeline(persist_directory, record=False):
+    """A pipeline over the ingested database, embedding queries from the cache only."""
+    model = RecordedEmbeddings()
+    if record:
+        model = create_embeddings()
+
+    embeddings = CachedEmbeddings(model, embedding_cache_path(persist_directory), model_name=embedding_model_tag())
+    return ConstitutionRAG(persist_directory=persist_directory, embeddings=embeddings)
+
+
+def with_vector_store(rag, vector_store):
+    """A pipeline over the same data and embeddings as `rag`, searching with another vector store."""
+    return ConstitutionRAG(
+        persist_directory=rag.persist_directory,
+        embeddings=rag.embeddings,
+        vectorstore=rag.db,
+        vector_store=vector_store,
+    )
+
+
+def ranked_articles(docs):
+    """The Articles of a retrieved context as "Part N → Article M", in rank order."""
+    articles = []
+    for doc in docs:
+        article = f"{doc.metadata.get('part')} → {doc.metadata.get('article')}"
+        if article not in articles:
+            articles.append(article)
+    return articles
+
+
+def covered_subarticles(docs):
+    """Every "Part N → Article M → Sub-article (K)" in a retrieved context."""
+    covered = set()
+    for doc in docs:
+        metadata = doc.metadata
+        for subarticle in metadata.get("subarticles") or [metadata.get("subarticle")]:
+            if subarticle:
+                covered.add(f"{metadata.get('part')} → {metadata.get('article')} → {subarticle}")
+    return covered
+
+
+def score_question(question, docs):
+    """Recall@k, reciprocal rank and sub-article recall of one question's context."""
+    expected = question["articles"]
+    articles = ranked_articles(docs)
+
+    ranks = [articles.index(article) + 1 for article in expected if article in articles]
+    result = {
+        "question": question["question"],
+        "recall": {k: sum(rank <= k for rank in ranks) / len(expected) for k in RECALL_AT},
+        "reciprocal_rank": 1.0 / min(ranks) if ranks else 0.0,
+        "missing": [article for article in expected if article not in articles],
+    }
+
+    if question.get("subarticles"):
+        covered = covered_subarticles(docs)
+        found = [subarticle for subarticle in question["subarticles"] if subarticle in covered]
+        result["subarticle_recall"] = len(found) / len(question["subarticles"])
+
+    return result
+
+
+def percentile(values, q):
+    """Nearest-rank percentile of a non-empty list."""
+    ordered = sorted(values)
+    return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+
+def run(rag, questions, repeat):
+    """
+    Answer every question once to warm up and score accuracy, then `repeat`
+    more times to measure latency. Returns `(scores, stage timings, qps,
+    variations)`, the last being the mean query variations per question
+    before and after near-duplicate removal.
+    """
+    scores = [score_question(question, rag.retrieve_documents(question["question"])) for question in questions]
+
+    timings = {stage: [] for stage in STAGES}
+    deduplicated = 0
+    started = time.perf_counter()
+
+    for _ in range(repeat):
+        for question in questions:
+            trace = Trace()
+            with trace.activate(), trace.span("total"):
+                rag.retrieve_documents(question["question"])
+
+            spans, counts = trace.snapshot()
+            for stage in STAGES:
+                if stage in spans:
+                    timings[stage].append(spans[stage])
+            deduplicated += counts.get("deduplicated_variations", 0)
+
+    elapsed = time.perf_counter() - started
+    qps = repeat * len(questions) / elapsed if elapsed else 0.0
+
+    expanded = sum(len(expand_query(question["question"])) for question in questions) / len(questions)
+    searched = expanded - deduplicated / (repeat * len(questions)) if repeat else expanded
+    return scores, timings, qps, {"expanded": expanded, "searched": searched}
+
+
+def neighbour_recall(approximate, exact, questions, k=6):
+    """
+    Share of the exact `k` nearest chunks of every query variation that the
+    approximate pipeline's vector store also returns.
+    """
+    variations = list(dict.fromkeys(v for q in questions for v in expand_query(q["question"])))
+    vectors = exact.embeddings.embed_documents(variations)
+
+    found = approximate.search_vectors(vectors, k=k)["ids"]
+    expected = exact.search_vectors(vectors, k=k)["ids"]
+    return sum(len(set(a) & set(e)) for a, e in zip(found, expected)) / sum(len(e) for e in expected)
+
+
+def summarize(scores, timings, qps, variations):
+    """Aggregate per-question scores and timings into the benchmark report."""
+    with_subarticles = [s["subarticle_recall"] for s in scores if "subarticle_recall" in s]
+    return {
+        "questions": len(scores),
+        "recall_at": {k: sum(s["recall"][k] for s in scores) / len(scores) for k in RECALL_AT},
+        "mrr": sum(s["reciprocal_rank"] for s in scores) / len(scores),
+        "subarticle_recall": (sum(with_subarticles) / len(with_subarticles)) if with_subarticles else None,
+        "latency_ms": {
+            stage: {q: percentile(values, q) * 1000 for q in (50, 95, 99)}
+            for stage, values in timings.items()
+            if values
+        },
+        "qps": qps,
+        "query_variations": variations,
+        "misses": {s["question"]: s["missing"] for s in scores if s["missing"]},
+    }
+
+
+def print_report(report):
+    print(f"Questions: {report['questions']}\n")
+
+    print("Accuracy")
+    for k, recall in report["recall_at"].items():
+        print(f"  recall@{k:<3} {recall:.3f}")
+    print(f"  MRR        {report['mrr']:.3f}")
+    if report["subarticle_recall"] is not None:
+        print(f"  sub-article recall {report['subarticle_recall']:.3f}")
+
+    print(f"\nLatency (ms){'p50':>18}{'p95':>10}{'p99':>10}")
+    for stage, values in report["latency_ms"].items():
+        print(f"  {stage:<20}{values[50]:>10.2f}{values[95]:>10.2f}{values[99]:>10.2f}")
+    print(f"\nThroughput: {report['qps']:.1f} queries/s (sequential)")
+
+    variations = report["query_variations"]
+    print(
+        f"Query variations per question: {variations['expanded']:.2f} expanded, "
+        f"{variations['searched']:.2f} searched after near-duplicate removal"
+    )
+
+    if report["misses"]:
+        print("\nMissing expected Articles:")
+        for question, missing in report["misses"].items():
+            print(f"  {question} → {', '.join(missing)}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline retrieval accuracy and latency benchmark")
+    parser.add_argument(
+        "--embeddings",
+        choices=("hashing", "recorded"),
+        default="hashing",
+        help="Local hashing embeddings, or the ingested database with recorded query vectors",
+    )
+    parser.add_argument(
+        "--vector-store",
+        choices=("chroma", "numpy", "both"),
+        default="chroma",
+        help="Vector search backend to benchmark, or both to compare them",
+    )
+    parser.add_argument("--record", action="store_true", help="Embed and cache missing query vectors with the configured embedding backend")
+    parser.add_argument("--questions", default=QUESTIONS_PATH, help="Labelled questions (JSONL)")
+    parser.add_argument("--repeat", type=int, default=3, help="Timed passes over the question set")
+    parser.add_argument("--persist-directory", default=persistent_directory, help="Ingested Chroma directory")
+    parser.add_argument("--json", dest="json_path", help="Also write the report as JSON to this path")
+    args = parser.parse_args()
+
+    questions = load_questions(args.questions)
+
+    stores = ("chroma", "numpy") if args.vector_store == "both" else (args.vector_store,)
+    reports = {}
+    pipelines = {}
+
+    with tempfile.TemporaryDirectory() as workdir:
+        if args.embeddings == "hashing":
+            rag = hashing_pipeline(load_chunks(args.persist_directory), workdir)
+        else:
+            rag = recorded_pipeline(args.persist_directory, record=args.record)
+
+        for store in stores:
+            pipelines[store] = rag = with_vector_store(rag, store)
+            reports[store] = summarize(*run(rag, questions, args.repeat))
+
+        if len(stores) == 2:
+            recall = neighbour_recall(pipelines["chroma"], pipelines["numpy"], questions)
+
+    for store, report in reports.items():
+        if len(stores) > 1:
+            print(f"\n=== Vector store: {store} ===\n")
+        print_report(report)
+
+    if len(stores) == 2:
+        print(f"\nChroma HNSW neighbours matching exact search: {recall:.3f}")
+
+    if args.json_path:
+        result = reports[stores[0]] if len(stores) == 1 else dict(reports, neighbour_recall=recall)
+        with open(args.json_path, "w", encoding="utf-8") as f:
+            json.dump(result, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,184 @@
+import heapq
+import json
+import math
+import os
+import re
+from collections import Counter
+
+BM25_INDEX_FILENAME = "bm25_index.json"
+
+_TERM_PATTERN = re.compile(r"\w+")
+# "Article 76" / "Part-7" become single terms, so citations match exactly
+_CITATION_PATTERN = re.compile(r"\b(part|article)[-\s]+(\d+)\b", re.IGNORECASE)
+_SUFFIXES = ("ations", "ation", "ions", "ion", "ing", "ies", "ed", "es", "s")
+
+STOP_WORDS = {
+    "how", "what", "when", "where", "who", "why", "which", "is", "are", "was",
+    "be", "the", "a", "an", "in", "of", "to", "for", "and", "or", "on", "by",
+    "with", "as", "at", "it", "its", "this", "that", "does", "do", "can",
+    "nepal", "constitution",
+}
+
+
+def bm25_index_path(persist_directory):
+    """Return the path of the BM25 index stored next to the Chroma directory."""
+    parent = os.path.dirname(os.path.normpath(persist_directory))
+    return os.path.join(parent, BM25_INDEX_FILENAME)
+
+
+def _stem(word):
+    """Strip a common English suffix ("elected" → "elect", "rights" → "right")."""
+    for suffix in _SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 4:
+            return word[: -len(suffix)]
+    return word
+
+
+def tokenize(text):
+    """Split text into lowercase, stemmed terms plus citation terms like "article_76"."""
+    terms = [
+        f"{kind.lower()}_{number}"
+        for kind, number in _CITATION_PATTERN.findall(text)
+    ]
+    for word in _TERM_PATTERN.findall(text.lower()):
+        if word not in STOP_WORDS:
+            terms.append(_stem(word))
+    return terms
+
+
+def _indexed_text(chunk):
+    # The hierarchy carries the Part/Article numbers that sub-article chunks
+    # do not repeat in their content
+    hierarchy = (chunk.get("metadata") or {}).get("hierarchy", "")
+    return f"{hierarchy}\n{chunk['content']}"
+
+
+class BM25Index:
+    """
+    Okapi BM25 inverted index over the ingested chunks.
+
+    Built once at ingestion time and persisted as JSON next to the Chroma
+    directory, so a lexical lookup is a few dictionary reads instead of a
+    scan over every candidate chunk.
+    """
+
+    def __init__(self, chunks, k1=1.5, b=0.75, doc_lengths=None, postings=None):
+        self.chunks = [
+            {"content": chunk["content"], "metadata": dict(chunk["metadata"] or {})}
+            for chunk in chunks
+        ]
+        self.k1 = k1
+        self.b = b
+
+        if postings is None:
+            doc_lengths, postings = [], {}
+            for position, chunk in enumerate(self.chunks):
+                terms = Counter(tokenize(_indexed_text(chunk)))
+                doc_lengths.append(sum(terms.values()))
+                for term, frequency in terms.items():
+                    postings.setdefault(term, {})[position] = frequency
+
+        # term -> {chunk position: term frequency}
+        self.postings = postings
+        self.doc_lengths = doc_lengths
+        self.avg_doc_length = (sum(doc_lengths) / len(doc_lengths)) if doc_lengths else 0.0
+
+        self._positions = {
+            chunk["metadata"]["chunk_id"]: position
+            for position, chunk in enumerate(self.chunks)
+            if "chunk_id" in chunk["metadata"]
+        }
+
+    def __len__(self):
+        return len(self.chunks)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index previously written with `save`."""
+        with open(path, encoding="utf-8") as f:
+            data = json.load(f)
+
+        postings = {
+            term: {position: frequency for position, frequency in entries}
+            for term, entries in data["postings"].items()
+        }
+        return cls(
+            data["chunks"],
+            k1=data["k1"],
+            b=data["b"],
+            doc_lengths=data["doc_lengths"],
+            postings=postings,
+        )
+
+    def save(self, path):
+        """
+        Persist the chunks, document lengths and postings as JSON, through a
+        temporary file moved into place so reloading servers never read a
+        partial index.
+        """
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        data = {
+            "k1": self.k1,
+            "b": self.b,
+            "chunks": self.chunks,
+            "doc_lengths": self.doc_lengths,
+            "postings": {
+                term: sorted(entries.items()) for term, entries in self.postings.items()
+            },
+        }
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump(data, f, ensure_ascii=False)
+        os.replace(path + ".tmp", path)
+
+    def query_terms(self, query):
+        """Return the unique terms of a query, in order."""
+        return list(dict.fromkeys(tokenize(query)))
+
+    def _idf(self, term):
+        frequency = len(self.postings.get(term, ()))
+        return math.log(1 + (len(self.chunks) - frequency + 0.5) / (frequency + 0.5))
+
+    def _term_score(self, term, frequency, doc_length):
+        norm = self.k1 * (1 - self.b + self.b * doc_length / (self.avg_doc_length or 1))
+        return self._idf(term) * frequency * (self.k1 + 1) / (frequency + norm)
+
+    def search(self, query, k=20):
+        """Return the top `k` (chunk, score) pairs for a query, best first."""
+        scores = {}
+        for term in self.query_terms(query):
+            entries = self.postings.get(term)
+            if not entries:
+                continue
+            for position, frequency in entries.items():
+                scores[position] = scores.get(position, 0.0) + self._term_score(
+                    term, frequency, self.doc_lengths[position]
+                )
+
+        best = heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+        return [(self.chunks[position], score) for position, score in best]
+
+    def score(self, query_terms, chunk_id=None, content=None, metadata=None):
+        """
+        Score one chunk against already tokenized query terms.
+
+        Returns `(matched_terms, score)`. Indexed chunks are looked up by
+        `chunk_id`; anything else is tokenized on the fly.
+        """
+        position = self._positions.get(chunk_id)
+        if position is not None:
+            doc_length = self.doc_lengths[position]
+            frequencies = {
+                term: self.postings[term][position]
+                for term in query_terms
+                if position in self.postings.get(term, ())
+            }
+        else:
+            terms = Counter(tokenize(_indexed_text({"content": content or "", "metadata": metadata})))
+            doc_length = sum(terms.values())
+            frequencies = {term: terms[term] for term in query_terms if term in terms}
+
+        score = sum(
+            self._term_score(term, frequency, doc_length)
+            for term, frequency in frequencies.items()
+        )
+        return len(frequencies), score
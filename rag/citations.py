@@ -0,0 +1,130 @@
+import re
+
+# "Article 76", "Articles 16-18", "Art. 76(1)(a)", "Parts 3 and 4", ...
+# Not preceded by "sub-" / "sub " so "Sub-article 2" is not read as Article 2
+_REFERENCE = re.compile(
+    r"(?<![\w-])(?<!sub )(?P<kind>parts?|articles?|arts?\.)\s*"
+    r"(?P<items>\d+(?:\s*\((?:\d+|[a-z])\))*"
+    r"(?:\s*(?:-|–|—|to|through|,|and|&)\s*\d+(?:\s*\((?:\d+|[a-z])\))*)*)",
+    re.IGNORECASE,
+)
+_ITEM = re.compile(
+    r"(?P<separator>-|–|—|to|through|,|and|&)?\s*(?P<number>\d+)"
+    r"(?P<selectors>(?:\s*\((?:\d+|[a-z])\))*)",
+    re.IGNORECASE,
+)
+_SELECTOR = re.compile(r"\((\d+|[a-z])\)", re.IGNORECASE)
+_RANGE_SEPARATORS = {"-", "–", "—", "to", "through"}
+
+# Selectors written out in words: "sub-article (2)", "clause b"
+_SUBARTICLE_WORDS = re.compile(r"\bsub[-\s]?articles?\s*\(?(\d+)\)?", re.IGNORECASE)
+_CLAUSE_WORDS = re.compile(r"\bclauses?\s*\(?([a-z])\)?(?![a-z])", re.IGNORECASE)
+
+# Longest range expanded from a single reference ("Articles 1-308" is not a lookup)
+MAX_RANGE = 50
+
+
+def _citation(kind, number, subarticle=None, clause=None):
+    return {"kind": kind, "number": number, "subarticle": subarticle, "clause": clause}
+
+
+def parse_citations(query):
+    """
+    Find explicit Part/Article references in a query.
+
+    Returns a list of citations, in order of appearance without duplicates,
+    as dicts with `kind` ("part" or "article"), `number` and the optional
+    `subarticle` number and `clause` letter of an article.
+    """
+    citations = []
+
+    for reference in _REFERENCE.finditer(query):
+        kind = "part" if reference.group("kind").lower().startswith("part") else "article"
+        previous = None
+
+        for item in _ITEM.finditer(reference.group("items")):
+            number = int(item.group("number"))
+            separator = (item.group("separator") or "").lower()
+
+            if previous is not None and separator in _RANGE_SEPARATORS and 0 < number - previous <= MAX_RANGE:
+                citations.extend(_citation(kind, n) for n in range(previous + 1, number + 1))
+            else:
+                selectors = _SELECTOR.findall(item.group("selectors"))
+                subarticle = next((s for s in selectors if s.isdigit()), None)
+                clause = next((s.lower() for s in selectors if not s.isdigit()), None)
+                if kind == "part":
+                    subarticle = clause = None
+                citations.append(_citation(kind, number, subarticle, clause))
+
+            previous = number
+
+    # Selectors in words apply when a single article is cited without them
+    articles = [c for c in citations if c["kind"] == "article"]
+    if len(articles) == 1 and not (articles[0]["subarticle"] or articles[0]["clause"]):
+        subarticle = _SUBARTICLE_WORDS.search(query)
+        clause = _CLAUSE_WORDS.search(query)
+        articles[0]["subarticle"] = subarticle.group(1) if subarticle else None
+        articles[0]["clause"] = clause.group(1).lower() if clause else None
+
+    unique = []
+    for citation in citations:
+        if citation not in unique:
+            unique.append(citation)
+    return unique
+
+
+def format_citation(citation):
+    """Render a citation as a hierarchy reference ("Article 76 → Sub-article (1)")."""
+    text = f"{citation['kind'].title()} {citation['number']}"
+    if citation["subarticle"]:
+        text += f" → Sub-article ({citation['subarticle']})"
+    if citation["clause"]:
+        text += f" → Clause ({citation['clause']})"
+    return text
+
+
+def _citation_chunks(citation, article_index):
+    # Numbered lists in later Parts and Schedules can reuse an article
+    # number, so only chunks of the cited Part (or of the Part where the
+    # article first appears) are returned
+    if citation["kind"] == "part":
+        part = f"Part {citation['number']}"
+        return [
+            chunk
+            for article in article_index.articles_in_part(part)
+            for chunk in article_index.chunks_for_article(article)
+            if chunk["metadata"].get("part") == part
+        ]
+
+    chunks = article_index.chunks_for_article(f"Article {citation['number']}")
+    if chunks:
+        part = chunks[0]["metadata"].get("part")
+        chunks = [c for c in chunks if c["metadata"].get("part") == part]
+
+    if citation["subarticle"]:
+        subarticle = f"Sub-article ({citation['subarticle']})"
+        chunks = [c for c in chunks if c["metadata"].get("subarticle") == subarticle]
+
+    if citation["clause"]:
+        # Clauses only have their own chunks when a long sub-article was
+        # split; otherwise the clause is inside the sub-article chunk
+        clause = f"Clause ({citation['clause']})"
+        clause_chunks = [c for c in chunks if c["metadata"].get("clause") == clause]
+        chunks = clause_chunks or chunks
+
+    return chunks
+
+
+def resolve_citations(citations, article_index):
+    """Return the chunks of every citation through the article index, in citation order."""
+    chunks = []
+    seen = set()
+
+    for citation in citations:
+        for chunk in _citation_chunks(citation, article_index):
+            key = chunk["metadata"].get("chunk_id") or chunk["content"]
+            if key not in seen:
+                seen.add(key)
+                chunks.append(chunk)
+
+    return chunks
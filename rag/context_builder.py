@@ -0,0 +1,171 @@
+import os
+import re
+
+from tokenizer import count_tokens
+
+# Prompt budget for the constitutional text sent to the model
+CONTEXT_TOKEN_BUDGET = int(os.getenv("RAG_CONTEXT_TOKEN_BUDGET", "2500"))
+
+# Sub-article/clause label added around each chunk, and the banner added for
+# each article, by the structured context
+CHUNK_OVERHEAD_TOKENS = 12
+ARTICLE_OVERHEAD_TOKENS = 40
+
+
+_NUMBER = re.compile(r"\d+")
+
+
+def _ordinal(label):
+    # Missing labels sort first, like an article's opening text
+    if not label:
+        return (-1, "")
+    match = _NUMBER.search(label)
+    return (int(match.group()) if match else -1, label)
+
+
+def hierarchy_key(metadata):
+    """
+    Sort key for the Part → Article → Sub-article → Clause of a chunk that
+    compares numbers numerically: "Article 76" < "Article 100" and
+    "Sub-article (2)" < "Sub-article (10)".
+    """
+    return tuple(_ordinal(metadata.get(level)) for level in ("part", "article", "subarticle", "clause"))
+
+
+def chunk_key(doc):
+    """Stable identity of a chunk: its chunk ID, or its full content for legacy chunks."""
+    return doc.metadata.get("chunk_id") or doc.page_content
+
+
+def dedupe(docs):
+    """Drop repeated chunks, keeping the first (highest ranked) occurrence."""
+    seen = set()
+    unique = []
+    for doc in docs:
+        key = chunk_key(doc)
+        if key not in seen:
+            seen.add(key)
+            unique.append(doc)
+    return unique
+
+
+def strip_prefix(content, metadata):
+    """
+    Remove the "[part_name - article_title]" prefix added at ingestion for
+    retrieval; the structured context already names the Part and Article.
+    """
+    if metadata.get("part_name") and metadata.get("article_title"):
+        prefix = f"[{metadata['part_name']} - {metadata['article_title']}]\n\n"
+        if content.startswith(prefix):
+            return content[len(prefix):]
+    return content
+
+
+def strip_context_prefix(doc):
+    """Return the document without its retrieval prefix (see `strip_prefix`)."""
+    content = strip_prefix(doc.page_content, doc.metadata)
+    if content is doc.page_content:
+        return doc
+    return type(doc)(page_content=content, metadata=doc.metadata)
+
+
+def _article(doc):
+    return doc.metadata.get("part"), doc.metadata.get("article")
+
+
+def pack(docs, max_tokens=CONTEXT_TOKEN_BUDGET):
+    """
+    Greedily keep documents, in rank order, while they fit in `max_tokens`.
+    A document that does not fit is skipped so smaller ones further down
+    can still use the remaining budget. The first chunk of each article
+    also pays for the article banner. Returns `(docs, tokens used)`.
+    """
+    packed = []
+    articles = set()
+    used = 0
+    for doc in docs:
+        tokens = count_tokens(doc.page_content) + CHUNK_OVERHEAD_TOKENS
+        if _article(doc) not in articles:
+            tokens += ARTICLE_OVERHEAD_TOKENS
+        if used + tokens > max_tokens:
+            continue
+        packed.append(doc)
+        articles.add(_article(doc))
+        used += tokens
+    return packed, used
+
+
+def _merge(run):
+    if len(run) == 1:
+        return run[0]
+
+    first = run[0]
+    metadata = {key: value for key, value in first.metadata.items() if key != "clause"}
+
+    subarticles = []
+    for doc in run:
+        subarticle = doc.metadata.get("subarticle")
+        if subarticle and subarticle not in subarticles:
+            subarticles.append(subarticle)
+    metadata["subarticles"] = subarticles
+    metadata["chunk_ids"] = [doc.metadata["chunk_id"] for doc in run]
+
+    content = "\n".join(doc.page_content for doc in run)
+    return type(first)(page_content=content, metadata=metadata)
+
+
+def merge_adjacent(docs, position):
+    """
+    Merge chunks of the same article that are adjacent in the document
+    (consecutive sub-articles, clause splits, page continuations) into a
+    single block. `position` maps a chunk ID to its index in document order,
+    or None when unknown; such chunks are kept as they are.
+
+    Articles keep the order in which they first appear in `docs`; chunks
+    within an article are put in document order.
+    """
+    articles = {}
+    for doc in docs:
+        articles.setdefault(_article(doc), []).append(doc)
+
+    merged = []
+    for article_docs in articles.values():
+        located = []
+        for doc in article_docs:
+            index = position(doc.metadata["chunk_id"]) if "chunk_id" in doc.metadata else None
+            if index is None:
+                merged.append(doc)
+            else:
+                located.append((index, doc))
+
+        located.sort(key=lambda item: item[0])
+
+        run, previous = [], None
+        for index, doc in located:
+            if run and index != previous + 1:
+                merged.append(_merge(run))
+                run = []
+            run.append(doc)
+            previous = index
+        if run:
+            merged.append(_merge(run))
+
+    return merged
+
+
+def assemble_context(docs, position=None, max_tokens=CONTEXT_TOKEN_BUDGET):
+    """
+    Build the documents sent to the model from ranked candidates:
+    deduplicate by chunk ID, strip the retrieval prefixes, pack under the
+    token budget (None for no limit) and merge adjacent chunks.
+
+    Returns `(docs, tokens used)`.
+    """
+    docs = [strip_context_prefix(doc) for doc in dedupe(docs)]
+
+    docs, tokens = pack(docs, float("inf") if max_tokens is None else max_tokens)
+
+    if position is not None:
+        docs = merge_adjacent(docs, position)
+
+    return docs, tokens
@@ -0,0 +1,59 @@
+import json
+import os
+from functools import lru_cache
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+
+# Registry of the documents served by one deployment: corpus name → title,
+# source PDF, vector store directory and query expansion rules
+CORPORA_PATH = os.getenv("RAG_CORPORA", os.path.join(DATA_DIR, "corpora.json"))
+
+# Corpus used when a request or command does not name one, and how many
+# corpora keep their pipeline (indexes, embedding matrix, answer cache) in
+# memory at once; the least recently used one is dropped beyond that
+DEFAULT_CORPUS = os.getenv("RAG_DEFAULT_CORPUS", "nepal")
+MAX_LOADED_CORPORA = int(os.getenv("RAG_MAX_LOADED_CORPORA", "4"))
+
+
+class UnknownCorpus(LookupError):
+    """The requested corpus is not in the registry."""
+
+
+class Corpus:
+    """
+    One document collection: its source PDF and the directory of its Chroma
+    vector store. The article index, BM25 index, chunk embedding matrix and
+    embedding cache are written next to that directory, so every corpus has
+    its own. Relative `document`, `query_expansion` and `golden_chunks`
+    (the expected chunker output) paths are resolved against rag/data; a
+    corpus without a `persist_directory` uses ./db/<name>/chroma_db, and
+    one without `golden_chunks` uses golden_chunks_<name>.jsonl.
+    """
+
+    def __init__(self, name, title, document, persist_directory=None, query_expansion=None, golden_chunks=None):
+        self.name = name
+        self.title = title
+        self.document = os.path.join(DATA_DIR, document)
+        self.persist_directory = persist_directory or os.path.join(".", "db", name, "chroma_db")
+        self.query_expansion = os.path.join(DATA_DIR, query_expansion or "query_expansion.json")
+        self.golden_chunks = os.path.join(DATA_DIR, golden_chunks or f"golden_chunks_{name}.jsonl")
+
+    def info(self):
+        return {"name": self.name, "title": self.title}
+
+
+@lru_cache(maxsize=None)
+def load_corpora(path=CORPORA_PATH):
+    """Read the corpus registry once per process; returns `{name: Corpus}`."""
+    with open(path, encoding="utf-8") as f:
+        entries = json.load(f)
+    return {name: Corpus(name, **entry) for name, entry in entries.items()}
+
+
+def get_corpus(name=None, corpora=None):
+    """Return the corpus `name` (default: DEFAULT_CORPUS); raises `UnknownCorpus`."""
+    corpora = corpora if corpora is not None else load_corpora()
+    name = name or DEFAULT_CORPUS
+    if name not in corpora:
+        raise UnknownCorpus(f"Unknown corpus {name!r}; available: {', '.join(sorted(corpora))}")
+    return corpora[name]
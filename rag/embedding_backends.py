@@ -0,0 +1,189 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+# Which embedding model ingestion and retrieval use:
+# - openai: OpenAI API (default)
+# - onnx: all-MiniLM-L6-v2 on the CPU through onnxruntime (ships with chromadb)
+# - sentence-transformers: any sentence-transformers model on the CPU
+EMBEDDING_BACKEND = os.getenv("RAG_EMBEDDING_BACKEND", "openai")
+
+DEFAULT_MODELS = {
+    "openai": "text-embedding-3-small",
+    "onnx": "all-MiniLM-L6-v2",
+    "sentence-transformers": "all-MiniLM-L6-v2",
+}
+EMBEDDING_MODEL = os.getenv("RAG_EMBEDDING_MODEL") or DEFAULT_MODELS.get(EMBEDDING_BACKEND)
+
+# Local models: texts per inference batch and batches run in parallel
+LOCAL_EMBEDDING_BATCH_SIZE = int(os.getenv("RAG_LOCAL_EMBEDDING_BATCH_SIZE", "64"))
+LOCAL_EMBEDDING_WORKERS = int(os.getenv("RAG_LOCAL_EMBEDDING_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+# Collection metadata key recording the model its vectors come from;
+# collections ingested before it existed were embedded with OpenAI
+EMBEDDING_MODEL_KEY = "embedding_model"
+LEGACY_EMBEDDING_MODEL = "openai:text-embedding-3-small"
+
+
+class EmbeddingModelMismatch(ValueError):
+    """The vector store was embedded with a different model than the configured one."""
+
+
+def _resolve(backend, model):
+    # No backend means the configured one; no model means the backend's default
+    if backend is None:
+        backend, model = EMBEDDING_BACKEND, model or EMBEDDING_MODEL
+    return backend, model or DEFAULT_MODELS.get(backend)
+
+
+def embedding_model_tag(backend=None, model=None):
+    """Identify an embedding model as "backend:model" (e.g. "onnx:all-MiniLM-L6-v2")."""
+    backend, model = _resolve(backend, model)
+    return f"{backend}:{model}"
+
+
+def embeddings_model_tag(embeddings):
+    """
+    The "backend:model" tag of an embedding model object, the same one
+    `embedding_model_tag` gives for the backend and model it was built with.
+    """
+    backend = getattr(embeddings, "backend", None)
+    if backend is None:
+        backend = "openai" if type(embeddings).__module__.startswith("langchain_openai") else type(embeddings).__name__
+    return f"{backend}:{getattr(embeddings, 'model', None) or type(embeddings).__name__}"
+
+
+def collection_embedding_model(vectorstore):
+    """Return the embedding model tag stored on a Chroma collection."""
+    metadata = vectorstore._collection.metadata or {}
+    return metadata.get(EMBEDDING_MODEL_KEY, LEGACY_EMBEDDING_MODEL)
+
+
+def check_embedding_model(vectorstore, tag):
+    """Raise `EmbeddingModelMismatch` unless the collection was embedded with `tag`."""
+    stored = collection_embedding_model(vectorstore)
+    if stored != tag:
+        raise EmbeddingModelMismatch(
+            f"The vector store was embedded with {stored!r} but the configured embedding "
+            f"model is {tag!r}. Re-ingest with `python rag/ingestion_pipeline.py --full` "
+            "or set RAG_EMBEDDING_BACKEND / RAG_EMBEDDING_MODEL to match."
+        )
+
+
+class LocalEmbeddings:
+    """
+    Base class for embedding models that run on this machine.
+
+    Texts are split into batches of `batch_size` that are encoded in
+    parallel on a thread pool (the inference runtimes release the GIL), and
+    the async methods run in a worker thread so they never block the event
+    loop. Subclasses implement `_encode(batch)` and name their `backend`.
+    """
+
+    backend = None
+
+    def __init__(self, model, batch_size=LOCAL_EMBEDDING_BATCH_SIZE, workers=LOCAL_EMBEDDING_WORKERS):
+        self.model = model
+        self.batch_size = batch_size
+        self.workers = workers
+        self._pool = None
+        self._lock = threading.Lock()
+
+    def _encode(self, batch):
+        raise NotImplementedError
+
+    def _get_pool(self):
+        with self._lock:
+            if self._pool is None:
+                self._pool = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="embedding")
+            return self._pool
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        batches = [texts[i : i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+        if len(batches) <= 1:
+            vectors = [self._encode(batch) for batch in batches]
+        else:
+            vectors = list(self._get_pool().map(self._encode, batches))
+
+        return [
+            vector.tolist() if hasattr(vector, "tolist") else list(vector)
+            for batch in vectors
+            for vector in batch
+        ]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        return await asyncio.to_thread(self.embed_documents, texts)
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
+
+
+class OnnxEmbeddings(LocalEmbeddings):
+    """
+    all-MiniLM-L6-v2 through onnxruntime, using chromadb's bundled model.
+
+    The model files are downloaded to ~/.cache/chroma/onnx_models on first
+    use; copy that directory to air-gapped machines.
+    """
+
+    backend = "onnx"
+
+    def __init__(self, model=DEFAULT_MODELS["onnx"], **kwargs):
+        if model != DEFAULT_MODELS["onnx"]:
+            raise ValueError(
+                f"The onnx backend only provides {DEFAULT_MODELS['onnx']!r}; "
+                "use the sentence-transformers backend for other models"
+            )
+        super().__init__(model, **kwargs)
+
+        from chromadb.utils.embedding_functions import ONNXMiniLM_L6_V2
+
+        self._function = ONNXMiniLM_L6_V2(preferred_providers=["CPUExecutionProvider"])
+
+    def _encode(self, batch):
+        return self._function(batch)
+
+
+class SentenceTransformerEmbeddings(LocalEmbeddings):
+    """A sentence-transformers model on the CPU (needs the `sentence-transformers` package)."""
+
+    backend = "sentence-transformers"
+
+    def __init__(self, model=DEFAULT_MODELS["sentence-transformers"], **kwargs):
+        super().__init__(model, **kwargs)
+
+        from sentence_transformers import SentenceTransformer
+
+        self._model = SentenceTransformer(model, device="cpu")
+
+    def _encode(self, batch):
+        return self._model.encode(batch, batch_size=len(batch), normalize_embeddings=True)
+
+
+def create_embeddings(backend=None, model=None, **openai_options):
+    """
+    Build the configured embedding model (without the embedding cache).
+
+    `openai_options` (HTTP clients, retries) are passed to `OpenAIEmbeddings`
+    and ignored by the local backends.
+    """
+    backend, model = _resolve(backend, model)
+
+    if backend == "openai":
+        from langchain_openai import OpenAIEmbeddings
+
+        return OpenAIEmbeddings(model=model, **openai_options)
+    if backend == "onnx":
+        return OnnxEmbeddings(model)
+    if backend == "sentence-transformers":
+        return SentenceTransformerEmbeddings(model)
+
+    raise ValueError(
+        f"Unknown embedding backend {backend!r}; expected one of {', '.join(DEFAULT_MODELS)}"
+    )
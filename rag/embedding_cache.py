@@ -0,0 +1,140 @@
+import asyncio
+import hashlib
+import os
+import sqlite3
+import threading
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from embedding_backends import embeddings_model_tag
+from timings import count
+
+EMBEDDING_CACHE_FILENAME = "embedding_cache.sqlite"
+
+
+def embedding_cache_path(persist_directory):
+    """Return the path of the embedding cache stored next to the Chroma directory."""
+    parent = os.path.dirname(os.path.normpath(persist_directory))
+    return os.path.join(parent, EMBEDDING_CACHE_FILENAME)
+
+
+def _text_hash(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Embedding model wrapper backed by a SQLite cache keyed by (model, text hash).
+
+    The model is identified by its "backend:model" tag (see
+    `embeddings_model_tag`), so backends serving the same model name never
+    share vectors.
+
+    Only texts missing from the cache are sent to the wrapped model, so
+    repeated queries, fixed query expansions and unchanged chunks are never
+    embedded twice. Vectors are stored as float32 blobs.
+    """
+
+    def __init__(self, embeddings, path, model_name=None):
+        self.embeddings = embeddings
+        self.model_name = model_name or embeddings_model_tag(embeddings)
+        self.path = path
+
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                text_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                PRIMARY KEY (model, text_hash)
+            )
+            """
+        )
+        self._conn.commit()
+
+    def _lookup(self, hashes):
+        """Return {text_hash: vector} for the hashes present in the cache."""
+        found = {}
+        unique = list(dict.fromkeys(hashes))
+
+        with self._lock:
+            # Stay well below SQLite's bound parameter limit
+            for start in range(0, len(unique), 500):
+                batch = unique[start : start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT text_hash, vector FROM embeddings "
+                    f"WHERE model = ? AND text_hash IN ({placeholders})",
+                    [self.model_name, *batch],
+                )
+                for text_hash, blob in rows:
+                    found[text_hash] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+        return found
+
+    def _store(self, hashes, vectors):
+        rows = [
+            (self.model_name, text_hash, np.asarray(vector, dtype=np.float32).tobytes())
+            for text_hash, vector in zip(hashes, vectors)
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, text_hash, vector) VALUES (?, ?, ?)",
+                rows,
+            )
+            self._conn.commit()
+
+    def _missing(self, texts, hashes, found):
+        """Return the unique (hash, text) pairs that still need embedding."""
+        missing = {}
+        for text, text_hash in zip(texts, hashes):
+            if text_hash not in found and text_hash not in missing:
+                missing[text_hash] = text
+        return list(missing.keys()), list(missing.values())
+
+    def _count(self, hashes, missing_texts):
+        # Per-request counters, when the call is part of a traced request
+        count("embedding_cache_hits", len(set(hashes)) - len(missing_texts))
+        if missing_texts:
+            count("embedding_api_calls")
+            count("embedded_texts", len(missing_texts))
+
+    def embed_documents(self, texts):
+        texts = list(texts)
+        hashes = [_text_hash(text) for text in texts]
+        found = self._lookup(hashes)
+
+        missing_hashes, missing_texts = self._missing(texts, hashes, found)
+        self._count(hashes, missing_texts)
+        if missing_texts:
+            vectors = self.embeddings.embed_documents(missing_texts)
+            self._store(missing_hashes, vectors)
+            found.update(zip(missing_hashes, vectors))
+
+        return [found[text_hash] for text_hash in hashes]
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+    async def aembed_documents(self, texts):
+        texts = list(texts)
+        hashes = [_text_hash(text) for text in texts]
+        # SQLite reads and writes run in a worker thread, off the event loop
+        found = await asyncio.to_thread(self._lookup, hashes)
+
+        missing_hashes, missing_texts = self._missing(texts, hashes, found)
+        self._count(hashes, missing_texts)
+        if missing_texts:
+            vectors = await self.embeddings.aembed_documents(missing_texts)
+            await asyncio.to_thread(self._store, missing_hashes, vectors)
+            found.update(zip(missing_hashes, vectors))
+
+        return [found[text_hash] for text_hash in hashes]
+
+    async def aembed_query(self, text):
+        return (await self.aembed_documents([text]))[0]
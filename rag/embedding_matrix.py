@@ -0,0 +1,150 @@
+import glob
+import json
+import os
+import uuid
+
+import numpy as np
+
+# The manifest (embedding model, chunk IDs and the name of the matrix file)
+# is the single file replaced when the matrix is saved; the matrix itself
+# is written under a new name each time, so a reader that loaded a
+# manifest always pairs its IDs with the matching rows
+EMBEDDING_MATRIX_FILENAME = "chunk_embeddings.json"
+MATRIX_DATA_PATTERN = "chunk_embeddings-*.npy"
+
+# Matrix of manifests written before the matrix file was named in them
+LEGACY_MATRIX_FILENAME = "chunk_embeddings.npy"
+
+
+def embedding_matrix_path(persist_directory):
+    """Return the path of the chunk embedding matrix manifest stored next to the Chroma directory."""
+    parent = os.path.dirname(os.path.normpath(persist_directory))
+    return os.path.join(parent, EMBEDDING_MATRIX_FILENAME)
+
+
+def _read_manifest(path):
+    with open(path, encoding="utf-8") as f:
+        manifest = json.load(f)
+    matrix_path = os.path.join(os.path.dirname(path), manifest.get("matrix", LEGACY_MATRIX_FILENAME))
+    return manifest, matrix_path
+
+
+def unit_rows(vectors):
+    """Return the vectors as a float32 matrix with L2-normalized rows."""
+    matrix = np.asarray(vectors, dtype=np.float32)
+    if matrix.ndim == 1:
+        matrix = matrix[np.newaxis, :]
+    norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return matrix / norms
+
+
+class EmbeddingMatrix:
+    """
+    Every chunk embedding as one L2-normalized float32 matrix, with a chunk
+    ID → row map, for reranking retrieved chunks in process.
+
+    Saved as a `.npy` file plus a JSON manifest (chunk IDs, embedding model
+    and the `.npy` file name), and memory-mapped on load, so only the rows
+    that are actually scored are read from disk.
+    """
+
+    def __init__(self, ids, matrix, model=None):
+        self.ids = list(ids)
+        self.matrix = matrix
+        self.model = model
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self._rows
+
+    def row(self, chunk_id):
+        """Return the matrix row of a chunk, or None if unknown."""
+        return self._rows.get(chunk_id)
+
+    @classmethod
+    def from_vectors(cls, ids, vectors, model=None):
+        """Build the matrix from raw embedding vectors, normalizing every row."""
+        return cls(ids, unit_rows(vectors), model)
+
+    @classmethod
+    def from_collection(cls, vectorstore, model=None):
+        """Build the matrix with a single full read of a Chroma vector store."""
+        data = vectorstore._collection.get(include=["embeddings"])
+        return cls.from_vectors(data["ids"], data["embeddings"], model)
+
+    @classmethod
+    def load(cls, path, mmap=True):
+        """Load a matrix written with `save`, memory-mapped unless `mmap` is False."""
+        manifest, matrix_path = _read_manifest(path)
+        try:
+            matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+        except FileNotFoundError:
+            # Pruned by a save that replaced the manifest since it was read
+            manifest, matrix_path = _read_manifest(path)
+            matrix = np.load(matrix_path, mmap_mode="r" if mmap else None)
+        return cls(manifest["ids"], matrix, manifest.get("model"))
+
+    def save(self, path):
+        """
+        Write the matrix to a new file, then atomically replace the manifest
+        naming it, so readers never pair rows and IDs of different saves.
+        Matrix files other than the new and the previous one are removed.
+        """
+        directory = os.path.dirname(path) or "."
+        os.makedirs(directory, exist_ok=True)
+
+        matrix_name = MATRIX_DATA_PATTERN.replace("*", uuid.uuid4().hex)
+        matrix_path = os.path.join(directory, matrix_name)
+        with open(matrix_path + ".tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(self.matrix, dtype=np.float32))
+        os.replace(matrix_path + ".tmp", matrix_path)
+
+        # Readers that just loaded the previous manifest may still open its matrix
+        keep = {matrix_path}
+        if os.path.exists(path):
+            try:
+                keep.add(_read_manifest(path)[1])
+            except (OSError, ValueError):
+                pass
+
+        with open(path + ".tmp", "w", encoding="utf-8") as f:
+            json.dump({"model": self.model, "matrix": matrix_name, "ids": self.ids}, f)
+        os.replace(path + ".tmp", path)
+
+        stale = glob.glob(os.path.join(directory, MATRIX_DATA_PATTERN))
+        stale.append(os.path.join(directory, LEGACY_MATRIX_FILENAME))
+        for stale_path in stale:
+            if stale_path not in keep and os.path.exists(stale_path):
+                os.remove(stale_path)
+
+    def scores(self, chunk_ids, query_vectors, pooling="max"):
+        """
+        Cosine similarity of each chunk to the queries, pooled over the
+        queries with "max" or "mean": one matrix product for all chunks.
+
+        `chunk_ids` items are a chunk ID or a list of IDs (merged blocks,
+        scored by their best chunk). Unknown chunks score NaN.
+        """
+        rows = []
+        owners = []
+        for position, ids in enumerate(chunk_ids):
+            for chunk_id in ids if isinstance(ids, (list, tuple)) else [ids]:
+                row = self._rows.get(chunk_id)
+                if row is not None:
+                    rows.append(row)
+                    owners.append(position)
+
+        scores = np.full(len(chunk_ids), np.nan, dtype=np.float32)
+        if not rows:
+            return scores
+
+        similarities = self.matrix[np.asarray(rows)] @ unit_rows(query_vectors).T
+        pooled = similarities.mean(axis=1) if pooling == "mean" else similarities.max(axis=1)
+
+        # A block made of several chunks keeps its best chunk's score
+        np.fmax.at(scores, np.asarray(owners), pooled)
+        return scores
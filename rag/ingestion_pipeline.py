@@ -1,17 +1,48 @@
+import argparse
+import hashlib
+import json
 import os
+import random
 import re
+import threading
+import time
+from bisect import bisect_left, bisect_right
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_community.document_loaders import PyMuPDFLoader
-from langchain_openai import OpenAIEmbeddings
 from langchain_chroma import Chroma
 from dotenv import load_dotenv
-from langchain_core.documents import Document
+
+from article_index import ArticleIndex, article_index_path
+from bm25_index import BM25Index, bm25_index_path
+from corpora import DEFAULT_CORPUS, UnknownCorpus, get_corpus
+from embedding_backends import (
+    DEFAULT_MODELS,
+    EMBEDDING_MODEL_KEY,
+    check_embedding_model,
+    collection_embedding_model,
+    create_embeddings,
+    embedding_model_tag,
+)
+from embedding_cache import CachedEmbeddings, embedding_cache_path
+from embedding_matrix import EmbeddingMatrix, embedding_matrix_path
+from tokenizer import count_tokens
 
 load_dotenv()
 
 # Build an absolute path to the PDF
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 DOCUMENT_PATH = os.path.join(BASE_DIR, "data", "Constitution_English.pdf")
+PERSIST_DIRECTORY = "db/chroma_db"
+GOLDEN_CHUNKS_PATH = os.path.join(BASE_DIR, "data", "golden_chunks.jsonl")
+
+# Embedding stage defaults (text-embedding-3-small accepts up to 2048 inputs
+# and 300k tokens per request)
+EMBEDDING_BATCH_SIZE = 128
+EMBEDDING_WORKERS = 4
+MAX_BATCH_TOKENS = 100_000
+MAX_RETRIES = 6
+UPSERT_BATCH_SIZE = 1000
 
 
 def load_documents(doc_path=DOCUMENT_PATH):
@@ -27,214 +58,684 @@ def load_documents(doc_path=DOCUMENT_PATH):
     return documents
 
 
-def extract_part_name(text):
-    """Extract Part number and name from text."""
-    match = re.search(r'Part[-\s]*(\d+)\s*[-–—]?\s*([^\n]+)?', text, re.IGNORECASE)
-    if match:
-        part_num = match.group(1)
-        part_name = match.group(2).strip() if match.group(2) else ""
-        return f"Part {part_num}", part_name
-    return None, None
+def lazy_load_documents(doc_path=DOCUMENT_PATH):
+    """Yield the document page by page instead of loading it all at once."""
+    loader = PyMuPDFLoader(doc_path)
+    
+    page_count = 0
+    for page in loader.lazy_load():
+        page_count += 1
+        yield page
+    
+    if page_count == 0:
+        raise FileNotFoundError(
+            f"No documents found at path: {doc_path}")
+    
+    print("Documents loaded:", page_count)
 
 
-def extract_article_info(text):
-    """Extract Article number and title from text."""
-    # Match patterns like "1. Article Title:" or just "1."
-    match = re.search(r'^(\d+)\.\s*([^:\n]+)?', text.strip())
-    if match:
-        article_num = match.group(1)
-        article_title = match.group(2).strip() if match.group(2) else ""
-        return f"Article {article_num}", article_title
-    return None, None
+# Hierarchy boundaries, all matched in a single scan. Each alternative is a
+# zero-width lookahead, so one event is emitted per boundary position:
+# - part:       "Part 7", "PART-7" (the text is split before it)
+# - article:    "\n76. Title" (the newline is dropped, as with re.split)
+# - subarticle: "(1)"
+# - clause:     "(a)"
+# The leading character class lets the scan skip most positions cheaply.
+BOUNDARY_PATTERN = re.compile(
+    r'(?=[Pp\n(])'
+    r'(?=(?P<part>(?i:Part)[-\s]*\d+)'
+    r'|(?P<article>\n\d+\.\s+[A-Z])'
+    r'|(?P<subarticle>\(\d+\))'
+    r'|(?P<clause>\([a-z]\)))'
+)
 
+# The start of a boundary that may still be completed by the next page
+PENDING_BOUNDARY = re.compile(
+    r'(?:(?i:p(?:a(?:r(?:t[-\s]*)?)?)?)|\n(?:\d+(?:\.\s*)?)?|\((?:\d+|[a-z])?)\Z'
+)
 
-def extract_subarticle_num(text):
-    """Extract sub-article number from text."""
-    match = re.search(r'^\((\d+)\)', text.strip())
-    if match:
-        return f"Sub-article ({match.group(1)})"
-    return None
+PART_INFO = re.compile(r'Part[-\s]*(\d+)\s*[-–—]?\s*([^\n]+)?', re.IGNORECASE)
+ARTICLE_INFO = re.compile(r'(\d+)\.\s*([^:\n]+)?')
+SUBARTICLE_NUM = re.compile(r'\((\d+)\)')
+CLAUSE_LETTER = re.compile(r'\(([a-z])\)')
 
 
-def extract_clause_letter(text):
-    """Extract clause letter from text."""
-    match = re.search(r'^\(([a-z])\)', text.strip())
-    if match:
-        return f"Clause ({match.group(1)})"
-    return None
+def _pending_start(text):
+    """Return the position from which the end of `text` must be rescanned once more text arrives."""
+    # A boundary can only be pending inside a trailing run of whitespace,
+    # digits, dots and hyphens, preceded by at most "Part" or "("
+    end = len(text)
+    while end > 0 and (text[end - 1].isspace() or text[end - 1].isdecimal() or text[end - 1] in '-.'):
+        end -= 1
+    match = PENDING_BOUNDARY.search(text, max(0, end - 4))
+    return match.start() if match else len(text)
 
 
-def chunk_documents(documents):
+def _chunk_metadata(part_num, part_name, article_num, article_title, subarticle_num=None):
+    """Build chunk metadata and its "Part → Article → Sub-article" hierarchy reference."""
+    metadata = {}
+    hierarchy_parts = []
+    
+    if part_num:
+        metadata['part'] = part_num
+        if part_name:
+            metadata['part_name'] = part_name
+        hierarchy_parts.append(part_num)
+    if article_num:
+        metadata['article'] = article_num
+        if article_title:
+            metadata['article_title'] = article_title
+        hierarchy_parts.append(article_num)
+    if subarticle_num:
+        metadata['subarticle'] = subarticle_num
+        hierarchy_parts.append(subarticle_num)
+    
+    metadata['hierarchy'] = " → ".join(hierarchy_parts)
+    return metadata
+
+
+def _between(positions, start, end):
+    """Return the sorted positions strictly inside (start, end)."""
+    return positions[bisect_right(positions, start):bisect_left(positions, end)]
+
+
+def chunk_part(text, events, start, end):
     """
-    Improved hierarchical chunking for Constitution of Nepal:
+    Hierarchical chunking of one Part, text[start:end], of the Constitution of Nepal:
     - Keeps complete sub-articles together (with all their clauses)
     - Adds contextual prefix to each chunk for better retrieval
     - Preserves full metadata hierarchy
-    """
-    print("Chunking Started...")
     
-    # Extract the raw text from the documents
-    full_text = "\n".join([doc.page_content for doc in documents])
+    `events` are the sorted (position, kind, match end) boundaries found by
+    `BOUNDARY_PATTERN`; chunks are sliced straight from `text` at those offsets.
+    """
+    if len(text[start:end].strip()) < 10:
+        return
     
-    final_chunks = []
+    part_num, part_name = None, None
+    part_match = PART_INFO.match(text, start, end)
+    if part_match:
+        part_num = f"Part {part_match.group(1)}"
+        part_name = part_match.group(2).strip() if part_match.group(2) else ""
     
-    # Split by PART
-    parts = re.split(r'(?=Part[-\s]*\d+)', full_text, flags=re.IGNORECASE)
+    # Articles start after the newline of each article boundary; a boundary
+    # whose lookahead runs past the end of the Part does not count
+    article_starts = [start]
+    subarticle_positions = []
+    clause_positions = []
+    for pos, kind, match_end in events[bisect_right(events, (start,)):bisect_left(events, (end,))]:
+        if kind == 'article':
+            if match_end <= end:
+                article_starts.append(pos + 1)
+        elif kind == 'subarticle':
+            subarticle_positions.append(pos)
+        elif kind == 'clause':
+            clause_positions.append(pos)
+    article_ends = [pos - 1 for pos in article_starts[1:]] + [end]
     
-    for part_text in parts:
-        if not part_text.strip() or len(part_text.strip()) < 10:
+    for article_start, article_end in zip(article_starts, article_ends):
+        # Skip if no article number found (likely preamble or other content)
+        article_match = ARTICLE_INFO.match(text[article_start:article_end].strip())
+        if not article_match:
             continue
-            
-        part_num, part_name = extract_part_name(part_text)
         
-        # Split by ARTICLE (numbered items like "1.", "2.", etc.)
-        articles = re.split(r'\n(?=\d+\.\s+[A-Z])', part_text)
+        article_num = f"Article {article_match.group(1)}"
+        article_title = article_match.group(2).strip() if article_match.group(2) else ""
+        
+        # Add contextual prefix for better retrieval
+        context_prefix = ""
+        if part_name and article_title:
+            context_prefix = f"[{part_name} - {article_title}]\n\n"
+        
+        subarticle_starts = [article_start] + _between(subarticle_positions, article_start, article_end)
+        subarticle_ends = subarticle_starts[1:] + [article_end]
         
-        for article_text in articles:
-            if not article_text.strip():
+        for index, (subarticle_start, subarticle_end) in enumerate(zip(subarticle_starts, subarticle_ends)):
+            subarticle_text = text[subarticle_start:subarticle_end].strip()
+            if len(subarticle_text) < 15:
                 continue
-                
-            article_num, article_title = extract_article_info(article_text)
             
-            # Skip if no article number found (likely preamble or other content)
-            if not article_num:
+            if index == 0:
+                # This is the article header/title, create a chunk for it
+                if len(subarticle_text) > 20:
+                    yield {
+                        'content': subarticle_text,
+                        'metadata': _chunk_metadata(part_num, part_name, article_num, article_title)
+                    }
                 continue
             
-            # Split by SUB-ARTICLE "(1)", "(2)", etc.
-            subarticles = re.split(r'(?=\(\d+\))', article_text)
+            # Sub-articles are kept complete with all their clauses
+            subarticle_num = f"Sub-article ({SUBARTICLE_NUM.match(subarticle_text).group(1)})"
+            metadata = _chunk_metadata(part_num, part_name, article_num, article_title, subarticle_num)
             
-            for subarticle_text in subarticles:
-                if not subarticle_text.strip() or len(subarticle_text.strip()) < 15:
-                    continue
-                    
-                subarticle_num = extract_subarticle_num(subarticle_text)
+            # If chunk is too large, split it by clauses but preserve metadata
+            if len(context_prefix) + len(subarticle_text) > 2000:
+                clause_starts = [subarticle_start] + _between(clause_positions, subarticle_start, subarticle_end)
+                clause_ends = clause_starts[1:] + [subarticle_end]
                 
-                # If this is a sub-article, keep it complete with all its clauses
-                if subarticle_num:
-                    # Build metadata
-                    metadata = {}
-                    if part_num:
-                        metadata['part'] = part_num
-                        if part_name:
-                            metadata['part_name'] = part_name
-                    if article_num:
-                        metadata['article'] = article_num
-                        if article_title:
-                            metadata['article_title'] = article_title
-                    metadata['subarticle'] = subarticle_num
+                for clause_index, (clause_start, clause_end) in enumerate(zip(clause_starts, clause_ends)):
+                    clause_text = text[clause_start:clause_end].strip()
+                    if len(clause_text) < 10:
+                        continue
                     
-                    # Create hierarchical reference
-                    hierarchy_parts = []
-                    if part_num:
-                        hierarchy_parts.append(part_num)
-                    if article_num:
-                        hierarchy_parts.append(article_num)
-                    hierarchy_parts.append(subarticle_num)
-                    metadata['hierarchy'] = " → ".join(hierarchy_parts)
+                    clause_metadata = metadata.copy()
+                    if clause_index > 0:
+                        clause_letter = f"Clause ({CLAUSE_LETTER.match(clause_text).group(1)})"
+                        clause_metadata['clause'] = clause_letter
+                        clause_metadata['hierarchy'] = metadata['hierarchy'] + f" → {clause_letter}"
                     
-                    # Add contextual prefix for better retrieval
-                    context_prefix = ""
-                    if part_name and article_title:
-                        context_prefix = f"[{part_name} - {article_title}]\n\n"
-                    
-                    # Clean the text content
-                    clean_text = context_prefix + subarticle_text.strip()
-                    
-                    # If chunk is too large, split it but preserve metadata
-                    if len(clean_text) > 2000:
-                        # For very large sub-articles, split by clauses
-                        clauses = re.split(r'(?=\([a-z]\))', subarticle_text)
-                        
-                        for clause_text in clauses:
-                            if not clause_text.strip() or len(clause_text.strip()) < 10:
-                                continue
-                            
-                            clause_letter = extract_clause_letter(clause_text)
-                            clause_metadata = metadata.copy()
-                            
-                            if clause_letter:
-                                clause_metadata['clause'] = clause_letter
-                                clause_metadata['hierarchy'] = metadata['hierarchy'] + f" → {clause_letter}"
-                            
-                            clause_content = context_prefix + clause_text.strip()
-                            
-                            final_chunks.append({
-                                'content': clause_content,
-                                'metadata': clause_metadata
-                            })
-                    else:
-                        final_chunks.append({
-                            'content': clean_text,
-                            'metadata': metadata
-                        })
-                else:
-                    # This is the article header/title, create a chunk for it
-                    if article_num and len(subarticle_text.strip()) > 20:
-                        metadata = {}
-                        if part_num:
-                            metadata['part'] = part_num
-                            if part_name:
-                                metadata['part_name'] = part_name
-                        if article_num:
-                            metadata['article'] = article_num
-                            if article_title:
-                                metadata['article_title'] = article_title
-                        
-                        hierarchy_parts = []
-                        if part_num:
-                            hierarchy_parts.append(part_num)
-                        if article_num:
-                            hierarchy_parts.append(article_num)
-                        metadata['hierarchy'] = " → ".join(hierarchy_parts)
-                        
-                        final_chunks.append({
-                            'content': subarticle_text.strip(),
-                            'metadata': metadata
-                        })
-    
-    print(f"Chunking Completed. Total Chunks: {len(final_chunks)}")
-    return final_chunks
-
-
-def create_vector_store(chunks, persist_directory="db/chroma_db"):
-    """Create and persist ChromaDB vector store with metadata"""
+                    yield {
+                        'content': context_prefix + clause_text,
+                        'metadata': clause_metadata
+                    }
+            else:
+                yield {
+                    'content': context_prefix + subarticle_text,
+                    'metadata': metadata
+                }
+
+
+def iter_chunks(documents):
+    """
+    Stream chunks from pages as they arrive (e.g. from `lazy_load_documents`).
+    
+    Each page is scanned once with `BOUNDARY_PATTERN`, which emits Part,
+    Article, Sub-article and Clause boundary events with their offsets.
+    Text is buffered only until the next Part boundary, so Part and Article
+    context carries across page boundaries and each Part's chunks are
+    yielded (as slices of the buffer) as soon as the Part is complete.
+    Reports chunking throughput in pages per second.
+    """
+    print("Chunking Started...")
+    
+    buffer = None
+    events = []
+    part_boundaries = []
+    scan_from = 0
+    page_count = 0
+    chunk_count = 0
+    busy = 0.0
+    
+    for doc in documents:
+        started = time.perf_counter()
+        page_count += 1
+        buffer = doc.page_content if buffer is None else buffer + "\n" + doc.page_content
+        
+        # Scan only text that has not been scanned yet, stopping where a
+        # boundary may still be completed by the next page
+        pending = _pending_start(buffer)
+        for match in BOUNDARY_PATTERN.finditer(buffer, scan_from):
+            pos = match.start()
+            if pos >= pending:
+                break
+            kind = match.lastgroup
+            events.append((pos, kind, match.end(kind)))
+            if kind == 'part' and pos > 0:
+                part_boundaries.append(pos)
+        scan_from = pending
+        
+        # Every Part boundary closes the Part before it
+        completed = []
+        part_start = 0
+        for boundary in part_boundaries:
+            completed.extend(chunk_part(buffer, events, part_start, boundary))
+            part_start = boundary
+        part_boundaries = []
+        
+        # Keep only the open Part
+        if part_start:
+            buffer = buffer[part_start:]
+            events = [
+                (pos - part_start, kind, end - part_start)
+                for pos, kind, end in events[bisect_left(events, (part_start,)):]
+            ]
+            scan_from -= part_start
+        
+        busy += time.perf_counter() - started
+        chunk_count += len(completed)
+        yield from completed
+    
+    if buffer is not None:
+        started = time.perf_counter()
+        # Whatever was pending can no longer be completed
+        for match in BOUNDARY_PATTERN.finditer(buffer, scan_from):
+            kind = match.lastgroup
+            events.append((match.start(), kind, match.end(kind)))
+        completed = list(chunk_part(buffer, events, 0, len(buffer)))
+        busy += time.perf_counter() - started
+        chunk_count += len(completed)
+        yield from completed
+    
+    print(f"Chunking Completed. Total Chunks: {chunk_count}")
+    if busy:
+        print(f"Chunking throughput: {page_count / busy:.0f} pages/s ({page_count} pages in {busy:.3f}s)")
+
+
+def chunk_documents(documents):
+    """Chunk all pages of a loaded document into a list (see `iter_chunks`)."""
+    return list(iter_chunks(documents))
+
+
+def _chunk_digest(chunk):
+    """Hash of a chunk's content and chunker metadata (IDs are assigned later)."""
+    metadata = {
+        key: value for key, value in chunk['metadata'].items()
+        if key not in ('chunk_id', 'content_hash')
+    }
+    payload = chunk['content'] + '\n' + json.dumps(metadata, sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+
+def write_golden_chunks(chunks, path=GOLDEN_CHUNKS_PATH):
+    """Record the chunker output as one line per chunk (hierarchy + digest)."""
+    count = 0
+    with open(path, 'w', encoding='utf-8') as f:
+        for chunk in chunks:
+            record = {'hierarchy': chunk['metadata'].get('hierarchy'), 'sha256': _chunk_digest(chunk)}
+            f.write(json.dumps(record, ensure_ascii=False) + '\n')
+            count += 1
+    print(f"Golden chunks written to {path} ({count} chunks)")
+
+
+def verify_golden_chunks(chunks, path=GOLDEN_CHUNKS_PATH):
+    """
+    Compare the chunker output against the golden file written by
+    `write_golden_chunks`. Returns True when every chunk matches, otherwise
+    prints the first differences and returns False.
+    """
+    with open(path, encoding='utf-8') as f:
+        expected = [json.loads(line) for line in f if line.strip()]
+    
+    actual = [
+        {'hierarchy': chunk['metadata'].get('hierarchy'), 'sha256': _chunk_digest(chunk)}
+        for chunk in chunks
+    ]
+    
+    mismatches = [
+        (i, want, got)
+        for i, (want, got) in enumerate(zip(expected, actual))
+        if want != got
+    ]
+    for i, want, got in mismatches[:5]:
+        print(f"Chunk {i}: expected {want['hierarchy']} ({want['sha256'][:12]}), got {got['hierarchy']} ({got['sha256'][:12]})")
+    if len(expected) != len(actual):
+        print(f"Chunk count differs: expected {len(expected)}, got {len(actual)}")
+    
+    ok = not mismatches and len(expected) == len(actual)
+    print(f"Golden check {'passed' if ok else 'FAILED'} ({len(actual)} chunks)")
+    return ok
+
+
+def _slugify(text):
+    """Turn a hierarchy level like "Sub-article (1)" into "sub-article-1"."""
+    return re.sub(r'[^a-z0-9]+', '-', text.lower()).strip('-')
+
+
+def assign_chunk_ids(chunks):
+    """
+    Yield chunks with a stable ID derived from their hierarchy and a hash of their content:
+    - chunk_id: e.g. "part-7/article-76/sub-article-1#0" (the suffix numbers
+      repeated hierarchies in document order)
+    - content_hash: changes whenever the chunk text changes
+    Both are stored in the chunk metadata.
+    """
+    seen = {}
+    
+    for chunk in chunks:
+        metadata = chunk['metadata']
+        levels = metadata.get('hierarchy', 'general').split(' → ')
+        base_id = '/'.join(_slugify(level) for level in levels)
+        
+        occurrence = seen.get(base_id, 0)
+        seen[base_id] = occurrence + 1
+        
+        metadata['chunk_id'] = f"{base_id}#{occurrence}"
+        metadata['content_hash'] = hashlib.sha256(chunk['content'].encode('utf-8')).hexdigest()[:16]
+        
+        yield chunk
+
+
+class TokenRateLimiter:
+    """Blocks callers so that no more than `tokens_per_minute` tokens are sent per minute."""
+    
+    def __init__(self, tokens_per_minute):
+        self.tokens_per_minute = tokens_per_minute
+        self._available = tokens_per_minute
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def acquire(self, tokens):
+        tokens = min(tokens, self.tokens_per_minute)
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._available = min(
+                    self.tokens_per_minute,
+                    self._available + (now - self._updated) * self.tokens_per_minute / 60,
+                )
+                self._updated = now
+                
+                if self._available >= tokens:
+                    self._available -= tokens
+                    return
+                
+                wait = (tokens - self._available) * 60 / self.tokens_per_minute
+            time.sleep(wait)
+
+
+def make_embedding_batches(chunks, batch_size=EMBEDDING_BATCH_SIZE, max_batch_tokens=MAX_BATCH_TOKENS):
+    """Group chunks into batches capped by both item count and estimated tokens."""
+    batch = []
+    batch_tokens = 0
+    
+    for chunk in chunks:
+        tokens = count_tokens(chunk['content'])
+        if batch and (len(batch) >= batch_size or batch_tokens + tokens > max_batch_tokens):
+            yield batch, batch_tokens
+            batch = []
+            batch_tokens = 0
+        batch.append(chunk)
+        batch_tokens += tokens
+    
+    if batch:
+        yield batch, batch_tokens
+
+
+def _retry_delay(error, attempt):
+    """Seconds to wait before retrying, honouring a Retry-After header when present."""
+    response = getattr(error, 'response', None)
+    headers = getattr(response, 'headers', None) or {}
+    retry_after = headers.get('retry-after')
+    if retry_after:
+        try:
+            return float(retry_after)
+        except ValueError:
+            pass
+    return min(60.0, 2 ** attempt) + random.uniform(0, 1)
+
+
+def _embed_with_retry(embedding_model, texts, tokens, rate_limiter=None, max_retries=MAX_RETRIES):
+    for attempt in range(max_retries + 1):
+        if rate_limiter:
+            rate_limiter.acquire(tokens)
+        try:
+            return embedding_model.embed_documents(texts)
+        except Exception as e:
+            if attempt == max_retries:
+                raise
+            delay = _retry_delay(e, attempt)
+            print(f"Embedding batch failed ({e}); retrying in {delay:.1f}s")
+            time.sleep(delay)
+
+
+def embed_chunks(
+    chunks,
+    embedding_model,
+    batch_size=EMBEDDING_BATCH_SIZE,
+    workers=EMBEDDING_WORKERS,
+    max_batch_tokens=MAX_BATCH_TOKENS,
+    tokens_per_minute=None,
+    max_retries=MAX_RETRIES,
+):
+    """
+    Embed chunks with bounded concurrency and return their vectors in order.
+    
+    - `chunks` may be a generator: batches are submitted as soon as they fill
+      up, so embedding overlaps with chunking
+    - Batches are capped by `batch_size` items and `max_batch_tokens` estimated tokens
+    - Up to `workers` batches are in flight at once
+    - Failed batches are retried with exponential backoff (or the server's Retry-After)
+    - `tokens_per_minute` optionally throttles requests to stay under a rate limit
+    - With a `CachedEmbeddings` model every finished batch is stored in the
+      embedding cache (keyed by model tag), so an interrupted run resumes
+      without re-embedding it, and never reuses vectors of another model
+    
+    Point OPENAI_BASE_URL at a local stub server to run this without the OpenAI API.
+    """
+    vectors = {}
+    order = []
+    
+    def pending_chunks():
+        for chunk in chunks:
+            order.append(chunk['metadata']['chunk_id'])
+            yield chunk
+    
+    rate_limiter = TokenRateLimiter(tokens_per_minute) if tokens_per_minute else None
+    futures = {}
+    embedded = 0
+    
+    def collect(future):
+        nonlocal embedded
+        batch = futures.pop(future)
+        for chunk, vector in zip(batch, future.result()):
+            vectors[chunk['metadata']['chunk_id']] = [float(value) for value in vector]
+        embedded += len(batch)
+        print(f"Embedded {embedded} chunks")
+    
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for batch, tokens in make_embedding_batches(pending_chunks(), batch_size, max_batch_tokens):
+            future = executor.submit(
+                _embed_with_retry,
+                embedding_model,
+                [chunk['content'] for chunk in batch],
+                tokens,
+                rate_limiter,
+                max_retries,
+            )
+            futures[future] = batch
+            
+            # Record finished batches while chunking continues
+            for finished in [f for f in futures if f.done()]:
+                collect(finished)
+        
+        for future in as_completed(list(futures)):
+            collect(future)
+    
+    return [vectors[chunk_id] for chunk_id in order]
+
+
+def bulk_upsert(vectorstore, chunks, embeddings, batch_size=UPSERT_BATCH_SIZE):
+    """Write precomputed vectors straight into the Chroma collection."""
+    for start in range(0, len(chunks), batch_size):
+        batch = chunks[start:start + batch_size]
+        vectorstore._collection.upsert(
+            ids=[chunk['metadata']['chunk_id'] for chunk in batch],
+            embeddings=embeddings[start:start + batch_size],
+            documents=[chunk['content'] for chunk in batch],
+            metadatas=[chunk['metadata'] for chunk in batch],
+        )
+
+
+def sync_vector_store(vectorstore, chunks, **embedding_options):
+    """
+    Bring a Chroma collection in line with `chunks` using their stable IDs:
+    - new or changed chunks (by content hash) are embedded in parallel
+      batches (see `embed_chunks`) and bulk-upserted
+    - chunks no longer produced by the chunker are deleted
+    - unchanged chunks are left alone and cost no embedding calls
+    `chunks` may be a generator, in which case embedding starts while it is
+    still producing chunks. Returns a report of what changed, along with
+    all chunks seen.
+    """
+    existing = vectorstore.get(include=["metadatas"])
+    existing_hashes = {
+        chunk_id: (metadata or {}).get('content_hash')
+        for chunk_id, metadata in zip(existing["ids"], existing["metadatas"])
+    }
+    
+    all_chunks = []
+    added = []
+    updated = []
+    to_upsert = []
+    
+    def changed_chunks():
+        for chunk in chunks:
+            all_chunks.append(chunk)
+            chunk_id = chunk['metadata']['chunk_id']
+            if chunk_id not in existing_hashes:
+                added.append(chunk)
+            elif existing_hashes[chunk_id] != chunk['metadata']['content_hash']:
+                updated.append(chunk)
+            else:
+                continue
+            to_upsert.append(chunk)
+            yield chunk
+    
+    embeddings = embed_chunks(changed_chunks(), vectorstore.embeddings, **embedding_options)
+    if to_upsert:
+        bulk_upsert(vectorstore, to_upsert, embeddings)
+    
+    current_ids = {chunk['metadata']['chunk_id'] for chunk in all_chunks}
+    stale_ids = [chunk_id for chunk_id in existing_hashes if chunk_id not in current_ids]
+    
+    if stale_ids:
+        vectorstore.delete(ids=stale_ids)
+    
+    return {
+        'added': [chunk['metadata']['chunk_id'] for chunk in added],
+        'updated': [chunk['metadata']['chunk_id'] for chunk in updated],
+        'deleted': stale_ids,
+        'unchanged': len(all_chunks) - len(to_upsert),
+        'chunks': all_chunks,
+    }
+
+
+def create_vector_store(
+    chunks,
+    persist_directory=PERSIST_DIRECTORY,
+    full_rebuild=False,
+    embedding_backend=None,
+    embedding_model=None,
+    **embedding_options
+):
+    """
+    Create or incrementally update the persisted ChromaDB vector store.
+    
+    By default only new or changed chunks are embedded and stale ones are
+    deleted; `full_rebuild` empties the collection first. `embedding_options`
+    are passed to `embed_chunks` (batch size, workers, token limits).
+    Returns the vector store and the list of all chunks.
+    
+    Chunks are embedded with the configured backend (RAG_EMBEDDING_BACKEND /
+    RAG_EMBEDDING_MODEL) unless `embedding_backend`/`embedding_model` are
+    given. The model is recorded on the collection; updating a collection
+    embedded with another model is refused, as its vectors would not be
+    comparable (rebuild it with `full_rebuild`).
+    """
     print("Creating embeddings and storing in local ChromaDB...")
     
     # Ensure directory exists
     os.makedirs(persist_directory, exist_ok=True)
     
-    # Convert chunks with metadata → Document objects
-    documents = []
-    for chunk in chunks:
-        doc = Document(
-            page_content=chunk['content'],
-            metadata=chunk['metadata']
-        )
-        documents.append(doc)
+    tag = embedding_model_tag(embedding_backend, embedding_model)
+    print(f"Embedding model: {tag}")
     
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
+    # Unchanged chunks are served from the embedding cache on re-ingestion
+    embeddings = CachedEmbeddings(
+        create_embeddings(embedding_backend, embedding_model),
+        embedding_cache_path(persist_directory),
+    )
     
     print("--- Creating vector store ---")
-    vectorstore = Chroma.from_documents(
-        documents=documents,
-        embedding=embedding_model,
+    vectorstore = Chroma(
+        embedding_function=embeddings,
         persist_directory=persist_directory,
-        collection_metadata={"hnsw:space": "cosine"}
+        collection_metadata={"hnsw:space": "cosine", EMBEDDING_MODEL_KEY: tag}
     )
     
+    if full_rebuild:
+        print("Full rebuild: clearing existing collection")
+        vectorstore.reset_collection()
+    else:
+        check_embedding_model(vectorstore, tag)
+    
+    report = sync_vector_store(vectorstore, chunks, **embedding_options)
+    
     print("--- Finished creating vector store ---")
-    print(f"Vector store created and saved to {persist_directory}")
+    print(
+        f"Added: {len(report['added'])}, Updated: {len(report['updated'])}, "
+        f"Deleted: {len(report['deleted'])}, Unchanged: {report['unchanged']}"
+    )
+    for label in ('added', 'updated', 'deleted'):
+        for chunk_id in report[label][:10]:
+            print(f"  {label}: {chunk_id}")
+        if len(report[label]) > 10:
+            print(f"  ... and {len(report[label]) - 10} more {label}")
+    print(f"Vector store saved to {persist_directory}")
     
-    return vectorstore
+    return vectorstore, report['chunks']
 
 
 def main():
+    parser = argparse.ArgumentParser(description="Ingest the Constitution into ChromaDB")
+    parser.add_argument(
+        "--corpus",
+        default=DEFAULT_CORPUS,
+        help="Corpus to ingest, from data/corpora.json (default: RAG_DEFAULT_CORPUS or nepal)",
+    )
+    parser.add_argument(
+        "--full",
+        action="store_true",
+        help="Rebuild the whole collection instead of updating changed chunks only",
+    )
+    parser.add_argument("--batch-size", type=int, default=EMBEDDING_BATCH_SIZE, help="Chunks per embedding request")
+    parser.add_argument("--workers", type=int, default=EMBEDDING_WORKERS, help="Concurrent embedding requests")
+    parser.add_argument("--max-batch-tokens", type=int, default=MAX_BATCH_TOKENS, help="Estimated token cap per embedding request")
+    parser.add_argument("--tokens-per-minute", type=int, default=None, help="Throttle embedding requests to this token rate")
+    parser.add_argument(
+        "--embedding-backend",
+        choices=list(DEFAULT_MODELS),
+        default=None,
+        help="Embedding backend (default: RAG_EMBEDDING_BACKEND or openai); changing it requires --full",
+    )
+    parser.add_argument("--embedding-model", default=None, help="Embedding model name (default: the backend's default)")
+    parser.add_argument(
+        "--verify-golden",
+        action="store_true",
+        help="Only chunk the corpus's PDF and compare the output with its golden chunk file",
+    )
+    parser.add_argument(
+        "--write-golden",
+        action="store_true",
+        help="Only chunk the corpus's PDF and record the output as its golden chunk file",
+    )
+    args = parser.parse_args()
+    
+    try:
+        corpus = get_corpus(args.corpus)
+    except UnknownCorpus as e:
+        parser.error(str(e))
+    
+    if args.verify_golden or args.write_golden:
+        if args.verify_golden and not os.path.exists(corpus.golden_chunks):
+            parser.error(f"No golden chunk file for corpus {corpus.name!r} ({corpus.golden_chunks}); record one with --write-golden")
+        chunks = chunk_documents(lazy_load_documents(corpus.document))
+        if args.write_golden:
+            write_golden_chunks(chunks, corpus.golden_chunks)
+            return
+        raise SystemExit(0 if verify_golden_chunks(chunks, corpus.golden_chunks) else 1)
+    
     print("Main Function:")
-    documents = load_documents()
+    print(f"Corpus: {corpus.name} ({corpus.title}) from {corpus.document}")
+    persist_directory = corpus.persist_directory
     
-    print("Chunks:\n")
-    chunks = chunk_documents(documents)
+    # Pages are parsed lazily and chunks are embedded while later pages are still being chunked
+    chunk_stream = assign_chunk_ids(iter_chunks(lazy_load_documents(corpus.document)))
     
+    collection, chunks = create_vector_store(
+        chunk_stream,
+        persist_directory=persist_directory,
+        full_rebuild=args.full,
+        embedding_backend=args.embedding_backend,
+        embedding_model=args.embedding_model,
+        batch_size=args.batch_size,
+        workers=args.workers,
+        max_batch_tokens=args.max_batch_tokens,
+        tokens_per_minute=args.tokens_per_minute,
+    )
+    print(collection)
+    
+    print("Chunks:\n")
     # Display first few chunks with metadata
     for i, chunk in enumerate(chunks[:5]):
         print(f"\n--- Chunk {i+1} ---")
@@ -242,9 +743,20 @@ def main():
         print(f"Content: {chunk['content'][:200]}...")
     
     print(f"\n... and {len(chunks) - 5} more chunks")
-    
-    collection = create_vector_store(chunks)
-    print(collection)
+
+    index_path = article_index_path(persist_directory)
+    ArticleIndex(chunks).save(index_path)
+    print(f"Article index saved to {index_path}")
+
+    bm25_path = bm25_index_path(persist_directory)
+    BM25Index(chunks).save(bm25_path)
+    print(f"BM25 index saved to {bm25_path}")
+
+    # Read back from the collection, so unchanged chunks keep their stored vectors
+    matrix_path = embedding_matrix_path(persist_directory)
+    matrix = EmbeddingMatrix.from_collection(collection, collection_embedding_model(collection))
+    matrix.save(matrix_path)
+    print(f"Chunk embeddings ({len(matrix)} x {matrix.matrix.shape[1]}) saved to {matrix_path}")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,119 @@
+import numpy as np
+
+from embedding_matrix import unit_rows
+
+
+class NumpyVectorStore:
+    """
+    Exact (brute-force) vector search over every chunk held in one
+    contiguous float32 array.
+
+    For a corpus of a few thousand chunks a single matrix product scores
+    every query variation against every chunk faster than an HNSW lookup,
+    with exact results. `query` mirrors the Chroma collection method the
+    pipeline uses (multi-query, `n_results`, `where` metadata filters), so
+    either store can back retrieval.
+    """
+
+    def __init__(self, article_index, embedding_matrix):
+        self.article_index = article_index
+        self.embedding_matrix = embedding_matrix
+
+        self.chunks = []
+        rows = []
+        for chunk in article_index.chunks:
+            row = embedding_matrix.row(chunk["metadata"].get("chunk_id"))
+            if row is not None:
+                self.chunks.append(chunk)
+                rows.append(row)
+
+        # Copied out of the memory map into one contiguous block
+        dimensions = embedding_matrix.matrix.shape[1]
+        self.vectors = np.ascontiguousarray(
+            embedding_matrix.matrix[np.asarray(rows, dtype=np.int64)] if rows else np.empty((0, dimensions)),
+            dtype=np.float32,
+        )
+        self._columns = {}
+
+    def __len__(self):
+        return len(self.chunks)
+
+    def _column(self, key):
+        """Metadata values of every chunk for `key`, as an array for vectorized filters."""
+        if key not in self._columns:
+            self._columns[key] = np.array(
+                [chunk["metadata"].get(key) for chunk in self.chunks], dtype=object
+            )
+        return self._columns[key]
+
+    def _mask(self, where):
+        """
+        Boolean row mask for a Chroma-style filter: `{"part": "Part 3"}`,
+        `{"article": {"$in": [...]}}`, `{"$and": [...]}` or `{"$or": [...]}`.
+        """
+        mask = np.ones(len(self.chunks), dtype=bool)
+
+        for key, condition in where.items():
+            if key in ("$and", "$or"):
+                masks = [self._mask(clause) for clause in condition]
+                combined = np.logical_and.reduce(masks) if key == "$and" else np.logical_or.reduce(masks)
+                mask &= combined
+                continue
+
+            column = self._column(key)
+            if not isinstance(condition, dict):
+                condition = {"$eq": condition}
+
+            for operator, value in condition.items():
+                if operator == "$eq":
+                    mask &= column == value
+                elif operator == "$ne":
+                    mask &= column != value
+                elif operator in ("$in", "$nin"):
+                    values = set(value)
+                    found = np.fromiter((item in values for item in column), dtype=bool, count=len(column))
+                    mask &= found if operator == "$in" else ~found
+                else:
+                    raise ValueError(f"Unsupported filter operator {operator!r}")
+
+        return mask
+
+    def query(self, query_embeddings, n_results=6, where=None, include=None):
+        """
+        Return the `n_results` nearest chunks of every query embedding, in
+        Chroma's multi-query result format (`ids`, `documents`, `metadatas`
+        and cosine `distances`, one list per query).
+
+        All queries are scored with one matrix product; the top k of each
+        are selected with `argpartition`, so only they are sorted.
+        """
+        rows = np.arange(len(self.chunks))
+        vectors = self.vectors
+        if where:
+            rows = np.flatnonzero(self._mask(where))
+            vectors = self.vectors[rows]
+
+        queries = unit_rows(query_embeddings)
+        results = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+
+        k = min(n_results, len(rows))
+        if k == 0:
+            for key in results:
+                results[key] = [[] for _ in queries]
+            return results
+
+        similarities = queries @ vectors.T
+        top = np.argpartition(-similarities, k - 1, axis=1)[:, :k]
+        top_scores = np.take_along_axis(similarities, top, axis=1)
+        order = np.argsort(-top_scores, axis=1, kind="stable")
+        top = np.take_along_axis(top, order, axis=1)
+        top_scores = np.take_along_axis(top_scores, order, axis=1)
+
+        for query_rows, scores in zip(rows[top].tolist(), top_scores.tolist()):
+            chunks = [self.chunks[row] for row in query_rows]
+            results["ids"].append([chunk["metadata"].get("chunk_id") for chunk in chunks])
+            results["documents"].append([chunk["content"] for chunk in chunks])
+            results["metadatas"].append([chunk["metadata"] for chunk in chunks])
+            results["distances"].append([1.0 - score for score in scores])
+
+        return results
@@ -0,0 +1,99 @@
+from functools import lru_cache
+
+from context_builder import strip_prefix
+
+DEFAULT_TITLE = "Constitution of Nepal"
+
+# Identical on every request to a corpus and sent first, so the provider can
+# reuse the cached prompt prefix across questions
+SYSTEM_PROMPT_TEMPLATE = """You are a constitutional law expert specializing in the {title}.
+
+Your task is to provide detailed, well-structured answers based on the constitutional text provided.
+
+FORMATTING RULES:
+1. Start with the main Part and Article title (e.g., "📘 Part 7 – Federal Executive | Article 76 – Appointment of Prime Minister")
+2. Break down the answer by Sub-articles, clearly labeled (e.g., "🔹 Sub-article (1)")
+3. For each sub-article, list the clauses if they exist (e.g., "(a)", "(b)", "(c)")
+4. Use the EXACT hierarchy from the constitution: Part → Article → Sub-article → Clause
+5. If multiple articles are relevant, present each one separately with clear headers
+6. Use emojis for visual clarity: 📘 for Parts, 🔹 for Sub-articles, • for clauses
+7. Present sub-articles in numerical order (1, 2, 3, etc.)
+
+CONTENT RULES:
+1. Only use information from the provided constitutional text
+2. Paraphrase the content clearly while maintaining legal accuracy
+3. If the constitution doesn't address the question, say: "The {title} does not address this question."
+4. Always cite the exact Part, Article, and Sub-article numbers
+5. Present ALL relevant sub-articles in order - don't skip any
+6. Combine information from multiple chunks of the same sub-article if needed
+
+EXAMPLE FORMAT:
+📘 Part X – [Part Name]
+Article Y – [Article Title]
+
+🔹 Sub-article (1)
+As per Part X, Article Y, Sub-article (1):
+(a) [Content of clause a]
+(b) [Content of clause b]
+
+🔹 Sub-article (2)
+As per Part X, Article Y, Sub-article (2):
+[Content if no clauses, or list clauses if they exist]
+"""
+
+
+def system_prompt(title=DEFAULT_TITLE):
+    """The system prompt for a corpus, e.g. "Constitution of Nepal"."""
+    return SYSTEM_PROMPT_TEMPLATE.format(title=title)
+
+# The question comes last, so requests that retrieve the same articles
+# share the longest possible prefix
+USER_PROMPT_TEMPLATE = """Constitutional Text:
+{context}
+
+Question: {query}
+
+Please provide a comprehensive answer following the formatting rules. Include ALL relevant sub-articles in numerical order."""
+
+
+@lru_cache(maxsize=1024)
+def article_header(part, article, article_title):
+    """Render the banner that opens an article in the structured context."""
+    header = f"\n{'=' * 60}\n"
+    if part != "Unknown":
+        header += f"📘 {part}"
+        if article != "Unknown":
+            header += f" | {article}"
+            if article_title:
+                header += f" – {article_title}"
+    header += f"\n{'=' * 60}"
+    return header
+
+
+def format_block(content, metadata):
+    """Render one chunk of the structured context: its sub-article/clause labels and indented text."""
+    labels = []
+
+    if metadata.get("subarticles"):
+        labels.append(f"  🔹 {', '.join(metadata['subarticles'])}")
+    elif "subarticle" in metadata:
+        labels.append(f"  🔹 {metadata['subarticle']}")
+    if "clause" in metadata:
+        labels.append(f"    • {metadata['clause']}")
+
+    indented_content = "\n".join("    " + line for line in content.split("\n"))
+
+    if labels:
+        return "\n".join(labels) + "\n\n" + indented_content
+    return indented_content
+
+
+def chunk_block(chunk):
+    """Render an ingested chunk, without its retrieval prefix, for the article index."""
+    metadata = chunk["metadata"] or {}
+    return format_block(strip_prefix(chunk["content"], metadata), metadata)
+
+
+def user_prompt(query, context):
+    """Fill the user prompt template with the structured context and the question."""
+    return USER_PROMPT_TEMPLATE.format(context=context, query=query)
@@ -0,0 +1,156 @@
+import json
+import os
+import re
+from functools import lru_cache
+
+# Synonym and topic booster rules; edit the file (no code changes) to add topics
+QUERY_EXPANSION_RULES = os.getenv(
+    "RAG_QUERY_EXPANSION_RULES",
+    os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "query_expansion.json"),
+)
+
+# Most query variations searched per question (the original included), and
+# the cosine similarity above which a variation is dropped as a near
+# duplicate of one already kept (1 keeps them all)
+MAX_QUERY_VARIATIONS = int(os.getenv("RAG_MAX_QUERY_VARIATIONS", "8"))
+VARIATION_SIMILARITY_THRESHOLD = float(os.getenv("RAG_VARIATION_SIMILARITY_THRESHOLD", "0.95"))
+
+# Word endings under which a synonym is still rewritten ("citizens" → "nationals")
+_SYNONYM_SUFFIXES = ("", "s")
+
+
+def _normalize(text):
+    return " ".join(text.lower().split())
+
+
+class QueryExpander:
+    """
+    Query expansion compiled from a rules table.
+
+    Every synonym and booster trigger term is matched with one combined
+    regular expression, in a single pass over the lowercased query. Terms
+    match at the start of a word ("elect" matches "elected" and
+    "election"); synonyms are only rewritten as whole words or plurals.
+
+    Rules:
+    - `stop_words`: dropped from the key-terms variation
+    - `synonyms`: term → alternatives, one rewritten query per alternative
+    - `boosters`: topic → `{"when": [[term, ...], ...], "queries": [...]}`;
+      the fixed queries are added when all terms of any `when` group match
+    """
+
+    def __init__(self, stop_words, synonyms, boosters):
+        self.stop_words = frozenset(stop_words)
+        self.synonyms = {term.lower(): list(alternatives) for term, alternatives in synonyms.items()}
+        self.boosters = {
+            topic: ([[term.lower() for term in group] for group in rule["when"]], list(rule["queries"]))
+            for topic, rule in boosters.items()
+        }
+
+        terms = set(self.synonyms)
+        for groups, _ in self.boosters.values():
+            terms.update(term for group in groups for term in group)
+
+        # A lookahead finds a term at every word start, even inside a longer
+        # match ("rights" in "fundamental rights"); shorter terms that start
+        # the matched one ("elect" in "elected") are implied by it
+        alternatives = "|".join(re.escape(term) for term in sorted(terms, key=len, reverse=True))
+        self._pattern = re.compile(rf"\b(?=({alternatives})(\w*))") if terms else None
+        self._implied = {
+            term: [other for other in terms if term.startswith(other)] for term in terms
+        }
+
+    @classmethod
+    def from_file(cls, path):
+        with open(path, encoding="utf-8") as f:
+            rules = json.load(f)
+        return cls(rules.get("stop_words", []), rules.get("synonyms", {}), rules.get("boosters", {}))
+
+    @property
+    def booster_queries(self):
+        """Every fixed booster query, in rule order."""
+        return [query for _, queries in self.boosters.values() for query in queries]
+
+    def matches(self, query):
+        """Map each term found in the lowercased query to its `(start, end, suffix)` spans."""
+        found = {}
+        if self._pattern is None:
+            return found
+
+        for match in self._pattern.finditer(query.lower()):
+            start, longest, suffix = match.start(), match.group(1), match.group(2)
+            for term in self._implied[longest]:
+                end = start + len(term)
+                found.setdefault(term, []).append((start, end, longest[len(term):] + suffix))
+        return found
+
+    def key_terms(self, query):
+        """Words of the query that are not stop words and longer than three letters."""
+        words = (word.strip("?.,;:!\"'()") for word in query.lower().split())
+        return [word for word in words if word not in self.stop_words and len(word) > 3]
+
+    def expand(self, query, max_variations=MAX_QUERY_VARIATIONS):
+        """
+        Return the query followed by its variations, without duplicates and
+        at most `max_variations` long: topic boosters first (they pin the
+        key articles), then the key terms, then the synonym rewrites.
+        """
+        lowered = query.lower()
+        found = self.matches(query)
+
+        variations = [query]
+        for groups, queries in self.boosters.values():
+            if any(all(term in found for term in group) for group in groups):
+                variations.extend(queries)
+
+        key_terms = self.key_terms(query)
+        if key_terms:
+            variations.append(" ".join(key_terms))
+
+        for term, alternatives in self.synonyms.items():
+            spans = [(start, end) for start, end, suffix in found.get(term, ()) if suffix in _SYNONYM_SUFFIXES]
+            if not spans:
+                continue
+            for alternative in alternatives:
+                parts, position = [], 0
+                for start, end in spans:
+                    parts.append(lowered[position:start])
+                    parts.append(alternative)
+                    position = end
+                parts.append(lowered[position:])
+                variations.append("".join(parts))
+
+        unique = {}
+        for variation in variations:
+            unique.setdefault(_normalize(variation), variation)
+        return list(unique.values())[: max(1, max_variations)]
+
+
+@lru_cache(maxsize=None)
+def load_query_expander(path=QUERY_EXPANSION_RULES):
+    """Load and compile the expansion rules once per process."""
+    return QueryExpander.from_file(path)
+
+
+def dedupe_by_similarity(variations, vectors, threshold=VARIATION_SIMILARITY_THRESHOLD):
+    """
+    Drop variations whose embedding is within `threshold` cosine similarity
+    of an earlier kept one, so near-identical rewrites are not searched
+    twice. The first variation (the original query) is always kept.
+
+    Returns the kept `(variations, vectors)`.
+    """
+    if len(variations) < 2 or threshold >= 1:
+        return list(variations), list(vectors)
+
+    from embedding_matrix import unit_rows
+
+    units = unit_rows(vectors)
+    similarities = units @ units.T
+
+    kept = [0]
+    for i in range(1, len(variations)):
+        if similarities[i, kept].max() < threshold:
+            kept.append(i)
+
+    return [variations[i] for i in kept], [vectors[i] for i in kept]
@@ -1,23 +1,82 @@
+import asyncio
+import os
 import sys
-from collections import defaultdict
+import threading
+import time
+from collections import OrderedDict, defaultdict
+from functools import lru_cache
 
 from dotenv import load_dotenv
-from langchain_chroma import Chroma
-from langchain_core.messages import HumanMessage, SystemMessage
-from langchain_openai import ChatOpenAI, OpenAIEmbeddings
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+# Only lightweight modules are imported here. LangChain, OpenAI, Chroma,
+# httpx and numpy are imported on first use, so importing this module (e.g.
+# for the formatting helpers) stays fast and needs no database on disk.
+from article_index import ArticleIndex, article_index_path  # noqa: E402
+from bm25_index import BM25Index, bm25_index_path  # noqa: E402
+from citations import format_citation, parse_citations, resolve_citations  # noqa: E402
+from corpora import MAX_LOADED_CORPORA, get_corpus, load_corpora  # noqa: E402
+from context_builder import CONTEXT_TOKEN_BUDGET, assemble_context, chunk_key, hierarchy_key  # noqa: E402
+from embedding_backends import (  # noqa: E402
+    EMBEDDING_BACKEND,
+    EMBEDDING_MODEL,
+    EMBEDDING_MODEL_KEY,
+    check_embedding_model,
+    create_embeddings,
+    embedding_model_tag,
+)
+from prompts import DEFAULT_TITLE, article_header, format_block, system_prompt, user_prompt  # noqa: E402
+from query_expansion import QUERY_EXPANSION_RULES, dedupe_by_similarity, load_query_expander  # noqa: E402
+from timings import Metrics, Trace, count, span  # noqa: E402
+from tokenizer import count_tokens  # noqa: E402
 
 load_dotenv()
 
 persistent_directory = "./db/chroma_db"
 
-# Load embeddings and vector store
-embedding_model = OpenAIEmbeddings(model="text-embedding-3-small")
-
-db = Chroma(
-    persist_directory=persistent_directory,
-    embedding_function=embedding_model,
-    collection_metadata={"hnsw:space": "cosine"},
-)
+CHAT_MODEL = "gpt-4o"
+
+# Upper bound on concurrent embedding/Chroma/LLM calls made by the async
+# pipeline, and how many query variations are embedded per async batch
+MAX_CONCURRENCY = int(os.getenv("RAG_MAX_CONCURRENCY", "8"))
+EXPANSION_BATCH_SIZE = int(os.getenv("RAG_EXPANSION_BATCH_SIZE", "4"))
+
+# Batch answering: query variations embedded/searched per call, and LLM
+# generations one batch may run at once (leaving pipeline slots for others)
+BATCH_EMBEDDING_SIZE = int(os.getenv("RAG_BATCH_EMBEDDING_SIZE", "64"))
+BATCH_LLM_CONCURRENCY = int(os.getenv("RAG_BATCH_LLM_CONCURRENCY", "4"))
+
+# Connection pool shared by the OpenAI embedding and chat clients; idle
+# connections are kept alive between requests
+HTTP_MAX_CONNECTIONS = int(os.getenv("RAG_HTTP_MAX_CONNECTIONS", "20"))
+HTTP_MAX_KEEPALIVE = int(os.getenv("RAG_HTTP_MAX_KEEPALIVE", "10"))
+HTTP_KEEPALIVE_EXPIRY = float(os.getenv("RAG_HTTP_KEEPALIVE_EXPIRY", "60"))
+HTTP_TIMEOUT = float(os.getenv("RAG_HTTP_TIMEOUT", "60"))
+HTTP_CONNECT_TIMEOUT = float(os.getenv("RAG_HTTP_CONNECT_TIMEOUT", "5"))
+OPENAI_MAX_RETRIES = int(os.getenv("RAG_OPENAI_MAX_RETRIES", "2"))
+
+# Hybrid retrieval: BM25 hits for the original query are fused with the
+# vector results of every query variation using reciprocal rank fusion
+HYBRID_SEARCH = os.getenv("RAG_HYBRID_SEARCH", "1") != "0"
+BM25_TOP_K = int(os.getenv("RAG_BM25_TOP_K", "20"))
+RRF_K = int(os.getenv("RAG_RRF_K", "60"))
+
+# Explicit "Article N" / "Part N" references are answered from the article
+# index without query expansion, embeddings or vector search
+CITATION_FAST_PATH = os.getenv("RAG_CITATION_FAST_PATH", "1") != "0"
+
+# Candidates are reranked by cosine similarity to the query and its
+# variations ("max" or "mean" over them; "off" keeps BM25 order only),
+# using the chunk embedding matrix exported at ingestion, weighted against
+# the normalized BM25 score
+RERANK_POOLING = os.getenv("RAG_RERANK_POOLING", "max")
+RERANK_WEIGHT = float(os.getenv("RAG_RERANK_WEIGHT", "1.0"))
+
+# Vector search backend: "chroma" (HNSW index in the persisted collection)
+# or "numpy" (exact search over the exported chunk embedding matrix, held
+# in memory; faster for a corpus of a few thousand chunks)
+VECTOR_STORE = os.getenv("RAG_VECTOR_STORE", "chroma")
 
 
 def format_document_with_metadata(doc):
@@ -62,255 +121,308 @@ def group_docs_by_article(docs):
     return grouped
 
 
-def create_structured_context(docs):
-    """Create a structured context from documents with metadata."""
-    grouped = group_docs_by_article(docs)
+def sorted_article_groups(docs):
+    """Group documents by article, with each group sorted by subarticle and clause."""
+    for key, doc_list in group_docs_by_article(docs).items():
+        sorted_docs = sorted(doc_list, key=lambda d: hierarchy_key(d.metadata))
+        yield key, sorted_docs
 
-    context_parts = []
 
-    for (part, article, article_title), doc_list in grouped.items():
-        # Header for this article
-        header = f"\n{'=' * 60}\n"
-        if part != "Unknown":
-            header += f"📘 {part}"
-            if article != "Unknown":
-                header += f" | {article}"
-                if article_title:
-                    header += f" – {article_title}"
-        header += f"\n{'=' * 60}"
-
-        context_parts.append(header)
-
-        # Sort documents by subarticle and clause
-        sorted_docs = sorted(
-            doc_list,
-            key=lambda d: (
-                d.metadata.get("subarticle", ""),
-                d.metadata.get("clause", ""),
-            ),
-        )
+def create_context_hierarchy(docs):
+    """
+    Describe the Part → Article → Sub-article hierarchy of a context, in the
+    same order as `create_structured_context` renders it.
+    """
+    hierarchy = []
 
+    for (part, article, article_title), sorted_docs in sorted_article_groups(docs):
+        subarticles = []
         for doc in sorted_docs:
-            metadata = doc.metadata
-            sub_parts = []
+            # Merged blocks list every sub-article they cover
+            for subarticle in doc.metadata.get("subarticles") or [doc.metadata.get("subarticle")]:
+                if subarticle and subarticle not in subarticles:
+                    subarticles.append(subarticle)
+
+        hierarchy.append(
+            {
+                "part": part,
+                "part_name": sorted_docs[0].metadata.get("part_name", ""),
+                "article": article,
+                "article_title": article_title,
+                "subarticles": subarticles,
+            }
+        )
 
-            if "subarticle" in metadata:
-                sub_parts.append(f"  🔹 {metadata['subarticle']}")
-            if "clause" in metadata:
-                sub_parts.append(f"    • {metadata['clause']}")
+    return hierarchy
 
-            if sub_parts:
-                context_parts.append("\n".join(sub_parts))
 
-            # Indent the content
-            content_lines = doc.page_content.split("\n")
-            indented_content = "\n".join(["    " + line for line in content_lines])
-            context_parts.append(indented_content)
+def _context_block(doc, blocks):
+    if blocks is not None:
+        # Merged blocks are the concatenation of their chunks' blocks
+        chunk_ids = doc.metadata.get("chunk_ids") or [doc.metadata.get("chunk_id")]
+        precomputed = [blocks(chunk_id) for chunk_id in chunk_ids]
+        if all(precomputed):
+            return "\n\n".join(precomputed)
+
+    return format_block(doc.page_content, doc.metadata)
+
+
+def create_structured_context(docs, blocks=None):
+    """
+    Create a structured context from documents with metadata.
+
+    `blocks` maps a chunk ID to its precomputed context block (e.g.
+    `ArticleIndex.block`); chunks without one are formatted on the fly.
+    """
+    context_parts = []
+
+    for (part, article, article_title), sorted_docs in sorted_article_groups(docs):
+        context_parts.append(article_header(part, article, article_title))
+        context_parts.extend(_context_block(doc, blocks) for doc in sorted_docs)
 
     return "\n\n".join(context_parts)
 
 
 def extract_key_terms(query):
     """Extract key terms from the query for better search."""
-    # Common words to ignore
-    stop_words = {
-        "how",
-        "what",
-        "when",
-        "where",
-        "who",
-        "why",
-        "is",
-        "are",
-        "the",
-        "a",
-        "an",
-        "in",
-        "of",
-        "to",
-        "for",
-        "and",
-        "or",
-        "nepal",
-        "constitution",
-    }
-
-    words = query.lower().split()
-    key_terms = [w for w in words if w not in stop_words and len(w) > 3]
-
-    return key_terms
+    return load_query_expander().key_terms(query)
 
 
 def expand_query(original_query):
-    """Expand query with synonyms and variations for better retrieval."""
-    expansions = [original_query]
-
-    # Extract key terms from the query
-    key_terms = extract_key_terms(original_query)
-
-    # Add variations with common term replacements
-    replacements = {
-        "elected": ["appointed", "selected", "chosen"],
-        "rights": ["freedoms", "liberties", "entitlements"],
-        "duties": ["responsibilities", "obligations"],
-        "president": ["head of state"],
-        "parliament": ["legislature", "house of representatives"],
-        "government": ["executive", "administration"],
-        "law": ["act", "legislation", "statute"],
-        "citizen": ["national", "people"],
-    }
-
-    for original, alternatives in replacements.items():
-        if original in original_query.lower():
-            for alt in alternatives:
-                expansions.append(original_query.lower().replace(original, alt))
-
-    # Add a simplified version with just key terms
-    if key_terms:
-        expansions.append(" ".join(key_terms))
-
-    # Topic-specific boosters to ensure key articles are found
-    query_lower = original_query.lower()
-
-    if "prime minister" in query_lower:
-        expansions.extend(
-            [
-                "Article 76 Constitution Council Ministers",
-                "President appoints Prime Minister House Representatives",
-                "Prime Minister majority vote confidence",
-                "Federal Executive Prime Minister appointment",
-            ]
-        )
+    """
+    Expand query with synonyms, key terms and topic boosters for better
+    retrieval, using the compiled rules in data/query_expansion.json. The
+    original query comes first.
+    """
+    return load_query_expander().expand(original_query)
 
-    if "fundamental rights" in query_lower or (
-        "rights" in query_lower and "citizen" in query_lower
-    ):
-        expansions.extend(
-            [
-                "Part 3 Fundamental Rights",
-                "Article 16 right to live with dignity",
-                "freedom expression assembly",
-            ]
-        )
 
-    if "duties" in query_lower and "citizen" in query_lower:
-        expansions.extend(
-            ["Article 48 duties citizens", "responsibilities citizens Nepal"]
-        )
+def _document(content, metadata):
+    from langchain_core.documents import Document
 
-    if "president" in query_lower and (
-        "elect" in query_lower or "appoint" in query_lower
-    ):
-        expansions.extend(
-            [
-                "Article 62 election President",
-                "Electoral College President Vice-President",
-            ]
-        )
+    return Document(page_content=content, metadata=metadata)
 
-    return list(set(expansions))  # Remove duplicates
 
+def _results_to_documents(results):
+    """Convert a multi-query Chroma result into one list of documents per query."""
+    return [
+        [
+            _document(text, metadata or {})
+            for text, metadata in zip(texts, metadatas)
+        ]
+        for texts, metadatas in zip(results["documents"], results["metadatas"])
+    ]
 
-def retrieve_and_answer(query, verbose=True):
-    """Main function to retrieve documents and generate answer."""
 
-    # Expand query for better retrieval
-    query_variations = expand_query(query)
+def citation_docs(query, article_index, verbose=False, max_tokens=CONTEXT_TOKEN_BUDGET, bm25_index=None):
+    """
+    Resolve explicit citations in a query ("Article 48", "Part 3",
+    "Articles 16-18", "Article 76(1)(a)") straight to their chunks, packed
+    into the context token budget (None for no limit).
+
+    When the cited text does not fit (a whole Part can run to hundreds of
+    chunks), the chunks are ranked against the question with `bm25_index`
+    before packing, so the budget goes to the passages the question is
+    about rather than the first articles of the Part.
+
+    Returns an empty list when the query cites nothing that exists, so the
+    caller falls back to the full retrieval pipeline.
+    """
+    citations = parse_citations(query)
+    if not citations:
+        return []
+
+    chunks = resolve_citations(citations, article_index)
+    docs = [_document(chunk["content"], chunk["metadata"]) for chunk in chunks]
+
+    if verbose and chunks:
+        print(f"Citations: {[format_citation(c) for c in citations]}")
+        print(f"Resolved {len(chunks)} chunks from the article index\n")
+
+    _, needed = assemble_context(docs, max_tokens=None)
+    if max_tokens is not None and needed > max_tokens:
+        if bm25_index is not None:
+            query_terms = bm25_index.query_terms(query)
+            scores = {
+                chunk_key(doc): bm25_index.score(
+                    query_terms,
+                    chunk_id=doc.metadata.get("chunk_id"),
+                    content=doc.page_content,
+                    metadata=doc.metadata,
+                )[1]
+                for doc in docs
+            }
+            # Stable: equally relevant chunks stay in document order
+            docs.sort(key=lambda doc: -scores[chunk_key(doc)])
+
+        count("citation_context_truncated")
+        if verbose:
+            print(f"Cited text (~{needed} tokens) exceeds the context budget; keeping the most relevant chunks\n")
+
+    docs, _ = assemble_context(docs, article_index.position, max_tokens)
+    return docs
+
+
+def reciprocal_rank_fusion(rankings, rrf_k=None):
+    """
+    Fuse several ranked lists of documents into one with reciprocal rank
+    fusion: each document scores sum(1 / (rrf_k + rank)) over the lists it
+    appears in.
+    """
+    rrf_k = rrf_k if rrf_k is not None else RRF_K
+    scores = defaultdict(float)
+    docs = {}
+
+    for ranking in rankings:
+        for rank, doc in enumerate(ranking, 1):
+            key = chunk_key(doc)
+            scores[key] += 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+
+    return [docs[key] for key in sorted(scores, key=scores.get, reverse=True)]
+
+
+def bm25_search(query, bm25_index, k=None):
+    """Return the top `k` BM25 matches for a query as documents."""
+    return [
+        _document(chunk["content"], chunk["metadata"])
+        for chunk, _ in bm25_index.search(query, k=k or BM25_TOP_K)
+    ]
 
-    if verbose:
-        print(f"User Query: {query}")
-        print(f"Query Variations: {query_variations[:5]}...")  # Show first 5
-        print()
 
-    # Retrieve documents for each query variation
+def _batches(items, batch_size):
+    return [items[i : i + batch_size] for i in range(0, len(items), batch_size)]
+
+
+def select_relevant_docs(
+    query,
+    search_results,
+    article_index,
+    bm25_index,
+    verbose=True,
+    max_tokens=CONTEXT_TOKEN_BUDGET,
+    query_vectors=None,
+    embedding_matrix=None,
+):
+    """
+    Merge per-variation search results, complete key articles and prioritize
+    the documents that will be sent to the model, packed into `max_tokens`.
+
+    With the `query_vectors` of the query and its variations and the chunk
+    `embedding_matrix`, candidates are reranked by their pooled cosine
+    similarity in one vectorized computation.
+    """
     all_docs = []
     seen_ids = set()
 
-    for q in query_variations:
-        retriever = db.as_retriever(search_type="similarity", search_kwargs={"k": 6})
-
-        docs = retriever.invoke(q)
-
-        # Deduplicate based on content
+    for docs in search_results:
+        # Deduplicate on the stable chunk ID
         for doc in docs:
-            doc_id = doc.page_content[:100]  # Use first 100 chars as ID
+            doc_id = chunk_key(doc)
             if doc_id not in seen_ids:
                 seen_ids.add(doc_id)
                 all_docs.append(doc)
 
-    # Extract key terms from query to identify relevant articles
-    query_key_terms = extract_key_terms(query)
-
-    # Check if we found key articles - fetch ALL their sub-articles for completeness
-    key_articles_found = set()
-    for doc in all_docs[:15]:  # Check top 15 docs
-        article = doc.metadata.get("article")
-        # If this document seems highly relevant (contains query terms), mark article as key
-        if article:
-            content_lower = doc.page_content.lower()
-            # Count how many query terms appear in this document
-            term_count = sum(1 for term in query_key_terms if term in content_lower)
-            if (
-                term_count >= 2 or len(query_key_terms) <= 1
-            ):  # At least 2 terms or single-term query
-                key_articles_found.add(article)
-
-    # Fetch all chunks for key articles to ensure completeness
-    if key_articles_found and verbose:
-        print(f"Key articles detected: {key_articles_found}")
-        print("Fetching complete articles for comprehensive answer...\n")
-
-    complete_article_docs = []
-    if key_articles_found:
-        all_db_docs = db.get()
-        for i, metadata in enumerate(all_db_docs["metadatas"]):
-            if metadata and metadata.get("article") in key_articles_found:
-                # Create a Document object
-                from langchain_core.documents import Document
-
-                doc = Document(
-                    page_content=all_db_docs["documents"][i], metadata=metadata
+    # Lexical relevance comes from the BM25 index: (matched query terms, score)
+    query_terms = bm25_index.query_terms(query)
+    lexical_scores = {}
+
+    def lexical_score(doc):
+        key = chunk_key(doc)
+        if key not in lexical_scores:
+            lexical_scores[key] = bm25_index.score(
+                query_terms,
+                chunk_id=doc.metadata.get("chunk_id"),
+                content=doc.page_content,
+                metadata=doc.metadata,
+            )
+        return lexical_scores[key]
+
+    with span("article_completion"):
+        # Check if we found key articles - fetch ALL their sub-articles for completeness
+        key_articles_found = set()
+        for doc in all_docs[:15]:  # Check top 15 docs
+            article = doc.metadata.get("article")
+            # If this document seems highly relevant (contains query terms), mark article as key
+            if article:
+                term_count, _ = lexical_score(doc)
+                if (
+                    term_count >= 2 or len(query_terms) <= 1
+                ):  # At least 2 terms or single-term query
+                    key_articles_found.add(article)
+
+        # Fetch all chunks for key articles to ensure completeness
+        if key_articles_found and verbose:
+            print(f"Key articles detected: {key_articles_found}")
+            print("Fetching complete articles for comprehensive answer...\n")
+
+        complete_article_docs = []
+        if key_articles_found:
+            for article in sorted(key_articles_found):
+                for chunk in article_index.chunks_for_article(article):
+                    # Create a Document object
+                    doc = _document(chunk["content"], chunk["metadata"])
+                    # Check if not already in our list
+                    doc_id = chunk_key(doc)
+                    if doc_id not in seen_ids:
+                        seen_ids.add(doc_id)
+                        complete_article_docs.append(doc)
+
+        # Combine all documents
+        all_docs.extend(complete_article_docs)
+
+    with span("context_build"):
+        semantic_scores = {}
+        if embedding_matrix is not None and query_vectors is not None and RERANK_POOLING != "off":
+            with span("rerank"):
+                scores = embedding_matrix.scores(
+                    [doc.metadata.get("chunk_id") for doc in all_docs], query_vectors, RERANK_POOLING
                 )
-                # Check if not already in our list
-                doc_id = doc.page_content[:100]
-                if doc_id not in seen_ids:
-                    seen_ids.add(doc_id)
-                    complete_article_docs.append(doc)
-
-    # Combine all documents
-    all_docs.extend(complete_article_docs)
-
-    # Filter and prioritize documents based on query relevance
-    query_key_terms = extract_key_terms(query)
-    priority_docs = []
-    other_docs = []
-
-    for doc in all_docs:
-        content_lower = doc.page_content.lower()
-        # Count how many query key terms appear in the document
-        relevance_score = sum(1 for term in query_key_terms if term in content_lower)
-
-        if relevance_score >= 1:  # At least one key term
-            priority_docs.append((relevance_score, doc))
-        else:
-            other_docs.append(doc)
-
-    # Sort priority docs by relevance score (descending), then by article/subarticle
-    priority_docs.sort(
-        key=lambda x: (
-            -x[0],
-            x[1].metadata.get("article", "ZZZ"),
-            x[1].metadata.get("subarticle", "ZZZ"),
+            # Chunks missing from the matrix (NaN) rank by BM25 alone
+            semantic_scores = {
+                chunk_key(doc): score for doc, score in zip(all_docs, scores.tolist()) if score == score
+            }
+
+        # Filter and prioritize documents based on query relevance
+        priority_docs = []
+        other_docs = []
+
+        for doc in all_docs:
+            term_count, relevance_score = lexical_score(doc)
+
+            if term_count >= 1:  # At least one key term
+                priority_docs.append((relevance_score, doc))
+            else:
+                other_docs.append(doc)
+
+        # Rank priority docs by BM25 score (relative to the best one) plus
+        # the weighted cosine similarity, then in numeric hierarchy order
+        top_score = max((score for score, _ in priority_docs), default=0.0) or 1.0
+        priority_docs.sort(
+            key=lambda x: (
+                -(x[0] / top_score + RERANK_WEIGHT * semantic_scores.get(chunk_key(x[1]), 0.0)),
+                hierarchy_key(x[1].metadata),
+            )
         )
-    )
-    priority_docs = [doc for score, doc in priority_docs]  # Remove scores
+        priority_docs = [doc for score, doc in priority_docs]  # Remove scores
+
+        # The two best documents without key terms come from the rerank too
+        if semantic_scores:
+            other_docs.sort(key=lambda doc: -semantic_scores.get(chunk_key(doc), -1.0))
 
-    # Combine with priority docs first, limit to top 20 for comprehensive coverage
-    relevant_docs = priority_docs[:18] + other_docs[:2]
+        # Priority docs first, then at most two others, packed into the token
+        # budget with prefixes stripped and adjacent chunks merged
+        relevant_docs, context_tokens = assemble_context(
+            priority_docs + other_docs[:2], article_index.position, max_tokens
+        )
+
+    count("candidate_chunks", len(all_docs))
+    count("context_tokens", context_tokens)
 
     if verbose:
         print(f"Total unique documents retrieved: {len(all_docs)}")
-        print(f"Priority documents: {len(priority_docs)}\n")
+        print(f"Priority documents: {len(priority_docs)}")
+        print(f"Context: {len(relevant_docs)} blocks, ~{context_tokens} tokens\n")
 
         # Display results with metadata
         print("--- Context ---")
@@ -322,79 +434,1296 @@ def retrieve_and_answer(query, verbose=True):
         if len(relevant_docs) > 12:
             print(f"\n... and {len(relevant_docs) - 12} more documents\n")
 
-    # Create structured context
-    structured_context = create_structured_context(relevant_docs)
+    return relevant_docs
 
-    # Enhanced prompt for better response generation
-    system_prompt = """You are a constitutional law expert specializing in the Constitution of Nepal.
 
-Your task is to provide detailed, well-structured answers based on the constitutional text provided.
+@lru_cache(maxsize=None)
+def _system_message(title=DEFAULT_TITLE):
+    from langchain_core.messages import SystemMessage
 
-FORMATTING RULES:
-1. Start with the main Part and Article title (e.g., "📘 Part 7 – Federal Executive | Article 76 – Appointment of Prime Minister")
-2. Break down the answer by Sub-articles, clearly labeled (e.g., "🔹 Sub-article (1)")
-3. For each sub-article, list the clauses if they exist (e.g., "(a)", "(b)", "(c)")
-4. Use the EXACT hierarchy from the constitution: Part → Article → Sub-article → Clause
-5. If multiple articles are relevant, present each one separately with clear headers
-6. Use emojis for visual clarity: 📘 for Parts, 🔹 for Sub-articles, • for clauses
-7. Present sub-articles in numerical order (1, 2, 3, etc.)
+    return SystemMessage(content=system_prompt(title))
 
-CONTENT RULES:
-1. Only use information from the provided constitutional text
-2. Paraphrase the content clearly while maintaining legal accuracy
-3. If the constitution doesn't address the question, say: "The Constitution of Nepal does not address this question."
-4. Always cite the exact Part, Article, and Sub-article numbers
-5. Present ALL relevant sub-articles in order - don't skip any
-6. Combine information from multiple chunks of the same sub-article if needed
 
-EXAMPLE FORMAT:
-📘 Part X – [Part Name]
-Article Y – [Article Title]
+def build_messages(query, relevant_docs, blocks=None, title=DEFAULT_TITLE):
+    """
+    Build the system and user messages for the answer generation model.
 
-🔹 Sub-article (1)
-As per Part X, Article Y, Sub-article (1):
-(a) [Content of clause a]
-(b) [Content of clause b]
+    The system message is built once per corpus `title` and shared by every
+    request; the user message is the cached context blocks followed by the
+    question.
+    """
+    from langchain_core.messages import HumanMessage
 
-🔹 Sub-article (2)
-As per Part X, Article Y, Sub-article (2):
-[Content if no clauses, or list clauses if they exist]
-"""
+    structured_context = create_structured_context(relevant_docs, blocks)
 
-    user_prompt = f"""Question: {query}
+    return [
+        _system_message(title),
+        HumanMessage(content=user_prompt(query, structured_context)),
+    ]
 
-Constitutional Text:
-{structured_context}
 
-Please provide a comprehensive answer following the formatting rules. Include ALL relevant sub-articles in numerical order."""
+def _message_tokens(messages):
+    return sum(count_tokens(message.content) for message in messages)
 
-    # Create a ChatOpenAI model
-    model = ChatOpenAI(model="gpt-4o", temperature=0)
 
-    # Define the messages for the model
-    messages = [
-        SystemMessage(content=system_prompt),
-        HumanMessage(content=user_prompt),
-    ]
+def _count_llm_tokens(messages, result):
+    """Record prompt/completion tokens of an LLM call on the active trace."""
+    # Reported by the provider when available, otherwise estimated offline
+    usage = getattr(result, "usage_metadata", None) or {}
+    count("prompt_tokens", usage.get("input_tokens") or _message_tokens(messages))
+    count("completion_tokens", usage.get("output_tokens") or count_tokens(result.content))
 
-    # Invoke the model with the structured input
-    result = model.invoke(messages)
 
+def _print_answer(answer, verbose):
     # Display the response
     if verbose:
         print("\n" + "=" * 60)
         print("--- ANSWER ---")
         print("=" * 60)
 
-    print(result.content)
-    return result.content
+    print(answer)
+
+
+def _answer_raw(docs, verbose, blocks=None):
+    """Return the structured constitutional text of the documents, without an LLM call."""
+    text = create_structured_context(docs, blocks)
+    _print_answer(text, verbose)
+    return text
+
+
+# Resources a pipeline takes from its `SharedClients`, when it has one
+SHARED_RESOURCES = ("http_client", "http_async_client", "embeddings", "chat_model")
+
+
+class SharedClients:
+    """
+    The HTTP connection pools, embedding model and chat model shared by the
+    pipelines of several corpora (see `CorpusPool`), together with the
+    semaphore bounding their concurrent upstream calls. Query embeddings
+    are cached in the embedding cache next to `persist_directory`.
+
+    Pre-built `chat_model` and `embeddings` objects can be passed in (e.g.
+    fakes with simulated latency for load testing); they are used by every
+    pipeline as is.
+    """
+
+    def __init__(self, persist_directory=persistent_directory, chat_model=None, embeddings=None):
+        self.persist_directory = persist_directory
+        self.resources = {
+            name: resource
+            for name, resource in (("chat_model", chat_model), ("embeddings", embeddings))
+            if resource is not None
+        }
+        self.lock = threading.RLock()
+        self._semaphore = None
+
+    def get_semaphore(self):
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        return self._semaphore
+
+    async def aclose(self):
+        """Close both pooled HTTP clients, if they were created."""
+        if "http_client" in self.resources:
+            self.resources["http_client"].close()
+        if "http_async_client" in self.resources:
+            await self.resources["http_async_client"].aclose()
+
+
+class ConstitutionRAG:
+    """
+    The retrieval-augmented answering pipeline for one corpus (by default
+    the Constitution of Nepal).
+
+    Owns every long-lived resource, so one instance is created per process
+    and reused across requests:
+    - Pooled keep-alive HTTP clients (sync and async) shared by the OpenAI
+      embedding and chat models, with pool limits and timeouts
+    - The embedding model of the configured backend (`embedding_backend`,
+      `embedding_model`; OpenAI by default, or a local CPU model)
+    - The vector store (`vector_store`): the Chroma collection, checked
+      against that model, or an in-memory NumPy store for exact search
+    - The answer cache, the article index, the BM25 index and the
+      memory-mapped chunk embedding matrix used for reranking
+    - Request metrics (`metrics`), aggregated from per-request traces
+
+    The corpus is set by `persist_directory` (its vector store and indexes),
+    `title` (named in the system prompt) and `query_expansion_rules`. With
+    `shared` (a `SharedClients`) the HTTP pools, embedding model, chat model
+    and concurrency limit are those of the other pipelines in a `CorpusPool`.
+
+    Creating the pipeline is cheap: every resource is built on first use.
+    Call `warm_up` to build them ahead of the first request.
+
+    Pre-built `embeddings`, `vectorstore` and `chat_model` objects can be
+    passed in (e.g. a fake embedding model and an in-memory Chroma for
+    offline use); the HTTP pool is then only used by the clients it built.
+    """
+
+    def __init__(
+        self,
+        persist_directory=persistent_directory,
+        chat_model=None,
+        embeddings=None,
+        vectorstore=None,
+        max_connections=HTTP_MAX_CONNECTIONS,
+        max_keepalive_connections=HTTP_MAX_KEEPALIVE,
+        keepalive_expiry=HTTP_KEEPALIVE_EXPIRY,
+        timeout=HTTP_TIMEOUT,
+        connect_timeout=HTTP_CONNECT_TIMEOUT,
+        max_retries=OPENAI_MAX_RETRIES,
+        embedding_backend=EMBEDDING_BACKEND,
+        embedding_model=EMBEDDING_MODEL,
+        vector_store=VECTOR_STORE,
+        title=DEFAULT_TITLE,
+        query_expansion_rules=QUERY_EXPANSION_RULES,
+        shared=None,
+        metrics=None,
+    ):
+        if vector_store not in ("chroma", "numpy"):
+            raise ValueError(f"Unknown vector store {vector_store!r}; expected chroma or numpy")
+
+        self.persist_directory = persist_directory
+        self.title = title
+        self.query_expansion_rules = query_expansion_rules
+        self.vector_store = vector_store
+        self.embedding_backend = embedding_backend
+        self.embedding_model = embedding_model
+        self.max_connections = max_connections
+        self.max_keepalive_connections = max_keepalive_connections
+        self.keepalive_expiry = keepalive_expiry
+        self.timeout = timeout
+        self.connect_timeout = connect_timeout
+        self.max_retries = max_retries
+
+        # Resources built on first use; injected ones are used as is
+        self._resources = {
+            name: resource
+            for name, resource in (
+                ("chat_model", chat_model),
+                ("embeddings", embeddings),
+                ("db", vectorstore),
+            )
+            if resource is not None
+        }
+        self._lock = threading.RLock()
+        self._shared = shared
+
+        self._article_index = None
+        self._article_index_mtime = None
+        self._bm25_index = None
+        self._bm25_index_mtime = None
+        self._embedding_matrix = None
+        self._embedding_matrix_version = None
+        self._numpy_store = None
+        self._semaphore = None
+
+        # Vectors of the fixed topic booster queries, see `warm_embedding_cache`
+        self._booster_vectors = {}
+
+        # Aggregated by callers that pass a Trace (e.g. the API's /metrics)
+        self.metrics = metrics if metrics is not None else Metrics()
+
+    def _resource(self, name, build):
+        """Return a resource, building it once on first use (in the shared clients, if it is one of them)."""
+        resource = self._resources.get(name)
+        if resource is None:
+            resources, lock = self._resources, self._lock
+            if self._shared is not None and name in SHARED_RESOURCES:
+                resources, lock = self._shared.resources, self._shared.lock
+
+            resource = resources.get(name)
+            if resource is None:
+                with lock:
+                    resource = resources.get(name)
+                    if resource is None:
+                        resource = resources[name] = build()
+        return resource
+
+    def _http_timeout(self):
+        import httpx
+
+        return httpx.Timeout(self.timeout, connect=self.connect_timeout)
+
+    def _http_limits(self):
+        import httpx
+
+        return httpx.Limits(
+            max_connections=self.max_connections,
+            max_keepalive_connections=self.max_keepalive_connections,
+            keepalive_expiry=self.keepalive_expiry,
+        )
+
+    @property
+    def http_client(self):
+        def build():
+            import httpx
+
+            return httpx.Client(limits=self._http_limits(), timeout=self._http_timeout())
+
+        return self._resource("http_client", build)
+
+    @property
+    def http_async_client(self):
+        def build():
+            import httpx
+
+            return httpx.AsyncClient(limits=self._http_limits(), timeout=self._http_timeout())
+
+        return self._resource("http_async_client", build)
+
+    @property
+    def embeddings(self):
+        """The configured embedding backend behind the persistent embedding cache."""
+
+        def build():
+            from embedding_cache import CachedEmbeddings, embedding_cache_path
+
+            # Only the OpenAI backend uses the pooled HTTP clients
+            options = {}
+            if self.embedding_backend == "openai":
+                options = {
+                    "http_client": self.http_client,
+                    "http_async_client": self.http_async_client,
+                    "max_retries": self.max_retries,
+                }
+
+            cache_directory = self._shared.persist_directory if self._shared is not None else self.persist_directory
+            return CachedEmbeddings(
+                create_embeddings(self.embedding_backend, self.embedding_model, **options),
+                embedding_cache_path(cache_directory),
+            )
+
+        return self._resource("embeddings", build)
+
+    @property
+    def db(self):
+        """
+        The persistent Chroma vector store. Raises `EmbeddingModelMismatch`
+        if it was embedded with another model than the configured one.
+        """
+
+        def build():
+            from langchain_chroma import Chroma
+
+            tag = embedding_model_tag(self.embedding_backend, self.embedding_model)
+            db = Chroma(
+                persist_directory=self.persist_directory,
+                embedding_function=self.embeddings,
+                collection_metadata={"hnsw:space": "cosine", EMBEDDING_MODEL_KEY: tag},
+            )
+            check_embedding_model(db, tag)
+            return db
+
+        return self._resource("db", build)
+
+    @property
+    def chat_model(self):
+        def build():
+            from langchain_openai import ChatOpenAI
+
+            return ChatOpenAI(
+                model=CHAT_MODEL,
+                temperature=0,
+                http_client=self.http_client,
+                http_async_client=self.http_async_client,
+                timeout=self._http_timeout(),
+                max_retries=self.max_retries,
+            )
+
+        return self._resource("chat_model", build)
+
+    @property
+    def answer_cache(self):
+        """
+        Answers for repeated (or near-identical) questions, invalidated when
+        the corpus fingerprint changes after re-ingestion.
+        """
+
+        def build():
+            from answer_cache import AnswerCache
+
+            return AnswerCache(
+                max_entries=int(os.getenv("RAG_ANSWER_CACHE_SIZE", "256")),
+                ttl=float(os.getenv("RAG_ANSWER_CACHE_TTL", str(24 * 60 * 60))),
+                similarity_threshold=float(os.getenv("RAG_ANSWER_CACHE_THRESHOLD", "0.95")),
+            )
+
+        return self._resource("answer_cache", build)
+
+    def warm_up(self, embeddings=True):
+        """
+        Build every resource ahead of the first request: HTTP clients, chat
+        model, vector store, answer cache, both indexes and the chunk
+        embedding matrix. With
+        `embeddings=True` the fixed query expansions are also embedded
+        (needs the embedding API unless they are already cached).
+        """
+        for name in ("http_client", "http_async_client", "chat_model", "answer_cache"):
+            getattr(self, name)
+
+        self.get_article_index()
+        self.get_bm25_index()
+        self.get_embedding_matrix()
+
+        # The NumPy store only opens the collection if no matrix was exported
+        if self.vector_store == "numpy":
+            self.get_numpy_store()
+        else:
+            getattr(self, "db")
+
+        if embeddings:
+            self.warm_embedding_cache()
+
+    def close(self):
+        """Close the pooled sync HTTP client, if this pipeline created it."""
+        if "http_client" in self._resources:
+            self._resources["http_client"].close()
+
+    async def aclose(self):
+        """Close both pooled HTTP clients, if this pipeline created them."""
+        self.close()
+        if "http_async_client" in self._resources:
+            await self._resources["http_async_client"].aclose()
+
+    def _get_semaphore(self):
+        """Return the semaphore bounding concurrent upstream calls."""
+        if self._shared is not None:
+            return self._shared.get_semaphore()
+
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(MAX_CONCURRENCY)
+
+        return self._semaphore
+
+    def get_article_index(self):
+        """
+        Return the article → chunks index, loading it once per pipeline.
+
+        Uses the index written by the ingestion pipeline when present
+        (reloading it if ingestion rewrites the file), otherwise builds it
+        from a single full read of the collection.
+        """
+        index_path = article_index_path(self.persist_directory)
+        if os.path.exists(index_path):
+            mtime = os.path.getmtime(index_path)
+            if self._article_index is None or mtime != self._article_index_mtime:
+                self._article_index = ArticleIndex.load(index_path)
+                self._article_index_mtime = mtime
+        elif self._article_index is None:
+            self._article_index = ArticleIndex.from_collection(self.db)
+
+        return self._article_index
+
+    def get_bm25_index(self):
+        """
+        Return the BM25 index, loading it once per pipeline.
+
+        Uses the index written by the ingestion pipeline when present
+        (reloading it if ingestion rewrites the file), otherwise builds it
+        from the article index chunks.
+        """
+        index_path = bm25_index_path(self.persist_directory)
+        if os.path.exists(index_path):
+            mtime = os.path.getmtime(index_path)
+            if self._bm25_index is None or mtime != self._bm25_index_mtime:
+                self._bm25_index = BM25Index.load(index_path)
+                self._bm25_index_mtime = mtime
+        elif self._bm25_index is None:
+            self._bm25_index = BM25Index(self.get_article_index().chunks)
+
+        return self._bm25_index
+
+    def get_embedding_matrix(self):
+        """
+        Return the chunk embedding matrix exported by the ingestion pipeline,
+        memory-mapped once per pipeline (and reloaded if ingestion rewrites
+        it). Returns None when there is none, or when it was computed with
+        another embedding model; reranking is then skipped.
+        """
+        from embedding_matrix import EmbeddingMatrix, embedding_matrix_path
+
+        # Keyed on the manifest, the one file a save replaces atomically
+        # (a new inode each time), not on the matrix data it names
+        path = embedding_matrix_path(self.persist_directory)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            self._embedding_matrix = self._embedding_matrix_version = None
+            return None
+
+        version = (stat.st_ino, stat.st_mtime_ns)
+        if version != self._embedding_matrix_version:
+            matrix = EmbeddingMatrix.load(path)
+            tag = embedding_model_tag(self.embedding_backend, self.embedding_model)
+            if matrix.model not in (None, tag):
+                print(f"Warning: chunk embeddings in {path} come from {matrix.model}, not {tag}; reranking disabled")
+                matrix = None
+            self._embedding_matrix = matrix
+            self._embedding_matrix_version = version
+
+        return self._embedding_matrix
+
+    def get_numpy_store(self):
+        """
+        Return the in-memory NumPy vector store over the article index chunks
+        and the exported embedding matrix, rebuilt when either is reloaded.
+        Without an exported matrix the vectors are read from the collection
+        once.
+        """
+        from embedding_backends import EmbeddingModelMismatch
+        from embedding_matrix import EmbeddingMatrix, embedding_matrix_path
+        from numpy_store import NumpyVectorStore
+
+        article_index = self.get_article_index()
+        matrix = self.get_embedding_matrix()
+
+        store = self._numpy_store
+        if store is not None and store.article_index is article_index and matrix in (None, store.embedding_matrix):
+            return store
+
+        if matrix is None:
+            path = embedding_matrix_path(self.persist_directory)
+            if os.path.exists(path):
+                raise EmbeddingModelMismatch(
+                    f"The chunk embeddings in {path} were computed with another embedding model "
+                    f"than {embedding_model_tag(self.embedding_backend, self.embedding_model)!r}; "
+                    "re-run the ingestion pipeline"
+                )
+            matrix = EmbeddingMatrix.from_collection(self.db)
+
+        self._numpy_store = NumpyVectorStore(article_index, matrix)
+        return self._numpy_store
+
+    def search_vectors(self, query_embeddings, k=6, where=None):
+        """
+        Return the `k` nearest chunks of every query embedding from the
+        configured vector store, as a multi-query Chroma result. `where` is
+        a Chroma metadata filter applied before the search (e.g.
+        `{"part": "Part 3"}` or `{"article": {"$in": ["Article 76", "Article 77"]}}`).
+        """
+        if self.vector_store == "numpy":
+            return self.get_numpy_store().query(query_embeddings, n_results=k, where=where)
+
+        return self.db._collection.query(
+            query_embeddings=query_embeddings,
+            n_results=k,
+            where=where or None,
+            include=["documents", "metadatas"],
+        )
+
+    @property
+    def query_expander(self):
+        """The compiled query expansion rules of this corpus."""
+        return load_query_expander(self.query_expansion_rules)
+
+    def warm_embedding_cache(self):
+        """
+        Precompute embeddings for the fixed topic booster queries and keep
+        them in memory, so boosted questions only embed their own variations.
+        """
+        boosters = list(dict.fromkeys(self.query_expander.booster_queries))
+        self._booster_vectors = dict(zip(boosters, self.embeddings.embed_documents(boosters)))
+
+    def _variation_vectors(self, variations, embedded, dedupe):
+        vectors = [
+            self._booster_vectors[v] if v in self._booster_vectors else embedded[v] for v in variations
+        ]
+        if not dedupe:
+            return list(variations), vectors
+
+        kept, kept_vectors = dedupe_by_similarity(variations, vectors)
+        count("deduplicated_variations", len(variations) - len(kept))
+        return kept, kept_vectors
+
+    def embed_variations(self, variations, dedupe=True):
+        """
+        Embed query variations in one call, taking the booster queries'
+        vectors from the table built by `warm_embedding_cache`, and drop
+        near-duplicate variations (see `query_expansion.dedupe_by_similarity`).
+
+        Returns `(variations, embeddings)`; the first variation is always kept.
+        """
+        missing = [v for v in dict.fromkeys(variations) if v not in self._booster_vectors]
+        embedded = {}
+        if missing:
+            with span("embedding"):
+                embedded = dict(zip(missing, self.embeddings.embed_documents(missing)))
+
+        return self._variation_vectors(variations, embedded, dedupe)
+
+    async def aembed_variations(self, variations, batch_size=None, dedupe=True):
+        """Async version of `embed_variations`, embedding with `aembed_queries`."""
+        missing = [v for v in dict.fromkeys(variations) if v not in self._booster_vectors]
+        embedded = {}
+        if missing:
+            embedded = dict(zip(missing, await self.aembed_queries(missing, batch_size=batch_size)))
+
+        return self._variation_vectors(variations, embedded, dedupe)
+
+    def batch_similarity_search(self, queries, k=6, query_embeddings=None, where=None):
+        """
+        Run a similarity search for many queries with a single embedding call
+        and a single multi-query vector store lookup.
+
+        Returns one list of documents per query, in the same order as
+        `queries`. Precomputed `query_embeddings` skip the embedding call;
+        `where` pre-filters by metadata (see `search_vectors`).
+        """
+        queries = list(queries)
+        if not queries:
+            return []
+
+        if query_embeddings is None:
+            with span("embedding"):
+                query_embeddings = self.embeddings.embed_documents(queries)
+
+        with span("vector_search"):
+            results = self.search_vectors(query_embeddings, k=k, where=where)
+        count("retrieval_calls")
+
+        return _results_to_documents(results)
+
+    def hybrid_search(self, query, query_variations, k=6, query_embeddings=None):
+        """
+        Single retrieval call: one batched vector search over all query
+        variations plus one local BM25 lookup of the original query.
+
+        Returns a list of ranked document lists, fused into one when hybrid
+        search is enabled, ready for `select_relevant_docs`.
+        """
+        search_results = self.batch_similarity_search(
+            query_variations, k=k, query_embeddings=query_embeddings
+        )
+        if not HYBRID_SEARCH:
+            return search_results
+
+        with span("bm25_search"):
+            bm25_docs = bm25_search(query, self.get_bm25_index())
+        return [reciprocal_rank_fusion(search_results + [bm25_docs])]
+
+    async def aembed_queries(self, queries, batch_size=None):
+        """
+        Embed queries with the async client, in batches of `batch_size` run
+        concurrently with `asyncio.gather`. Each batch holds a slot of the
+        pipeline semaphore.
+        """
+        batch_size = batch_size or EXPANSION_BATCH_SIZE
+
+        async def embed(batch):
+            async with self._get_semaphore():
+                return await self.embeddings.aembed_documents(batch)
+
+        with span("embedding"):
+            batch_vectors = await asyncio.gather(
+                *(embed(batch) for batch in _batches(list(queries), batch_size))
+            )
+
+        return [vector for vectors in batch_vectors for vector in vectors]
+
+    async def abatch_similarity_search(self, queries, k=6, batch_size=None, query_embeddings=None, where=None):
+        """
+        Async version of `batch_similarity_search`.
+
+        Queries are split into batches of `batch_size` that are embedded and
+        searched concurrently with `asyncio.gather`. Each batch holds a slot
+        of the pipeline semaphore, so at most MAX_CONCURRENCY upstream calls
+        run at once across all requests. The vector store query runs in a
+        worker thread so it does not block the event loop; the NumPy store
+        searches all queries with one matrix product instead of batches.
+        """
+        batch_size = batch_size or EXPANSION_BATCH_SIZE
+
+        queries = list(queries)
+        if not queries:
+            return []
+
+        if query_embeddings is None:
+            query_embeddings = await self.aembed_queries(queries, batch_size=batch_size)
+
+        async def search(batch_embeddings):
+            async with self._get_semaphore():
+                results = await asyncio.to_thread(self.search_vectors, batch_embeddings, k, where)
+            return _results_to_documents(results)
+
+        if self.vector_store == "numpy":
+            batches = [list(query_embeddings)]
+        else:
+            batches = _batches(list(query_embeddings), batch_size)
+        with span("vector_search"):
+            batch_results = await asyncio.gather(*(search(batch) for batch in batches))
+        count("retrieval_calls", len(batches))
+
+        return [docs for batch_docs in batch_results for docs in batch_docs]
+
+    def retrieve_and_answer(self, query, verbose=True, use_cache=True, raw=False, trace=None):
+        """
+        Main function to retrieve documents and generate answer.
+
+        With `raw=True` the retrieved constitutional text is returned as is,
+        without an LLM call. Per-stage timings, token counts and retrieval
+        calls are recorded on `trace` (a `timings.Trace`) when one is passed.
+        """
+        trace = trace if trace is not None else Trace()
+
+        with trace.activate(), trace.span("total"):
+            answer = self._retrieve_and_answer(query, verbose, use_cache, raw)
+
+        if verbose:
+            print(f"\n{trace.summary()}")
+
+        return answer
+
+    def _retrieve_and_answer(self, query, verbose, use_cache, raw):
+        article_index = self.get_article_index()
+        fingerprint = article_index.fingerprint
+
+        answer, cited_docs, query_variations = self._prepare_query(
+            query, article_index, self.get_bm25_index(), use_cache, raw, verbose
+        )
+        if answer is not None:
+            _print_answer(answer, verbose)
+            return answer
+
+        if cited_docs:
+            return self._generate_answer(query, cited_docs, fingerprint, None, verbose, use_cache)
+
+        # Embed all query variations in one call; the original query's vector
+        # doubles as the key for the semantic cache tier
+        query_variations, query_embeddings = self.embed_variations(query_variations)
+        query_embedding = query_embeddings[query_variations.index(query)]
+
+        cached = self._cached_answer(query, fingerprint, use_cache and not raw, query_embedding)
+        if cached is not None:
+            _print_answer(cached, verbose)
+            return cached
+
+        relevant_docs = self.retrieve_documents(
+            query,
+            verbose=verbose,
+            query_variations=query_variations,
+            query_embeddings=query_embeddings,
+        )
+
+        if raw:
+            return _answer_raw(relevant_docs, verbose, article_index.block)
+
+        return self._generate_answer(
+            query, relevant_docs, fingerprint, query_embedding, verbose, use_cache
+        )
+
+    def _prepare_query(self, query, article_index, bm25_index, use_cache, raw, verbose=False):
+        """
+        The steps of answering a question that need no embedding, shared by
+        the sync, async and batch paths: citation lookup, the exact answer
+        cache tier and query expansion.
+
+        Returns `(answer, docs, variations)` with exactly one of them set:
+        a finished answer (the raw cited text or a cached answer), the
+        documents of a question citing Parts/Articles, or the query
+        variations still to embed and search.
+        """
+        # Direct citations skip expansion, embeddings and vector search
+        cited_docs = []
+        if CITATION_FAST_PATH:
+            # Raw lookups return the full text; answers stay within the budget
+            with span("citation_lookup"):
+                cited_docs = citation_docs(
+                    query,
+                    article_index,
+                    verbose=verbose,
+                    max_tokens=None if raw else CONTEXT_TOKEN_BUDGET,
+                    bm25_index=bm25_index,
+                )
+
+        if raw and cited_docs:
+            return create_structured_context(cited_docs, article_index.block), None, None
+
+        cached = self._cached_answer(query, article_index.fingerprint, use_cache and not raw)
+        if cached is not None:
+            return cached, None, None
+
+        if cited_docs:
+            return None, cited_docs, None
+
+        with span("expand_query"):
+            return None, None, self.query_expander.expand(query)
+
+    def _cached_answer(self, query, fingerprint, enabled, embedding=None):
+        """
+        Look a question up in the answer cache: the exact tier, or the
+        semantic tier when its `embedding` is given. None on a miss or
+        when not `enabled`.
+        """
+        if not enabled:
+            return None
+
+        with span("cache_lookup"):
+            if embedding is None:
+                cached = self.answer_cache.get(query, fingerprint)
+            else:
+                cached = self.answer_cache.get_similar(fingerprint, embedding)
+
+        if cached is not None:
+            count("cache_hits")
+        return cached
+
+    def _generate_answer(self, query, relevant_docs, fingerprint, query_embedding, verbose, use_cache):
+        with span("prompt_build"):
+            messages = build_messages(query, relevant_docs, self.get_article_index().block, self.title)
+
+        # Invoke the model with the structured input
+        with span("llm"):
+            result = self.chat_model.invoke(messages)
+        _count_llm_tokens(messages, result)
+
+        if use_cache:
+            self.answer_cache.put(query, result.content, fingerprint, query_embedding)
+
+        _print_answer(result.content, verbose)
+        return result.content
+
+    def retrieve_documents(self, query, verbose=False, query_variations=None, query_embeddings=None):
+        """
+        Retrieval stage only: citation lookup or expansion, hybrid search
+        and document selection, without an LLM call.
+        """
+        article_index = self.get_article_index()
+
+        if CITATION_FAST_PATH and query_variations is None:
+            with span("citation_lookup"):
+                cited_docs = citation_docs(query, article_index, verbose=verbose, bm25_index=self.get_bm25_index())
+            if cited_docs:
+                return cited_docs
+
+        if query_variations is None:
+            with span("expand_query"):
+                query_variations = self.query_expander.expand(query)
+
+        if verbose:
+            print(f"User Query: {query}")
+            print(f"Query Variations: {query_variations[:5]}...")  # Show first 5
+            print()
+
+        # The variations' vectors are used for the search and the rerank
+        if query_embeddings is None:
+            query_variations, query_embeddings = self.embed_variations(query_variations)
+
+        # Retrieve documents for all query variations in one batched search,
+        # fused with the BM25 hits for the original query
+        search_results = self.hybrid_search(
+            query, query_variations, k=6, query_embeddings=query_embeddings
+        )
+
+        return select_relevant_docs(
+            query,
+            search_results,
+            article_index,
+            self.get_bm25_index(),
+            verbose=verbose,
+            query_vectors=query_embeddings,
+            embedding_matrix=self.get_embedding_matrix(),
+        )
+
+    async def aretrieve_documents(self, query, verbose=False, query_variations=None, query_embeddings=None):
+        """Async retrieval stage: expand, search concurrently and select documents."""
+        # Loading the indexes may read the whole collection the first time
+        article_index = await asyncio.to_thread(self.get_article_index)
+        bm25_index = await asyncio.to_thread(self.get_bm25_index)
+
+        if CITATION_FAST_PATH and query_variations is None:
+            with span("citation_lookup"):
+                cited_docs = citation_docs(query, article_index, verbose=verbose, bm25_index=bm25_index)
+            if cited_docs:
+                return cited_docs
+
+        if query_variations is None:
+            with span("expand_query"):
+                query_variations = self.query_expander.expand(query)
+
+        if verbose:
+            print(f"User Query: {query}")
+            print(f"Query Variations: {query_variations[:5]}...")  # Show first 5
+            print()
+
+        # The variations' vectors are used for the search and the rerank
+        if query_embeddings is None:
+            query_variations, query_embeddings = await self.aembed_variations(query_variations)
+
+        search_results = await self.abatch_similarity_search(
+            query_variations, k=6, query_embeddings=query_embeddings
+        )
+
+        embedding_matrix = await asyncio.to_thread(self.get_embedding_matrix)
+
+        if HYBRID_SEARCH:
+            with span("bm25_search"):
+                bm25_docs = bm25_search(query, bm25_index)
+            search_results = [reciprocal_rank_fusion(search_results + [bm25_docs])]
+
+        return select_relevant_docs(
+            query,
+            search_results,
+            article_index,
+            bm25_index,
+            verbose=verbose,
+            query_vectors=query_embeddings,
+            embedding_matrix=embedding_matrix,
+        )
+
+    async def aretrieve_and_answer(self, query, verbose=False, model=None, use_cache=True, raw=False, trace=None):
+        """
+        Async version of `retrieve_and_answer` for use inside an event loop.
+
+        Embeddings and the LLM call use the async OpenAI clients, the
+        expansion queries are searched concurrently, and blocking work
+        (Chroma queries, the first index loads) runs in worker threads.
+        """
+        trace = trace if trace is not None else Trace()
+
+        with trace.activate(), trace.span("total"):
+            return await self._aretrieve_and_answer(query, verbose, model, use_cache, raw)
+
+    async def _aretrieve_and_answer(self, query, verbose, model, use_cache, raw):
+        article_index = await asyncio.to_thread(self.get_article_index)
+        bm25_index = await asyncio.to_thread(self.get_bm25_index)
+        fingerprint = article_index.fingerprint
+
+        answer, relevant_docs, query_variations = self._prepare_query(
+            query, article_index, bm25_index, use_cache, raw, verbose
+        )
+
+        query_embedding = None
+        if answer is None and relevant_docs is None:
+            query_variations, query_embeddings = await self.aembed_variations(query_variations)
+            query_embedding = query_embeddings[query_variations.index(query)]
+
+            answer = self._cached_answer(query, fingerprint, use_cache and not raw, query_embedding)
+            if answer is None:
+                relevant_docs = await self.aretrieve_documents(
+                    query,
+                    verbose=verbose,
+                    query_variations=query_variations,
+                    query_embeddings=query_embeddings,
+                )
+                if raw:
+                    answer = create_structured_context(relevant_docs, article_index.block)
+
+        if answer is None:
+            with span("prompt_build"):
+                messages = build_messages(query, relevant_docs, article_index.block, self.title)
+
+            async with self._get_semaphore():
+                with span("llm"):
+                    result = await (model or self.chat_model).ainvoke(messages)
+            _count_llm_tokens(messages, result)
+            answer = result.content
+
+            if use_cache:
+                self.answer_cache.put(query, answer, fingerprint, query_embedding)
+
+        if verbose:
+            _print_answer(answer, verbose)
+
+        return answer
+
+    async def astream_answer(self, query, model=None, trace=None):
+        """
+        Stream an answer as `(event, data)` pairs.
+
+        The first event is `("context", hierarchy)` with the retrieved
+        Part/Article/Sub-article hierarchy, sent as soon as retrieval
+        finishes. It is followed by `("token", text)` events as the model
+        generates the answer. Any LangChain chat model that supports
+        `astream` can be passed in place of the pipeline's chat model.
+
+        Timings are recorded on `trace` when one is passed, including the
+        time to the first answer token ("llm_first_token").
+        """
+        trace = trace if trace is not None else Trace()
+        started = time.perf_counter()
+
+        # The trace is only active around code that does not yield, as the
+        # consumer may resume the generator from another context
+        with trace.activate():
+            relevant_docs = await self.aretrieve_documents(query)
+
+        yield "context", create_context_hierarchy(relevant_docs)
+
+        with trace.span("prompt_build"):
+            # Loaded by the retrieval above
+            messages = build_messages(query, relevant_docs, self.get_article_index().block, self.title)
+
+        # The model is read by a separate task that holds an upstream slot
+        # only while generating; tokens wait in the queue for the client, so
+        # a slow reader does not keep a slot other requests need
+        tokens = asyncio.Queue()
+        finished = object()
+
+        async def generate():
+            try:
+                async with self._get_semaphore():
+                    llm_started = time.perf_counter()
+                    first = True
+                    async for chunk in (model or self.chat_model).astream(messages):
+                        if chunk.content:
+                            if first:
+                                trace.add("llm_first_token", time.perf_counter() - llm_started)
+                                first = False
+                            tokens.put_nowait(chunk.content)
+                    trace.add("llm", time.perf_counter() - llm_started)
+            except Exception as e:
+                tokens.put_nowait(e)
+            tokens.put_nowait(finished)
+
+        generation = asyncio.ensure_future(generate())
+        answer = []
+        try:
+            while True:
+                token = await tokens.get()
+                if token is finished:
+                    break
+                if isinstance(token, Exception):
+                    raise token
+                answer.append(token)
+                yield "token", token
+        finally:
+            # The client went away: stop generating
+            generation.cancel()
+
+        trace.count("prompt_tokens", _message_tokens(messages))
+        trace.count("completion_tokens", count_tokens("".join(answer)))
+        trace.add("total", time.perf_counter() - started)
+
+    async def _aretrieve_batch(self, queries, use_cache, raw):
+        """
+        Shared retrieval stage of `abatch_answer` for distinct questions.
+
+        Returns `(answers, docs, query_embeddings)` keyed by question:
+        finished answers (cache hits, raw context), the documents of the
+        questions still to answer and their embeddings for the answer cache.
+        """
+        article_index = await asyncio.to_thread(self.get_article_index)
+        bm25_index = await asyncio.to_thread(self.get_bm25_index)
+        embedding_matrix = await asyncio.to_thread(self.get_embedding_matrix)
+        fingerprint = article_index.fingerprint
+
+        answers, docs, query_embeddings, expansions = {}, {}, {}, {}
+
+        # Per-question CPU work (citation lookups, expansion, BM25 and
+        # selection) runs in a worker thread so a large batch does not block
+        # the event loop and every other request with it
+        def prepare():
+            for query in queries:
+                answer, cited_docs, variations = self._prepare_query(
+                    query, article_index, bm25_index, use_cache, raw
+                )
+                if answer is not None:
+                    answers[query] = answer
+                elif cited_docs:
+                    docs[query] = cited_docs
+                else:
+                    expansions[query] = variations
+
+        await asyncio.to_thread(prepare)
+
+        # Variations shared between questions (repeated key terms) are
+        # embedded once, in large batches; booster vectors are precomputed
+        variations = list(dict.fromkeys(v for vs in expansions.values() for v in vs))
+        count("query_variations", sum(len(vs) for vs in expansions.values()))
+        count("unique_query_variations", len(variations))
+        _, embeddings = await self.aembed_variations(variations, batch_size=BATCH_EMBEDDING_SIZE, dedupe=False)
+        vectors = dict(zip(variations, embeddings))
+
+        for query in list(expansions):
+            kept, _ = dedupe_by_similarity(expansions[query], [vectors[v] for v in expansions[query]])
+            count("deduplicated_variations", len(expansions[query]) - len(kept))
+            expansions[query] = kept
+            query_embeddings[query] = vectors[query]
+            cached = self._cached_answer(query, fingerprint, use_cache and not raw, vectors[query])
+            if cached is not None:
+                answers[query] = cached
+                del expansions[query]
+
+        # One set of similarity searches over the distinct variations of all
+        # remaining questions
+        variations = list(dict.fromkeys(v for vs in expansions.values() for v in vs))
+        results = dict(
+            zip(
+                variations,
+                await self.abatch_similarity_search(
+                    variations,
+                    k=6,
+                    batch_size=BATCH_EMBEDDING_SIZE,
+                    query_embeddings=[vectors[v] for v in variations],
+                ),
+            )
+        )
+
+        def select():
+            for query, query_variations in expansions.items():
+                search_results = [results[v] for v in query_variations]
+                if HYBRID_SEARCH:
+                    with span("bm25_search"):
+                        bm25_docs = bm25_search(query, bm25_index)
+                    search_results = [reciprocal_rank_fusion(search_results + [bm25_docs])]
+
+                # Article completion reads the in-memory article index loaded once above
+                docs[query] = select_relevant_docs(
+                    query,
+                    search_results,
+                    article_index,
+                    bm25_index,
+                    verbose=False,
+                    query_vectors=[vectors[v] for v in query_variations],
+                    embedding_matrix=embedding_matrix,
+                )
+
+        await asyncio.to_thread(select)
+
+        if raw:
+            for query in list(docs):
+                answers[query] = create_structured_context(docs.pop(query), article_index.block)
+
+        return answers, docs, query_embeddings
+
+    async def abatch_answer(self, queries, model=None, use_cache=True, raw=False, trace=None, max_concurrency=None):
+        """
+        Answer many questions, yielding a result for each as soon as it is ready.
+
+        Retrieval is shared across the batch: identical questions are answered
+        once, query variations are deduplicated, embedded in batches of
+        BATCH_EMBEDDING_SIZE and searched together. At most `max_concurrency`
+        LLM generations (default BATCH_LLM_CONCURRENCY) run at once.
+
+        Yields `{"index", "question", "answer"}` dicts, or `{"index",
+        "question", "error"}` for questions that failed, in completion order.
+        Timings for the whole batch are recorded on `trace` when one is passed.
+        """
+        trace = trace if trace is not None else Trace()
+        queries = list(queries)
+        positions = defaultdict(list)
+        for index, query in enumerate(queries):
+            positions[query].append(index)
+
+        def results(query, answer=None, error=None):
+            for index in positions[query]:
+                if error is None:
+                    yield {"index": index, "question": query, "answer": answer}
+                else:
+                    yield {"index": index, "question": query, "error": error}
+
+        try:
+            with trace.activate(), trace.span("retrieval"):
+                answers, docs, query_embeddings = await self._aretrieve_batch(list(positions), use_cache, raw)
+        except Exception as e:
+            for query in positions:
+                for result in results(query, error=f"Error processing query: {str(e)}"):
+                    yield result
+            return
+
+        for query, answer in answers.items():
+            for result in results(query, answer):
+                yield result
+
+        article_index = self.get_article_index()
+        fingerprint = article_index.fingerprint
+        limit = asyncio.Semaphore(max_concurrency or BATCH_LLM_CONCURRENCY)
+
+        async def generate(query):
+            try:
+                async with limit:
+                    with span("prompt_build"):
+                        messages = build_messages(query, docs[query], article_index.block, self.title)
+                    async with self._get_semaphore():
+                        with span("llm"):
+                            result = await (model or self.chat_model).ainvoke(messages)
+                _count_llm_tokens(messages, result)
+
+                if use_cache:
+                    self.answer_cache.put(query, result.content, fingerprint, query_embeddings.get(query))
+                return query, result.content, None
+            except Exception as e:
+                return query, None, f"Error processing query: {str(e)}"
+
+        # Tasks copy the active trace, so their spans land on it
+        with trace.activate():
+            tasks = [asyncio.ensure_future(generate(query)) for query in docs]
+
+        started = time.perf_counter()
+        try:
+            for task in asyncio.as_completed(tasks):
+                query, answer, error = await task
+                for result in results(query, answer, error):
+                    yield result
+        finally:
+            for task in tasks:
+                task.cancel()
+            trace.add("generation", time.perf_counter() - started)
+
+
+class CorpusPool:
+    """
+    The pipelines of every corpus in the registry (data/corpora.json),
+    created on first use.
+
+    All pipelines share one set of clients (HTTP pools, embedding and chat
+    models, concurrency limit) and one `metrics`, so serving another corpus
+    adds no connections and no per-request latency. Only the `max_loaded`
+    most recently used corpora keep their pipeline, with its indexes,
+    embedding matrix and answer cache, in memory; the least recently used
+    one is dropped beyond that and reloaded from disk when asked for again.
+
+    `options` are passed to every `ConstitutionRAG` (e.g. `vector_store`).
+    `shared` replaces the pool's own `SharedClients`.
+    """
+
+    def __init__(self, corpora=None, default=None, max_loaded=MAX_LOADED_CORPORA, shared=None, **options):
+        self.corpora = corpora if corpora is not None else load_corpora()
+        self.default = get_corpus(default, self.corpora).name
+        self.max_loaded = max(1, max_loaded)
+        self.options = options
+        self.shared = shared if shared is not None else SharedClients(self.corpora[self.default].persist_directory)
+        self.metrics = Metrics()
+        self.evictions = 0
+        self._pipelines = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, name=None):
+        """
+        Return the pipeline of corpus `name` (default: the pool's default
+        corpus), creating it if needed. Raises `corpora.UnknownCorpus`.
+        """
+        corpus = get_corpus(name or self.default, self.corpora)
+
+        with self._lock:
+            pipeline = self._pipelines.pop(corpus.name, None)
+            if pipeline is None:
+                pipeline = ConstitutionRAG(
+                    persist_directory=corpus.persist_directory,
+                    title=corpus.title,
+                    query_expansion_rules=corpus.query_expansion,
+                    shared=self.shared,
+                    metrics=self.metrics,
+                    **self.options,
+                )
+            self._pipelines[corpus.name] = pipeline
+
+            # Requests still using an evicted pipeline finish with it
+            while len(self._pipelines) > self.max_loaded:
+                self._pipelines.popitem(last=False)
+                self.evictions += 1
+
+        return pipeline
+
+    def warm_up(self, embeddings=True):
+        """Warm up the default corpus's pipeline (and with it the shared clients)."""
+        self.get().warm_up(embeddings=embeddings)
+
+    def info(self):
+        """Every corpus, whether it is loaded, and the default."""
+        with self._lock:
+            loaded = list(self._pipelines)
+
+        return {
+            "default": self.default,
+            "max_loaded": self.max_loaded,
+            "evictions": self.evictions,
+            "corpora": [
+                dict(corpus.info(), loaded=name in loaded) for name, corpus in self.corpora.items()
+            ],
+        }
+
+    async def aclose(self):
+        """Close the shared HTTP clients."""
+        await self.shared.aclose()
+
+
+_default_pool = None
+
+
+def get_corpus_pool():
+    """Return the process-wide corpus pool used by the CLI and scripts."""
+    global _default_pool
+
+    if _default_pool is None:
+        _default_pool = CorpusPool()
+
+    return _default_pool
+
+
+def get_pipeline(corpus=None):
+    """Return the process-wide pipeline of `corpus` (default: RAG_DEFAULT_CORPUS)."""
+    return get_corpus_pool().get(corpus)
+
+
+def retrieve_and_answer(query, verbose=True, use_cache=True, raw=False, trace=None, corpus=None):
+    """Answer a query with the default pipeline (see `ConstitutionRAG.retrieve_and_answer`)."""
+    return get_pipeline(corpus).retrieve_and_answer(
+        query, verbose=verbose, use_cache=use_cache, raw=raw, trace=trace
+    )
+
+
+def read_questions(path):
+    """
+    Read a batch of questions from a file ("-" for stdin): one per line, or
+    JSONL objects with a "question" field. Blank lines are skipped.
+    """
+    import json
+
+    f = sys.stdin if path == "-" else open(path, encoding="utf-8")
+    try:
+        questions = []
+        for line in f:
+            line = line.strip()
+            if line:
+                questions.append(json.loads(line)["question"] if line.startswith("{") else line)
+        return questions
+    finally:
+        if f is not sys.stdin:
+            f.close()
+
+
+async def print_batch(questions, raw=False, corpus=None):
+    """Answer a batch with the default pipeline, printing one JSON line per question as it completes."""
+    import json
+
+    pipeline = get_pipeline(corpus)
+    trace = Trace()
+    try:
+        async for result in pipeline.abatch_answer(questions, raw=raw, trace=trace):
+            print(json.dumps(result, ensure_ascii=False), flush=True)
+    finally:
+        await get_corpus_pool().aclose()
+
+    print(trace.summary(), file=sys.stderr)
 
 
 if __name__ == "__main__":
-    # Get query from command line or use default
-    if len(sys.argv) > 1:
-        query = " ".join(sys.argv[1:])
+    # Get query from command line or use default; --raw prints the retrieved
+    # constitutional text without calling the LLM; --batch FILE answers every
+    # question in FILE ("-" for stdin) and prints JSONL; --corpus NAME asks
+    # another corpus from data/corpora.json
+    args = sys.argv[1:]
+    raw = "--raw" in args
+    args = [arg for arg in args if arg != "--raw"]
+
+    corpus = None
+    if "--corpus" in args:
+        position = args.index("--corpus")
+        corpus = args[position + 1] if position + 1 < len(args) else None
+        del args[position : position + 2]
+
+    if "--batch" in args:
+        position = args.index("--batch")
+        path = args[position + 1] if position + 1 < len(args) else "-"
+        asyncio.run(print_batch(read_questions(path), raw=raw, corpus=corpus))
+        sys.exit(0)
+
+    if args:
+        query = " ".join(args)
     else:
         query = "How is the Prime Minister elected in Nepal?"
 
-    retrieve_and_answer(query)
+    retrieve_and_answer(query, raw=raw, corpus=corpus)
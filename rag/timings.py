@@ -0,0 +1,171 @@
+import re
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+# Trace of the request being processed; set by `Trace.activate` and copied
+# into asyncio tasks and `asyncio.to_thread` workers
+_current_trace = ContextVar("rag_trace", default=None)
+
+# Histogram buckets in seconds, from BM25 lookups to slow LLM answers
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+class Trace:
+    """
+    Per-request timing spans and counters.
+
+    Spans with the same name accumulate (e.g. every vector search of a
+    request adds to "vector_search"). Counters record token counts, API
+    calls and other per-request quantities. Safe to update from worker
+    threads.
+    """
+
+    def __init__(self):
+        self.spans = {}
+        self.counts = Counter()
+        self._lock = threading.Lock()
+
+    def add(self, name, seconds):
+        """Add `seconds` to the span `name`."""
+        with self._lock:
+            self.spans[name] = self.spans.get(name, 0.0) + seconds
+
+    def count(self, name, value=1):
+        """Add `value` to the counter `name`."""
+        with self._lock:
+            self.counts[name] += value
+
+    @contextmanager
+    def span(self, name):
+        """Time the enclosed block as the span `name`."""
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add(name, time.perf_counter() - started)
+
+    @contextmanager
+    def activate(self):
+        """Make this the current trace, picked up by `span` and `count`."""
+        token = _current_trace.set(self)
+        try:
+            yield self
+        finally:
+            _current_trace.reset(token)
+
+    def snapshot(self):
+        """Return copies of the spans (seconds) and the counters."""
+        with self._lock:
+            return dict(self.spans), dict(self.counts)
+
+    def as_dict(self):
+        """Return the spans in milliseconds and the counters, for API responses."""
+        spans, counts = self.snapshot()
+        return {
+            "stages_ms": {name: round(seconds * 1000, 2) for name, seconds in spans.items()},
+            "counts": counts,
+        }
+
+    def summary(self):
+        """One-line human readable summary, for verbose output."""
+        spans, counts = self.snapshot()
+        stages = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in spans.items())
+        counts = ", ".join(f"{name} {value}" for name, value in counts.items())
+        return f"Timings: {stages}" + (f" | {counts}" if counts else "")
+
+
+@contextmanager
+def span(name):
+    """Time the enclosed block on the active trace, if any."""
+    trace = _current_trace.get()
+    if trace is None:
+        yield
+        return
+
+    with trace.span(name):
+        yield
+
+
+def count(name, value=1):
+    """Add to a counter of the active trace, if any."""
+    trace = _current_trace.get()
+    if trace is not None:
+        trace.count(name, value)
+
+
+def _metric_name(name):
+    return re.sub(r"[^a-zA-Z0-9_]", "_", name)
+
+
+class _Histogram:
+    def __init__(self, buckets):
+        self.buckets = buckets
+        self.bucket_counts = [0] * len(buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.bucket_counts[i] += 1
+        self.count += 1
+        self.sum += value
+
+
+class Metrics:
+    """
+    Process-wide aggregation of request traces, rendered in the Prometheus
+    text exposition format:
+    - `rag_stage_duration_seconds{stage=...}` histogram of every span
+    - `rag_<counter>_total` counter for every trace counter
+    - `rag_requests_total{endpoint=...,status=...}` request counter
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._stages = {}
+        self._counters = Counter()
+        self._requests = Counter()
+        self._lock = threading.Lock()
+
+    def observe(self, trace, endpoint="chat", status="ok"):
+        """Record a finished request."""
+        spans, counts = trace.snapshot()
+
+        with self._lock:
+            for name, seconds in spans.items():
+                histogram = self._stages.get(name)
+                if histogram is None:
+                    histogram = self._stages[name] = _Histogram(self.buckets)
+                histogram.observe(seconds)
+            self._counters.update(counts)
+            self._requests[(endpoint, status)] += 1
+
+    def render(self):
+        """Return every metric in the Prometheus text format."""
+        lines = []
+
+        with self._lock:
+            lines.append("# HELP rag_requests_total Requests handled by the RAG pipeline")
+            lines.append("# TYPE rag_requests_total counter")
+            for (endpoint, status), value in sorted(self._requests.items()):
+                lines.append(f'rag_requests_total{{endpoint="{endpoint}",status="{status}"}} {value}')
+
+            lines.append("# HELP rag_stage_duration_seconds Time spent in each pipeline stage")
+            lines.append("# TYPE rag_stage_duration_seconds histogram")
+            for stage, histogram in sorted(self._stages.items()):
+                for bound, value in zip(histogram.buckets, histogram.bucket_counts):
+                    lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="{bound}"}} {value}')
+                lines.append(f'rag_stage_duration_seconds_bucket{{stage="{stage}",le="+Inf"}} {histogram.count}')
+                lines.append(f'rag_stage_duration_seconds_sum{{stage="{stage}"}} {histogram.sum}')
+                lines.append(f'rag_stage_duration_seconds_count{{stage="{stage}"}} {histogram.count}')
+
+            for name, value in sorted(self._counters.items()):
+                metric = f"rag_{_metric_name(name)}_total"
+                lines.append(f"# TYPE {metric} counter")
+                lines.append(f"{metric} {value}")
+
+        return "\n".join(lines) + "\n"
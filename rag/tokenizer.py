@@ -0,0 +1,19 @@
+import re
+
+# Words, or runs of one repeated symbol ("====" is a few tokens, not one per "=")
+_TOKEN_PATTERN = re.compile(r"\w+|([^\w\s])\1*")
+
+
+def count_tokens(text):
+    """
+    Estimate the number of model tokens in `text` without any network access.
+
+    Words and runs of a repeated symbol are counted as one token per four
+    characters (at least one); every other punctuation mark or symbol is one
+    token. This slightly overestimates OpenAI's BPE counts for English legal
+    text, which keeps budgets safe.
+    """
+    return sum(
+        max(1, (match.end() - match.start() + 3) // 4)
+        for match in _TOKEN_PATTERN.finditer(text)
+    )